@@ -1,29 +1,67 @@
 from flask import Flask
+from logging_config import setup_logging, parse_sample_rates
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker
 from .config import Config
-from .models import Base
 from .routes import bp
-from .db import create_tables
+from .bootstrap import (bootstrap_command, refresh_labeling_queue_command, rebuild_balances_command,
+                        archive_transactions_command, restore_transactions_command)
+from .model_files import convert_model_command
+from .metrics import instrument_engine
+from .json_provider import OrjsonProvider
 
-def create_app():
+def _create_engine(app, uri):
+    engine = create_engine(
+        uri,
+        pool_size=app.config['SQLALCHEMY_POOL_SIZE'],
+        max_overflow=app.config['SQLALCHEMY_MAX_OVERFLOW'],
+        pool_pre_ping=True
+    )
+    # Count SQL statements and DB time per request for /metrics
+    instrument_engine(engine)
+    return engine
+
+def create_app(test_config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
-    app.config['DEBUG'] = True  # Enable debug mode
-
-    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
-    Session = scoped_session(sessionmaker(bind=engine))
-
-    with app.app_context():
-        # Register the blueprint
-        app.register_blueprint(bp)
-
-        # Create database tables if they do not exist
-        Base.metadata.create_all(engine)
-        
-        # Call create_tables to initialize categories and labels
-        create_tables()        
-        
-    # Store the session factory on the app
-    app.session_factory = Session
+    if test_config:
+        # Used by the benchmarks to point the app at a throwaway database
+        app.config.update(test_config)
+
+    # Configure log handlers once per process (queue + background writer thread)
+    setup_logging(
+        level=app.config['LOG_LEVEL'],
+        fmt=app.config['LOG_FORMAT'],
+        sample_rates=parse_sample_rates(app.config['LOG_SAMPLE_RATES'])
+    )
+
+    # Serialize responses with orjson (see json_provider.py)
+    if app.config['JSON_PROVIDER'] == 'orjson' and OrjsonProvider.available():
+        app.json = OrjsonProvider(app)
+
+    # One engine (and connection pool) per database per process. Under gunicorn
+    # the pools are re-created in each worker by the post_fork hook in gunicorn.conf.py.
+    engine = _create_engine(app, app.config['SQLALCHEMY_DATABASE_URI'])
+    replica_uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    replica_engine = _create_engine(app, replica_uri) if replica_uri else engine
+
+    # Store the engines and session factories on the app. Without a replica
+    # both names point at the primary.
+    app.engine = engine
+    app.replica_engine = replica_engine
+    app.session_factory = sessionmaker(bind=engine)
+    app.replica_session_factory = sessionmaker(bind=replica_engine) if replica_uri else app.session_factory
+
+    # Register the blueprint
+    app.register_blueprint(bp)
+
+    # Schema and seed data are set up by `flask --app app bootstrap` (see
+    # bootstrap.py), so starting a process doesn't touch the database
+    app.cli.add_command(bootstrap_command)
+    app.cli.add_command(refresh_labeling_queue_command)
+    app.cli.add_command(convert_model_command)
+    app.cli.add_command(rebuild_balances_command)
+    app.cli.add_command(archive_transactions_command)
+    app.cli.add_command(restore_transactions_command)
+
     return app
@@ -0,0 +1,16 @@
+from decimal import Decimal
+
+# Amounts are stored as signed integer cents (BIGINT): 'Af' (debit) rows are
+# negative, 'Bij' (credit) rows positive. API responses keep the existing
+# contract of an unsigned amount plus af_bij, converted exactly via Decimal.
+
+
+def parse_amount_cents(amount, af_bij):
+    """Convert a bank amount like '12,34' plus 'Af'/'Bij' into signed cents."""
+    cents = int((Decimal(amount.strip().replace(',', '.')) * 100).to_integral_value())
+    return -cents if af_bij == 'Af' else cents
+
+
+def cents_to_decimal(cents):
+    """Exact cents -> euros conversion, done once at serialization time."""
+    return Decimal(int(cents)).scaleb(-2)
@@ -0,0 +1,224 @@
+import os
+import uuid
+import logging
+from collections import Counter
+from datetime import date
+from flask import current_app
+from sqlalchemy import insert, select, text
+from .models import Transaction, TransactionLabel, Label, ArchivedYear, ArchivedMonthTotal
+from .changes import publish
+from .partitions import existing_partitions, ensure_partitions, month_range, partition_name
+
+logger = logging.getLogger(__name__)
+
+# Closed years of transactions, moved out of the hot table into Parquet:
+#
+#   <ARCHIVE_DIR>/transactions/year=2021/transactions-<id>.parquet
+#
+# One compressed file per year (ARCHIVE_COMPRESSION, default zstd), sorted by
+# datum so row-group statistics skip what a date filter doesn't need, with the
+# raw columns: signed amount_cents and the label_id the transaction had when
+# it was archived. ARCHIVE_DIR must be readable by every backend process and
+# outlive it: a shared persistent volume in Kubernetes (k8s/backend-archive-pvc.yaml).
+#
+# Archiving a year drops its monthly partitions in the same database
+# transaction that records it, and keeps in the database:
+#
+#   archived_years         which years are archived, and their file (the manifest)
+#   archived_month_totals  count and signed sum per month, label, account and direction
+#   archived_label_counts  labeled transactions per company and label
+#
+# Month-grain reads use the totals: the columnar store loads them as one row
+# per group (so every analytics endpoint includes archived years at month
+# granularity), balance checkpoints are rebuilt from them and the label
+# suggestion index counts them. Row-level reads (fetch_transactions for a
+# bounded range, export, balances within a month, import de-duplication) read
+# the files of the archived years their date range covers; a file is only
+# read once the manifest lists it. Archived years are closed: labels can't be changed and
+# importing a new transaction dated in one fails until the year is restored.
+
+ROW_COLUMNS = ['id', 'datum', 'company', 'rekening', 'tegenrekening', 'code', 'af_bij', 'amount_cents',
+               'mutatiesoort', 'mededelingen', 'label_id']
+
+
+def _schema():
+    import pyarrow as pa  # only needed when archived years are read or written
+    return pa.schema([
+        ('id', pa.int64()),
+        ('datum', pa.date32()),
+        ('company', pa.string()),
+        ('rekening', pa.string()),
+        ('tegenrekening', pa.string()),
+        ('code', pa.string()),
+        ('af_bij', pa.string()),
+        ('amount_cents', pa.int64()),
+        ('mutatiesoort', pa.string()),
+        ('mededelingen', pa.string()),
+        ('label_id', pa.int32()),
+    ])
+
+
+def _full_path(path):
+    return os.path.join(current_app.config['ARCHIVE_DIR'], path)
+
+
+def _covers(year, start=None, end=None):
+    return (start is None or year >= start.year) and (end is None or date(year, 1, 1) < end)
+
+
+def archived_years(session, start=None, end=None):
+    """{year: Parquet file} for the archived years overlapping [start, end)."""
+    return {row.year: _full_path(row.path) for row in session.query(ArchivedYear.year, ArchivedYear.path)
+            if _covers(row.year, start, end)}
+
+
+def read_rows(session, start=None, end=None, columns=None):
+    """Archived transactions with start <= datum < end, oldest first, as a pyarrow Table.
+
+    None when the range covers no archived year, so callers can skip the
+    merge (and pyarrow) for ranges that are entirely live.
+    """
+    paths = [path for _, path in sorted(archived_years(session, start, end).items())]
+    return read_files(paths, start, end, columns) if paths else None
+
+
+def read_files(paths, start=None, end=None, columns=None):
+    """As read_rows(), from the given files (no app context needed, e.g. while streaming)."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    condition = None
+    if start is not None:
+        condition = ds.field('datum') >= pa.scalar(start, pa.date32())
+    if end is not None:
+        below = ds.field('datum') < pa.scalar(end, pa.date32())
+        condition = below if condition is None else (condition & below)
+    table = ds.dataset(paths, schema=_schema(), format='parquet').to_table(columns=columns, filter=condition)
+    order = [(column, 'ascending') for column in ('datum', 'id') if column in table.column_names]
+    return table.sort_by(order) if order else table
+
+
+def _lock(session):
+    # Keeps imports and label updates out until the move is committed
+    session.execute(text("LOCK TABLE transactions, transaction_labels IN SHARE MODE"))
+
+
+def archive_year(session, year):
+    """Move the transactions of `year` to a Parquet file. Returns (transactions, file).
+
+    The file is written last and read back before returning; the caller
+    commits, and removes the file if the commit fails.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    _lock(session)
+    if session.get(ArchivedYear, year) is not None:
+        raise ValueError(f'{year} is already archived')
+    params = {'start': date(year, 1, 1), 'end': date(year + 1, 1, 1)}
+    rows = session.execute(
+        select(*(getattr(Transaction, column) for column in ROW_COLUMNS[:-1]), TransactionLabel.label_id)
+        .outerjoin(TransactionLabel, Transaction.id == TransactionLabel.transaction_id)
+        .where(Transaction.datum >= params['start'], Transaction.datum < params['end'])
+        .order_by(Transaction.datum, Transaction.id)
+    ).all()
+    if not rows:
+        return 0, None
+
+    session.execute(text(
+        "INSERT INTO archived_month_totals (month, label_id, rekening, is_credit, transactions, amount_cents) "
+        "SELECT date_trunc('month', t.datum)::date, tl.label_id, t.rekening, t.amount_cents > 0, "
+        "count(*), sum(t.amount_cents) "
+        "FROM transactions t LEFT JOIN transaction_labels tl ON tl.transaction_id = t.id "
+        "WHERE t.datum >= :start AND t.datum < :end GROUP BY 1, 2, 3, 4"
+    ), params)
+    session.execute(text(
+        "INSERT INTO archived_label_counts (company, label_id, transactions) "
+        "SELECT t.company, tl.label_id, count(*) "
+        "FROM transactions t JOIN transaction_labels tl ON tl.transaction_id = t.id "
+        "WHERE t.datum >= :start AND t.datum < :end AND t.company IS NOT NULL GROUP BY 1, 2 "
+        "ON CONFLICT (company, label_id) DO UPDATE "
+        "SET transactions = archived_label_counts.transactions + EXCLUDED.transactions"
+    ), params)
+    session.execute(text(
+        "DELETE FROM transaction_labels WHERE transaction_id IN "
+        "(SELECT id FROM transactions WHERE datum >= :start AND datum < :end)"
+    ), params)
+
+    path = f'transactions/year={year}/transactions-{uuid.uuid4().hex[:12]}.parquet'
+    session.add(ArchivedYear(year=year, path=path, transactions=len(rows)))
+    session.flush()
+    publish(session, 'transactions', 'transaction_labels')
+
+    # Dropping a partition is instant, but locks `transactions` exclusively
+    # until commit: done last. Rows in the default partition are deleted.
+    conn = session.connection()
+    known = existing_partitions(conn)
+    for month_start in month_range(params['start'], date(year, 12, 31)):
+        if partition_name(month_start) in known:
+            conn.execute(text(f"DROP TABLE {partition_name(month_start)}"))
+    conn.execute(text("DELETE FROM transactions WHERE datum >= :start AND datum < :end"), params)
+
+    full_path = _full_path(path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    try:
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays([pa.array(values, field.type) for values, field in zip(columns, _schema())],
+                                     schema=_schema())
+        pq.write_table(table, full_path, compression=current_app.config['ARCHIVE_COMPRESSION'])
+        _verify(full_path, table)
+    except Exception:
+        if os.path.exists(full_path):
+            os.remove(full_path)
+        raise
+    return len(rows), full_path
+
+
+def _verify(full_path, table):
+    # The commit deletes the rows, so the file must be complete and on disk first
+    import pyarrow.parquet as pq
+
+    with open(full_path, 'rb') as file:
+        os.fsync(file.fileno())
+    written = pq.read_table(full_path, schema=_schema())
+    if written.num_rows != table.num_rows or not written.equals(table):
+        raise OSError(f'{full_path} does not match the archived transactions '
+                      f'({written.num_rows} rows read back, {table.num_rows} written)')
+
+
+def restore_year(session, year):
+    """Move an archived year back into `transactions`. Returns (transactions, file).
+
+    The caller commits, then removes the file.
+    """
+    import pyarrow.parquet as pq
+
+    _lock(session)
+    archived = session.get(ArchivedYear, year)
+    if archived is None:
+        raise ValueError(f'{year} is not archived')
+    full_path = _full_path(archived.path)
+    rows = pq.read_table(full_path, schema=_schema()).to_pylist()
+
+    ensure_partitions(session.connection(), {row['datum'] for row in rows})
+    session.execute(insert(Transaction), [{column: row[column] for column in ROW_COLUMNS[:-1]} for row in rows])
+    label_ids = set(session.scalars(select(Label.id)))
+    labeled = [row for row in rows if row['label_id'] in label_ids]
+    if labeled:
+        session.execute(insert(TransactionLabel),
+                        [{'transaction_id': row['id'], 'label_id': row['label_id']} for row in labeled])
+
+    counts = Counter((row['company'], row['label_id']) for row in rows
+                     if row['company'] is not None and row['label_id'] is not None)
+    if counts:
+        session.execute(text(
+            "UPDATE archived_label_counts SET transactions = transactions - :n "
+            "WHERE company = :company AND label_id = :label_id"
+        ), [{'company': company, 'label_id': label_id, 'n': n} for (company, label_id), n in counts.items()])
+        session.execute(text("DELETE FROM archived_label_counts WHERE transactions <= 0"))
+    session.query(ArchivedMonthTotal).filter(
+        ArchivedMonthTotal.month >= date(year, 1, 1), ArchivedMonthTotal.month < date(year + 1, 1, 1)
+    ).delete(synchronize_session=False)
+    session.delete(archived)
+    publish(session, 'transactions', 'transaction_labels')
+    return len(rows), full_path
@@ -0,0 +1,158 @@
+import os
+import asyncio
+import logging
+import threading
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from .models import Label, LabelCategory
+from .routing import reads_from_primary
+from .amounts import cents_to_decimal
+from .columnar import get_store, day_range_mask, combine_masks, month_sums, label_month_sums, month_key
+from .db import _dashboard_views, _build_overview, _cache_source
+
+logger = logging.getLogger(__name__)
+
+# Asyncio variant of the read paths in db.py, used by the /api/async/* routes.
+#
+# Every process runs one event loop in a background thread, and that loop owns
+# an async engine (asyncpg driver) per database. Async views hand their work to
+# it with run(). The independent queries of one request run concurrently with
+# asyncio.gather, each on its own pooled connection. Queries of all requests
+# in flight are multiplexed over the one loop and pool rather than a pool per
+# request thread. CPU-bound steps (store loads, columnar kernels, building the
+# response) run in worker threads, so they don't hold up other queries.
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+_engines = {}
+
+
+def _event_loop():
+    """This process' database loop; started on first use, again after a fork."""
+    global _loop, _loop_pid
+    if _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='async-db', daemon=True).start()
+                _engines.clear()  # inherited engines belong to the parent's loop
+                _loop = loop
+                _loop_pid = os.getpid()
+    return _loop
+
+
+async def run(coro):
+    """Await `coro` on the database loop, from any other event loop."""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _event_loop()))
+
+
+def _engine(uri, pool_size, max_overflow):
+    # Only called on the database loop, so no locking
+    engine = _engines.get(uri)
+    if engine is None:
+        engine = create_async_engine(
+            make_url(uri).set(drivername='postgresql+asyncpg'),
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True
+        )
+        _engines[uri] = engine
+    return engine
+
+
+class _ReadContext:
+    """What the loop needs from the request and app: which database, which store."""
+
+    def __init__(self):
+        config = current_app.config
+        # Same routing as db.get_session(read_only=True), see routing.py
+        replica_uri = config.get('SQLALCHEMY_REPLICA_URI')
+        self.uri = replica_uri if replica_uri and not reads_from_primary() else config['SQLALCHEMY_DATABASE_URI']
+        self.pool_size = config['SQLALCHEMY_POOL_SIZE']
+        self.max_overflow = config['SQLALCHEMY_MAX_OVERFLOW']
+        self.store_session_factory, self.store_primary = _cache_source()
+        self.store_max_age = config['COLUMNAR_STORE_MAX_AGE']
+
+    async def rows(self, statement):
+        async with _engine(self.uri, self.pool_size, self.max_overflow).connect() as conn:
+            return (await conn.execute(statement)).all()
+
+    async def snapshot(self):
+        # A (re)load of the store is a blocking full scan: keep it off the loop
+        store = await asyncio.to_thread(get_store, self.store_session_factory, self.store_max_age,
+                                        self.store_primary)
+        return store.snapshot()
+
+
+def _label_rows(context):
+    return context.rows(select(Label.id, Label.name, Label.category_id))
+
+
+def _category_rows(context):
+    return context.rows(select(LabelCategory.id, LabelCategory.name, LabelCategory.parent_id))
+
+
+async def fetch_dashboard(start=None, end=None):
+    """db.fetch_dashboard() with the label and category queries and the store snapshot run concurrently.
+
+    Unlike the synchronous version the two queries don't share a REPEATABLE
+    READ transaction, as they run on separate connections.
+    """
+    context = _ReadContext()
+
+    async def dashboard():
+        labels, categories, snapshot = await asyncio.gather(
+            _label_rows(context), _category_rows(context), context.snapshot())
+        return await asyncio.to_thread(_dashboard_views, labels, categories, snapshot, start, end)
+
+    return await run(dashboard())
+
+
+async def fetch_transactions_overview(start=None, end=None):
+    context = _ReadContext()
+
+    async def overview():
+        labels, categories, snapshot = await asyncio.gather(
+            _label_rows(context), _category_rows(context), context.snapshot())
+
+        def build():
+            label_ids, months, totals = label_month_sums(snapshot, day_range_mask(snapshot, start, end))
+            return _build_overview(categories, labels, label_ids, months, totals)
+
+        return await asyncio.to_thread(build)
+
+    return await run(overview())
+
+
+def _expense_rows(categories, labels, snapshot, start, end):
+    uitgaven = next((category for category in categories if category.name == 'UITGAVEN'), None)
+    if uitgaven is None:
+        raise ValueError("Category 'UITGAVEN' not found")
+
+    range_mask = day_range_mask(snapshot, start, end)
+    results = []
+    for child in (category for category in categories if category.parent_id == uitgaven.id):
+        label_ids = [label.id for label in labels if label.category_id == child.id]
+        months, totals = month_sums(snapshot, combine_masks(np.isin(snapshot.label, label_ids), range_mask))
+        results.append({
+            'category': child.name,
+            'monthly_sums': [{'month': month_key(month), 'total_amount': cents_to_decimal(total)}
+                             for month, total in zip(months, totals)]
+        })
+    return results
+
+
+async def get_expenses_per_main_category(start=None, end=None):
+    """db.get_expenses_per_main_category() with two concurrent queries instead of one per child category."""
+    context = _ReadContext()
+
+    async def expenses():
+        labels, categories, snapshot = await asyncio.gather(
+            _label_rows(context), _category_rows(context), context.snapshot())
+        return await asyncio.to_thread(_expense_rows, categories, labels, snapshot, start, end)
+
+    return await run(expenses())
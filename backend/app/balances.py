@@ -0,0 +1,175 @@
+import logging
+from datetime import timedelta
+from sqlalchemy import func, text
+from .models import Transaction, BalanceCheckpoint, ArchivedMonthTotal
+from .archive import read_rows
+from .partitions import month_range
+
+logger = logging.getLogger(__name__)
+
+# Running balance per account (rekening) from monthly checkpoints.
+#
+# balance_checkpoints holds the balance of every account at the start of every
+# month, from the month after the first transaction up to the month of the
+# latest one. A balance on any day is the nearest checkpoint at or before it
+# plus the transactions since, so at most one month of rows is summed, and
+# only in the partitions of that month.
+#
+# Balances start at zero with the first imported transaction; the bank CSVs
+# carry no opening balance. Archived years (archive.py) count through their
+# monthly totals when checkpoints are built and through their Parquet files
+# when a balance falls inside one.
+#
+# Checkpoints are only valid while no transaction is inserted before them. An
+# import deletes the checkpoints after its earliest date, in its own database
+# transaction (invalidate_checkpoints), and rebuilds them once committed
+# (rebuild_checkpoints). Balances stay correct in between, with a longer
+# delta to sum. Both take BALANCE_LOCK_KEY, so a rebuild never overlaps an
+# import that has not committed yet.
+
+BALANCE_LOCK_KEY = 724004
+
+INTERVALS = ('day', 'month')
+
+
+def _next_month(month_start):
+    return (month_start + timedelta(days=32)).replace(day=1)
+
+
+def _lock(session):
+    session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': BALANCE_LOCK_KEY})
+
+
+def invalidate_checkpoints(session, since):
+    """Drop the checkpoints a transaction dated `since` changes; call in the inserting transaction."""
+    _lock(session)
+    return session.query(BalanceCheckpoint).filter(BalanceCheckpoint.as_of > since) \
+        .delete(synchronize_session=False)
+
+
+def rebuild_checkpoints(session):
+    """Add the missing checkpoints, continuing from the latest one. Returns the number of rows written."""
+    _lock(session)
+    first, last = session.query(func.min(Transaction.datum), func.max(Transaction.datum)).one()
+    first_archived, last_archived = session.query(func.min(ArchivedMonthTotal.month),
+                                                  func.max(ArchivedMonthTotal.month)).one()
+    first = min(filter(None, [first, first_archived]), default=None)
+    last = max(filter(None, [last, last_archived]), default=None)
+    if first is None:
+        return 0
+    # The latest month is still filling up; its own checkpoint comes with the next one
+    horizon = last.replace(day=1)
+    start = session.query(func.max(BalanceCheckpoint.as_of)).scalar() or first.replace(day=1)
+    if start >= horizon:
+        return 0
+
+    # Every account gets a checkpoint for every month, also months without
+    # transactions, so balances_at() finds all accounts at one as_of
+    return session.execute(text(
+        "WITH base AS ("
+        "  SELECT rekening, balance_cents FROM balance_checkpoints WHERE as_of = :start"
+        "), monthly AS ("
+        "  SELECT rekening, month, sum(delta) AS delta FROM ("
+        "    SELECT rekening, date_trunc('month', datum)::date AS month, sum(amount_cents) AS delta"
+        "    FROM transactions WHERE datum >= :start AND datum < :horizon GROUP BY 1, 2"
+        "    UNION ALL"
+        "    SELECT rekening, month, sum(amount_cents) FROM archived_month_totals"
+        "    WHERE month >= :start AND month < :horizon GROUP BY 1, 2"
+        "  ) changes WHERE rekening IS NOT NULL GROUP BY 1, 2"
+        "), accounts AS ("
+        "  SELECT rekening FROM base UNION SELECT rekening FROM monthly"
+        "), months AS ("
+        "  SELECT month::date AS month"
+        "  FROM generate_series(CAST(:start AS DATE), CAST(:horizon AS DATE) - 1, interval '1 month') AS month"
+        ") "
+        "INSERT INTO balance_checkpoints (as_of, rekening, balance_cents) "
+        "SELECT (months.month + interval '1 month')::date, accounts.rekening, "
+        "  coalesce(base.balance_cents, 0) "
+        "  + sum(coalesce(monthly.delta, 0)) OVER (PARTITION BY accounts.rekening ORDER BY months.month) "
+        "FROM accounts CROSS JOIN months "
+        "LEFT JOIN monthly ON monthly.rekening = accounts.rekening AND monthly.month = months.month "
+        "LEFT JOIN base ON base.rekening = accounts.rekening "
+        "ON CONFLICT (as_of, rekening) DO UPDATE SET balance_cents = EXCLUDED.balance_cents"
+    ), {'start': start, 'horizon': horizon}).rowcount
+
+
+def balances_at(session, before, rekening=None):
+    """{rekening: balance in cents} over all transactions dated before `before`."""
+    checkpoint = session.query(func.max(BalanceCheckpoint.as_of)).filter(BalanceCheckpoint.as_of <= before).scalar()
+    balances = {}
+    if checkpoint is not None:
+        query = session.query(BalanceCheckpoint.rekening, BalanceCheckpoint.balance_cents) \
+            .filter(BalanceCheckpoint.as_of == checkpoint)
+        if rekening is not None:
+            query = query.filter(BalanceCheckpoint.rekening == rekening)
+        balances = dict(query.all())
+
+    deltas = session.query(Transaction.rekening, func.sum(Transaction.amount_cents)) \
+        .filter(Transaction.datum < before, Transaction.rekening.isnot(None))
+    if checkpoint is not None:
+        deltas = deltas.filter(Transaction.datum >= checkpoint)
+    if rekening is not None:
+        deltas = deltas.filter(Transaction.rekening == rekening)
+    for account, delta in deltas.group_by(Transaction.rekening):
+        balances[account] = balances.get(account, 0) + int(delta)
+    for account, delta in _archived_sums(session, checkpoint, before, ['rekening'], rekening):
+        balances[account] = balances.get(account, 0) + delta
+    return balances
+
+
+def _archived_sums(session, start, end, keys, rekening=None):
+    """[(*keys, cents)] summed over the archived transactions in [start, end); `keys` include 'rekening'."""
+    table = read_rows(session, start, end, [*keys, 'amount_cents'])
+    if table is None or not table.num_rows:
+        return []
+    sums = table.group_by(keys).aggregate([('amount_cents', 'sum')]).to_pylist()
+    return [(*(row[key] for key in keys), row['amount_cents_sum']) for row in sums
+            if row['rekening'] is not None and (rekening is None or row['rekening'] == rekening)]
+
+
+def balance_series(session, start, end, rekening=None, interval='month'):
+    """Balances at the end of every day or month in [start, end).
+
+    Returns (dates, {rekening: [cents per date]}), where every date is the last
+    day the balance includes. Month points come straight from the checkpoints
+    when they exist; day points add the daily sums to the balance before `start`.
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(INTERVALS)}")
+    if start >= end:
+        return [], {}
+
+    if interval == 'month':
+        bounds = [min(_next_month(month_start), end) for month_start in month_range(start, end - timedelta(days=1))]
+        query = session.query(BalanceCheckpoint.as_of, BalanceCheckpoint.rekening, BalanceCheckpoint.balance_cents) \
+            .filter(BalanceCheckpoint.as_of.in_(bounds))
+        if rekening is not None:
+            query = query.filter(BalanceCheckpoint.rekening == rekening)
+        checkpoints = {}
+        for as_of, account, balance in query:
+            checkpoints.setdefault(as_of, {})[account] = balance
+        points = [checkpoints.get(bound) or balances_at(session, bound, rekening) for bound in bounds]
+    else:
+        balances = balances_at(session, start, rekening)
+        daily = session.query(Transaction.datum, Transaction.rekening, func.sum(Transaction.amount_cents)) \
+            .filter(Transaction.datum >= start, Transaction.datum < end, Transaction.rekening.isnot(None))
+        if rekening is not None:
+            daily = daily.filter(Transaction.rekening == rekening)
+        changes = {}
+        for day, account, delta in daily.group_by(Transaction.datum, Transaction.rekening):
+            changes.setdefault(day, []).append((account, int(delta)))
+        for day, account, delta in _archived_sums(session, start, end, ['datum', 'rekening'], rekening):
+            changes.setdefault(day, []).append((account, delta))
+
+        bounds, points = [], []
+        day = start
+        while day < end:
+            for account, delta in changes.get(day, ()):
+                balances[account] = balances.get(account, 0) + delta
+            day += timedelta(days=1)
+            bounds.append(day)
+            points.append(dict(balances))
+
+    accounts = sorted({account for point in points for account in point})
+    series = {account: [point.get(account, 0) for point in points] for account in accounts}
+    return [bound - timedelta(days=1) for bound in bounds], series
@@ -0,0 +1,95 @@
+import click
+import logging
+from datetime import date, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from .models import Base
+from .migrations import run_migrations
+from .partitions import create_partitions, month_range
+from .db import (create_tables, refresh_labeling_queue, rebuild_balance_checkpoints, archive_transactions,
+                 restore_archived_year)
+
+logger = logging.getLogger(__name__)
+
+# Schema creation, migrations and the default categories/labels. Runs once per
+# deploy (the bootstrap initContainer in k8s/backend-deployment.yaml), not in
+# every process that starts:
+#
+#     flask --app app bootstrap
+
+# Months ahead for which bootstrap creates the transactions partitions
+FUTURE_PARTITION_MONTHS = 3
+
+
+def bootstrap_database():
+    engine = current_app.engine
+
+    # Create database tables if they do not exist
+    Base.metadata.create_all(engine)
+
+    # Bring existing databases up to the current schema
+    run_migrations(engine)
+
+    # Partitions for this month and the coming ones, so imports rarely create any
+    today = date.today()
+    create_partitions(engine, month_range(today, today + timedelta(days=31 * FUTURE_PARTITION_MONTHS)))
+
+    # Call create_tables to initialize categories and labels
+    create_tables()
+
+    # Rank the unlabeled merchants for /api/labeling-queue
+    try:
+        refresh_labeling_queue()
+    except Exception as e:
+        # E.g. no label model yet; the schema is ready, the queue can be filled later
+        logger.warning("Labeling queue not refreshed: %s", e)
+
+    # Monthly balance checkpoints for /api/balances
+    rebuild_balance_checkpoints()
+
+
+@click.command('bootstrap')
+@with_appcontext
+def bootstrap_command():
+    """Create and migrate the database schema and seed the default labels."""
+    bootstrap_database()
+    click.echo('Database ready')
+
+
+@click.command('refresh-labeling-queue')
+@with_appcontext
+def refresh_labeling_queue_command():
+    """Recompute the labeling queue, e.g. after retraining the label model."""
+    refresh_labeling_queue()
+    click.echo('Labeling queue refreshed')
+
+
+@click.command('rebuild-balances')
+@click.option('--full', is_flag=True, help='Drop all checkpoints first instead of continuing from the latest.')
+@with_appcontext
+def rebuild_balances_command(full):
+    """Add the missing monthly balance checkpoints."""
+    written = rebuild_balance_checkpoints(full=full)
+    click.echo(f'Balance checkpoints rebuilt: {written} written')
+
+
+@click.command('archive-transactions')
+@click.option('--before', 'before_year', type=int, default=None,
+              help='Archive every year before this one (default: last year).')
+@with_appcontext
+def archive_transactions_command(before_year):
+    """Move closed years of transactions to Parquet files in ARCHIVE_DIR."""
+    archived = archive_transactions(before_year or date.today().year - 1)
+    for year, count in archived.items():
+        click.echo(f'{year}: {count} transactions archived')
+    if not archived:
+        click.echo('Nothing to archive')
+
+
+@click.command('restore-transactions')
+@click.argument('year', type=int)
+@with_appcontext
+def restore_transactions_command(year):
+    """Move an archived year back into the transactions table."""
+    count = restore_archived_year(year)
+    click.echo(f'{year}: {count} transactions restored')
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import select
+import logging
+import threading
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Cross-process change notifications for in-process caches (the columnar store).
+#
+# Write paths call publish() inside their transaction. Once it commits, a
+# per-table counter in `cache_versions` is bumped and NOTIFY sent, in a short
+# transaction of their own: the counter rows are shared by every writer, and
+# holding their row locks until a long import commits would queue every label
+# update behind it. A reader that loads in between sees the new rows with the
+# old version and reloads once more; a process that dies in between leaves
+# other caches to their max age. Every process runs one listener thread that
+# keeps `_known`, the newest version of each table it has heard of, up to date:
+#
+#   notify  LISTEN for immediate updates, and also poll cache_versions every
+#           CACHE_POLL_SECONDS in case a notification was missed
+#   poll    only poll (e.g. behind a connection pooler that breaks LISTEN)
+#   off     no listener; caches fall back to their max age
+#
+# Caches remember the versions they were built from and count as stale once a
+# newer one is known, so every replica serves fresh data at most
+# CACHE_POLL_SECONDS after a write.
+#
+# Caches load from the read replica, which can lag behind the versions heard
+# from the primary. A load that is still behind is kept, and the next one
+# waits lag_delay() (doubling per load that is still behind) instead of
+# reloading the whole table on every request until the replica catches up.
+
+CHANNEL = 'pf_changes'
+TABLES = ('transactions', 'transaction_labels', 'labels', 'label_categories')
+
+# Session.info key of the tables a transaction published
+_PENDING = 'published_tables'
+
+_known = {}
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def behind(versions, tables):
+    """Whether a newer version of any of `tables` than `versions` is known."""
+    return any(_known.get(table, 0) > versions.get(table, 0) for table in tables)
+
+
+def lag_delay(attempts):
+    """Seconds to wait before loading again after `attempts` loads that were behind."""
+    return min(0.5 * 2 ** attempts, 30)
+
+
+def _advance(versions):
+    for table, version in versions.items():
+        if version > _known.get(table, 0):
+            _known[table] = version
+
+
+def read_versions(session, tables=TABLES):
+    rows = session.execute(text(
+        "SELECT table_name, version FROM cache_versions WHERE table_name = ANY(:tables)"
+    ), {'tables': list(tables)})
+    return {row.table_name: row.version for row in rows}
+
+
+def publish(session, *tables):
+    """Bump the versions of `tables` and notify other processes once `session` commits.
+
+    Returns a dict that holds the new versions after the commit, so the caller
+    can then mark caches it updated in place as current (see
+    TransactionStore.note_own_write). Nothing is published on rollback.
+    """
+    pending_tables, versions = session.info.setdefault(_PENDING, (set(), {}))
+    pending_tables.update(tables)
+    return versions
+
+
+def _bump(conn, tables):
+    rows = conn.execute(text(
+        "UPDATE cache_versions SET version = version + 1, updated_at = now() "
+        "WHERE table_name = ANY(:tables) RETURNING table_name, version"
+    ), {'tables': sorted(tables)})
+    versions = {row.table_name: row.version for row in rows}
+    conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                 {'channel': CHANNEL, 'payload': json.dumps(versions)})
+    return versions
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    pending = session.info.pop(_PENDING, None)
+    if pending is None:
+        return
+    tables, versions = pending
+    try:
+        with session.get_bind().begin() as conn:
+            versions.update(_bump(conn, tables))
+    except Exception as e:
+        # The write itself is committed; other processes' caches catch up within their max age
+        logger.warning("Cache versions of %s not published: %s", ', '.join(sorted(tables)), e)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(_PENDING, None)
+
+
+def start_listener():
+    """Start this process' listener thread if it isn't running yet.
+
+    Called on every request: a thread started before gunicorn forks doesn't
+    exist in the workers, so each worker starts its own on its first request.
+    """
+    global _listener_pid
+    mode = current_app.config['CACHE_INVALIDATION']
+    if mode == 'off' or _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        threading.Thread(
+            target=_listen,
+            args=(current_app.engine, mode == 'notify', current_app.config['CACHE_POLL_SECONDS']),
+            name='cache-invalidation',
+            daemon=True
+        ).start()
+
+
+def _connect(engine):
+    # Dedicated connection outside the pool, held for the life of the process.
+    # Always the primary: NOTIFY is not sent to replicas.
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    conn = engine.dialect.connect(*cargs, **cparams)
+    conn.autocommit = True
+    return conn
+
+
+def _listen(engine, use_notify, interval):
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = _connect(engine)
+            cursor = conn.cursor()
+            if use_notify:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            backoff = 1
+            while True:
+                cursor.execute("SELECT table_name, version FROM cache_versions")
+                _advance(dict(cursor.fetchall()))
+                if not use_notify:
+                    time.sleep(interval)
+                    continue
+                deadline = time.monotonic() + interval
+                while (remaining := deadline - time.monotonic()) > 0:
+                    if select.select([conn], [], [], remaining)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            _advance(json.loads(conn.notifies.pop(0).payload))
+        except Exception as e:
+            logger.warning("Cache invalidation listener failed (%s); retrying in %d s", e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
@@ -0,0 +1,347 @@
+import time
+import logging
+import threading
+import numpy as np
+from sqlalchemy import select
+from .models import Transaction, TransactionLabel, ArchivedMonthTotal
+from .changes import read_versions, behind, lag_delay
+
+logger = logging.getLogger(__name__)
+
+# Per-process columnar copy of the transactions table for the analytics
+# endpoints. One NumPy array per column:
+#
+#   ids      int64   transaction id, ascending (relabel() finds rows by binary search)
+#   day      int32   days since 1970-01-01 (numpy datetime64[D] ordinal)
+#   cents    int64   signed amount in cents
+#   label    int32   label id, -1 when unlabeled
+#   account  int32   index into `accounts` (dictionary-encoded rekening)
+#
+# Archived years come in as their monthly totals (see archive.py), so they
+# count at month granularity.
+#
+# Loaded once, then kept current by append() on ingest and relabel() on label
+# updates in this process. Writes by other processes are noticed through the
+# cache versions in app/changes.py and trigger a reload. Aggregations are
+# vectorized bincount kernels over these arrays.
+
+UNLABELED = -1
+
+# Tables the store is built from
+STORE_TABLES = ('transactions', 'transaction_labels')
+
+
+class Snapshot:
+    """Consistent, read-only view of the store at one point in time."""
+
+    __slots__ = ('ids', 'day', 'cents', 'label', 'account', 'accounts')
+
+    def __init__(self, ids, day, cents, label, account, accounts):
+        self.ids = ids
+        self.day = day
+        self.cents = cents
+        self.label = label
+        self.account = account
+        self.accounts = accounts
+
+    def __len__(self):
+        return len(self.ids)
+
+    def months(self):
+        """Month number per row, counted from 1970-01 (0 = January 1970)."""
+        return self.day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+class TransactionStore:
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._versions = {}
+        # Loads in a row that were behind the known versions, and when to retry
+        self._lagging_loads = 0
+        self._retry_at = 0
+        self._size = 0
+        self._ids = np.empty(0, dtype=np.int64)
+        self._day = np.empty(0, dtype=np.int32)
+        self._cents = np.empty(0, dtype=np.int64)
+        self._label = np.empty(0, dtype=np.int32)
+        self._account = np.empty(0, dtype=np.int32)
+        self._accounts = []
+        self._account_codes = {}
+        # Set while a snapshot may still reference the label array (copy-on-write)
+        self._label_shared = False
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def is_stale(self, primary=False):
+        if not self.loaded:
+            return True
+        if behind(self._versions, STORE_TABLES):
+            # A load from the primary is current; from the replica, not before
+            # a lagging replica had time to catch up (see changes.py)
+            return primary or time.monotonic() >= self._retry_at
+        return self.max_age is not None and time.monotonic() - self._loaded_at > self.max_age
+
+    def load(self, session):
+        """(Re)load all transactions from the database."""
+        start = time.perf_counter()
+        # Versions first: the rows read afterwards are at least that new
+        versions = read_versions(session, STORE_TABLES)
+        rows = session.execute(
+            select(Transaction.id, Transaction.datum, Transaction.amount_cents,
+                   Transaction.rekening, TransactionLabel.label_id)
+            .outerjoin(TransactionLabel, Transaction.id == TransactionLabel.transaction_id)
+            .order_by(Transaction.id)
+        ).all()
+        # Archived years (archive.py) as one row per month, label, account and
+        # direction, dated on the first of the month, with ascending negative
+        # ids: all ids stay in ascending order
+        archived = session.execute(
+            select(ArchivedMonthTotal.month, ArchivedMonthTotal.amount_cents,
+                   ArchivedMonthTotal.rekening, ArchivedMonthTotal.label_id)
+            .order_by(ArchivedMonthTotal.month)
+        ).all()
+        with self._lock:
+            self._reset()
+            self._append_locked([(i - len(archived), *row) for i, row in enumerate(archived)])
+            self._append_locked(rows)
+            self._versions = versions
+            self._loaded_at = time.monotonic()
+            if behind(versions, STORE_TABLES):
+                self._retry_at = self._loaded_at + lag_delay(self._lagging_loads)
+                self._lagging_loads += 1
+            else:
+                self._retry_at, self._lagging_loads = 0, 0
+        logger.info("Columnar store loaded %d transactions in %.0f ms",
+                    len(rows), (time.perf_counter() - start) * 1000)
+
+    def _reset(self):
+        self._size = 0
+        self._accounts = []
+        self._account_codes = {}
+        self._ids = np.empty(0, dtype=np.int64)
+        self._day = np.empty(0, dtype=np.int32)
+        self._cents = np.empty(0, dtype=np.int64)
+        self._label = np.empty(0, dtype=np.int32)
+        self._account = np.empty(0, dtype=np.int32)
+        self._label_shared = False
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self._ids), 1024)
+        for name in ('_ids', '_day', '_cents', '_label', '_account'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+        # Fresh arrays: snapshots keep the old ones
+        self._label_shared = False
+
+    def _account_code(self, rekening):
+        code = self._account_codes.get(rekening)
+        if code is None:
+            code = len(self._accounts)
+            self._account_codes[rekening] = code
+            self._accounts.append(rekening)
+        return code
+
+    def _append_locked(self, rows):
+        count = len(rows)
+        if not count:
+            return
+        start, end = self._size, self._size + count
+        if end > len(self._ids):
+            self._grow(end)
+        self._ids[start:end] = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        self._day[start:end] = np.array([row[1] for row in rows], dtype='datetime64[D]').astype(np.int32)
+        self._cents[start:end] = np.fromiter((row[2] for row in rows), dtype=np.int64, count=count)
+        self._label[start:end] = np.fromiter(
+            (UNLABELED if row[4] is None else row[4] for row in rows), dtype=np.int32, count=count)
+        self._account[start:end] = np.fromiter(
+            (self._account_code(row[3]) for row in rows), dtype=np.int32, count=count)
+        self._size = end
+        if np.any(np.diff(self._ids[max(start - 1, 0):end]) <= 0):
+            # Rows committed out of id order (e.g. an import that overlapped a
+            # reload): restore the order relabel() bisects on
+            self._sort_locked()
+
+    def _sort_locked(self):
+        order = np.argsort(self._ids[:self._size], kind='stable')
+        for name in ('_ids', '_day', '_cents', '_label', '_account'):
+            # Fancy indexing copies: snapshots keep the old arrays
+            setattr(self, name, getattr(self, name)[:self._size][order])
+        self._label_shared = False
+
+    def _position(self, transaction_id):
+        # ids are kept in ascending order, so a binary search finds the row
+        position = int(np.searchsorted(self._ids[:self._size], transaction_id))
+        if position < self._size and self._ids[position] == transaction_id:
+            return position
+        return None
+
+    def append(self, rows):
+        """Add newly ingested rows: (id, datum, amount_cents, rekening, label_id) tuples."""
+        if not self.loaded:
+            return
+        with self._lock:
+            if self._size and len(rows):
+                # A reload that overlapped the import may have loaded some already
+                ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+                positions = np.searchsorted(self._ids[:self._size], ids)
+                loaded = self._ids[np.minimum(positions, self._size - 1)] == ids
+                if loaded.any():
+                    rows = [row for row, skip in zip(rows, loaded) if not skip]
+            self._append_locked(rows)
+
+    def relabel(self, transaction_id, label_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            position = self._position(transaction_id)
+            if position is None:
+                return
+            if self._label_shared:
+                # A snapshot still points at this array; don't change it under its feet
+                self._label = self._label.copy()
+                self._label_shared = False
+            self._label[position] = UNLABELED if label_id is None else label_id
+
+    def note_own_write(self, versions):
+        """Mark the store current after append()/relabel() of a write published as `versions`.
+
+        Only when the store was exactly one version behind; if other writes
+        happened in between, it stays stale and reloads.
+        """
+        with self._lock:
+            for table, version in versions.items():
+                if self._versions.get(table) == version - 1:
+                    self._versions[table] = version
+
+    def snapshot(self):
+        with self._lock:
+            n = self._size
+            self._label_shared = True
+            return Snapshot(self._ids[:n], self._day[:n], self._cents[:n], self._label[:n],
+                            self._account[:n], list(self._accounts))
+
+
+def day_range_mask(snapshot, start=None, end=None):
+    """Boolean mask for start <= datum < end (dates), or None when unbounded."""
+    mask = None
+    if start is not None:
+        mask = snapshot.day >= np.datetime64(start, 'D').astype(np.int32)
+    if end is not None:
+        below = snapshot.day < np.datetime64(end, 'D').astype(np.int32)
+        mask = below if mask is None else (mask & below)
+    return mask
+
+
+def combine_masks(mask, other):
+    if mask is None:
+        return other
+    return mask if other is None else (mask & other)
+
+
+# --- Aggregation kernels ----------------------------------------------------
+# Sums use np.bincount with float64 weights: every partial sum of integer cents
+# below 2**53 (~90 trillion euros) is exact, and the result is rounded back to int64.
+
+def _group_sums(keys, cents, size):
+    counts = np.bincount(keys, minlength=size)
+    sums = np.rint(np.bincount(keys, weights=cents, minlength=size)).astype(np.int64)
+    return counts, sums
+
+
+def month_sums(snapshot, mask=None, magnitude=True):
+    """Return (months, cents) for every month with at least one row."""
+    months = snapshot.months()
+    cents = np.abs(snapshot.cents) if magnitude else snapshot.cents
+    if mask is not None:
+        months, cents = months[mask], cents[mask]
+    if not len(months):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    first = months.min()
+    counts, sums = _group_sums(months - first, cents, 0)
+    present = np.flatnonzero(counts)
+    return present + first, sums[present]
+
+
+def label_month_sums(snapshot, mask=None, magnitude=True):
+    """Return (label_ids, months, cents) for every labeled (label, month) group."""
+    labeled = snapshot.label != UNLABELED
+    mask = labeled if mask is None else (mask & labeled)
+    labels = snapshot.label[mask]
+    months = snapshot.months()[mask]
+    cents = (np.abs(snapshot.cents) if magnitude else snapshot.cents)[mask]
+    if not len(labels):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    label_ids, label_codes = np.unique(labels, return_inverse=True)
+    first = months.min()
+    n_months = int(months.max() - first) + 1
+    keys = label_codes.astype(np.int64) * n_months + (months - first)
+    counts, sums = _group_sums(keys, cents, len(label_ids) * n_months)
+    present = np.flatnonzero(counts)
+    return label_ids[present // n_months], present % n_months + first, sums[present]
+
+
+def month_direction_sums(snapshot, mask=None):
+    """Return (months, is_credit, cents) per month and direction ('Bij' vs 'Af')."""
+    months = snapshot.months()
+    cents = snapshot.cents
+    if mask is not None:
+        months, cents = months[mask], cents[mask]
+    if not len(months):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.astype(bool), empty
+    first = months.min()
+    credit = (cents > 0).astype(np.int64)
+    keys = (months - first) * 2 + credit
+    counts, sums = _group_sums(keys, np.abs(cents), 0)
+    present = np.flatnonzero(counts)
+    return present // 2 + first, (present % 2).astype(bool), sums[present]
+
+
+def month_key(month):
+    """Month number from 1970-01 -> 'YYYY-MM'."""
+    year, month_index = divmod(int(month), 12)
+    return f'{1970 + year:04d}-{month_index + 1:02d}'
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store(session_factory, max_age=None, primary=False):
+    """Return this process' store, loading it on first use or when too old.
+
+    `primary`: `session_factory` reads from the primary, so a store that is
+    behind is reloaded at once rather than after the replica lag back-off.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TransactionStore(max_age=max_age)
+    if _store.is_stale(primary):
+        # One thread reloads; others keep serving the current data meanwhile
+        # (a client that must see its own writes waits for it instead)
+        if _store_lock.acquire(blocking=primary or not _store.loaded):
+            try:
+                if _store.is_stale(primary):
+                    session = session_factory()
+                    try:
+                        _store.load(session)
+                    finally:
+                        session.close()
+            finally:
+                _store_lock.release()
+    return _store
+
+
+def peek_store():
+    """The store if this process has one, without loading it (for write hooks)."""
+    return _store
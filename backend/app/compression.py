@@ -0,0 +1,46 @@
+import gzip
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+# Content-Encoding negotiation for responses: brotli when the client accepts it
+# and the module is installed, else gzip. Only bodies of at least
+# COMPRESS_MIN_BYTES are compressed; below that the saving doesn't pay for the
+# CPU time. Streamed responses (/api/export) are passed through as they are.
+
+COMPRESSIBLE = {'application/json', 'text/csv', 'text/plain', 'text/html', 'text/css', 'application/javascript'}
+
+
+def _encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=current_app.config['GZIP_LEVEL'])
+
+
+def compress_response(response):
+    """after_request hook: compress large bodies with the best encoding the client accepts."""
+    if (response.is_streamed or response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = _encoding()
+    if encoding is None or (response.content_length or 0) < current_app.config['COMPRESS_MIN_BYTES']:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
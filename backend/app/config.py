@@ -14,3 +14,74 @@ class Config:
         f'@{os.getenv("POSTGRES_HOST")}:{port}/{os.getenv("POSTGRES_DB")}'
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Optional read replica (same credentials and database). Read-only queries
+    # use it, writes always go to the primary. Unset: everything uses the primary.
+    replica_port = os.getenv('POSTGRES_REPLICA_PORT', port).split(':')[-1]
+    SQLALCHEMY_REPLICA_URI = (
+        f'postgresql://{os.getenv("POSTGRES_USER")}:{os.getenv("POSTGRES_PASSWORD")}'
+        f'@{os.getenv("POSTGRES_REPLICA_HOST")}:{replica_port}/{os.getenv("POSTGRES_DB")}'
+    ) if os.getenv('POSTGRES_REPLICA_HOST') else None
+
+    # Seconds a client keeps reading from the primary after a write (read-your-writes)
+    READ_AFTER_WRITE_SECONDS = int(os.getenv('READ_AFTER_WRITE_SECONDS', '5'))
+
+    # Connection pool per worker process; keep pool_size >= gunicorn threads
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+
+    # Debug mode is opt-in, never on by default in production
+    DEBUG = os.getenv('FLASK_DEBUG', '0') == '1'
+
+    # Logging: level, 'text' or 'json' output, and keep rates for chatty loggers
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', 'app.db.rows=0.01')
+
+    # Requests slower than this are logged and counted as slow in /metrics
+    SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '1000'))
+
+    # Request profiling (see profiling.py), off by default. ADMIN_TOKEN enables the
+    # X-Profile request header and /api/admin/profiles; PROFILE_SAMPLE_RATE profiles
+    # that fraction of all requests. Profiles are written to PROFILE_DIR.
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN') or None
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '200'))
+
+    # Seconds before the in-memory columnar transaction store is fully reloaded
+    # (it is updated in place on writes made by the same process)
+    COLUMNAR_STORE_MAX_AGE = int(os.getenv('COLUMNAR_STORE_MAX_AGE', '300'))
+
+    # How processes learn about writes made elsewhere: 'notify' (LISTEN/NOTIFY plus a
+    # poll every CACHE_POLL_SECONDS), 'poll' (when LISTEN isn't available, e.g. behind
+    # a transaction-pooling proxy) or 'off' (rely on COLUMNAR_STORE_MAX_AGE)
+    CACHE_INVALIDATION = os.getenv('CACHE_INVALIDATION', 'notify')
+    CACHE_POLL_SECONDS = float(os.getenv('CACHE_POLL_SECONDS', '10'))
+
+    # JSON encoder for responses: 'orjson' (falls back to Flask's when not installed) or 'default'
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson')
+
+    # Responses of at least this many bytes are brotli/gzip compressed when the client accepts it
+    COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+    GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+    BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+    # Bank statement files imported by /api/load-data (glob; several files are parsed in parallel)
+    IMPORT_GLOB = os.getenv('IMPORT_GLOB', 'data.csv')
+
+    # Where suggested labels come from: 'hybrid' (nearest labeled merchants, the model
+    # for companies without a close match), 'index' or 'model' (see suggest.py)
+    LABEL_SUGGESTIONS = os.getenv('LABEL_SUGGESTIONS', 'hybrid')
+
+    # Archived years of transactions (see archive.py): Parquet files under
+    # ARCHIVE_DIR, an absolute path on storage every backend process can read
+    # and that outlives the pods. Archiving is refused while it isn't set.
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR')
+    ARCHIVE_COMPRESSION = os.getenv('ARCHIVE_COMPRESSION', 'zstd')
+
+    # Path to the label prediction model
+    MODEL_PATH = os.getenv('MODEL_PATH', 'label_predictor.joblib')
+    # Memory-map the model's arrays instead of loading them per process (see model_files.py)
+    MODEL_MMAP = os.getenv('MODEL_MMAP', '1') == '1'
@@ -1,43 +1,147 @@
-import pandas as pd
-import csv
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
-from .models import Transaction, Label, TransactionLabel, LabelCategory
+import os
+import glob
+import json
+import base64
+from collections import Counter, namedtuple
+from types import SimpleNamespace
+from sqlalchemy import case, func, literal, or_, select, text, tuple_, union
+from .models import Transaction, Label, TransactionLabel, LabelCategory, LabelingQueueEntry, ArchivedMonthTotal
 from flask import current_app, jsonify
 from sqlalchemy.dialects.postgresql import insert
+from .metrics import model_timer
+from .routing import session_factory, reads_from_primary
+from .partitions import ensure_partitions, create_partitions, month_range
+from .model_files import load_model
+from .balances import invalidate_checkpoints, rebuild_checkpoints, balances_at, balance_series
+from .archive import archived_years, archive_year, restore_year, read_rows, read_files
+from .changes import publish
+from .suggest import get_label_index, peek_label_index, normalize
+from .amounts import cents_to_decimal
+from .columnar import (get_store, peek_store, month_sums, label_month_sums, month_direction_sums, month_key,
+                       day_range_mask, combine_masks)
+import numpy as np
 import logging
-from datetime import date
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import re
-import joblib  # Import joblib to load the model
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 
-def get_session():
+logger = logging.getLogger(__name__)
+# Per-row messages go to their own logger so they can be sampled (LOG_SAMPLE_RATES)
+row_logger = logging.getLogger(__name__ + '.rows')
+
+# The label model is loaded once per process. Its arrays are memory-mapped from
+# the model file (see model_files.py), so all workers share one copy of them.
+_model = None
+_model_lock = threading.Lock()
+
+# Worker threads for the independent parts of /api/dashboard. Threads start on
+# first use, so a preloaded master never owns any.
+_dashboard_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='dashboard')
+
+# Whether pg_trgm is installed (fuzzy company search); looked up once per process
+_has_trigram = None
+
+SEARCH_MAX_PER_PAGE = 200
+LABELING_QUEUE_MAX_PER_PAGE = 200
+CHANGES_MAX_PER_PAGE = 1000
+
+# Export rows of archived transactions, with the fields of iter_export_batches() rows
+ExportRow = namedtuple('ExportRow', ['id', 'datum', 'company', 'rekening', 'tegenrekening', 'code', 'af_bij',
+                                     'amount_cents', 'mutatiesoort', 'mededelingen', 'label', 'category'])
+
+
+def get_session(read_only=False):
     try:
-        engine = create_engine(current_app.config['SQLALCHEMY_DATABASE_URI'])
-        Session = sessionmaker(bind=engine)
-        logging.info("Database session created successfully.")
+        # Reuse the app's connection pools instead of creating a new one per call.
+        # read_only sessions may go to the replica (see routing.py).
+        Session = session_factory(read_only)
+        logger.debug("Database session created successfully.")
         return Session()
     except Exception as e:
-        logging.error(f"Error creating database session: {e}")
+        logger.error("Error creating database session: %s", e)
         raise e
 
-def fetch_all_transactions():
-    session = get_session()
+def _cache_source():
+    # Session factory the per-process caches load from, and whether it is the
+    # primary's: a client that just wrote (routing.reads_from_primary) must see
+    # its write, possibly made by another worker or pod, in them as well
+    if reads_from_primary():
+        return current_app.session_factory, True
+    return current_app.replica_session_factory, False
+
+def get_transaction_store():
+    # Columnar in-memory copy of the transactions, used by the analytics functions
+    # Loaded from the replica: a full scan is the heaviest read we do. Writes made
+    # by this process are applied to the store directly (append/relabel).
+    factory, primary = _cache_source()
+    return get_store(factory, current_app.config['COLUMNAR_STORE_MAX_AGE'], primary=primary)
+
+def get_suggestion_index():
+    # Nearest-neighbour label suggestions (see suggest.py); like the store, built
+    # from the replica and updated in place by this process' label updates
+    factory, primary = _cache_source()
+    return get_label_index(factory, current_app.config['COLUMNAR_STORE_MAX_AGE'], primary=primary)
+
+def filter_date_range(query, start=None, end=None):
+    # Plain range predicates on datum (start inclusive, end exclusive) so Postgres
+    # can use the datum index, unlike date_trunc('month', datum) = ...
+    if start is not None:
+        query = query.filter(Transaction.datum >= start)
+    if end is not None:
+        query = query.filter(Transaction.datum < end)
+    return query
+
+def month_bounds(month_start):
+    """First day of the month containing `month_start` and the first day of the next month."""
+    import pandas as pd  # slow to import; only needed here and in fetch_chart_data
+    first = pd.to_datetime(month_start).date().replace(day=1)
+    return first, (first + timedelta(days=32)).replace(day=1)
+
+def get_model(model_path=None):
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                model_path = model_path or current_app.config['MODEL_PATH']
+                _model = load_model(model_path, mmap=current_app.config['MODEL_MMAP'])
+                logger.info("Label model loaded from %s", model_path)
+    return _model
+
+def fetch_all_transactions(start=None, end=None):
+    session = get_session(read_only=True)
     try:
-        transactions = session.query(Transaction).all()
-        logging.info(f"Number of transactions fetched: {len(transactions)}")
+        transactions = filter_date_range(session.query(Transaction), start, end).all()
+        logger.info("Number of transactions fetched: %d", len(transactions))
         return transactions
     except Exception as e:
         session.rollback()
-        logging.error(f"Error fetching transactions: {e}")
+        logger.error("Error fetching transactions: %s", e)
+        raise e
+    finally:
+        session.close()
+
+def fetch_archived_months(start=None, end=None):
+    """First days of the archived months in [start, end) (see archive.py)."""
+    session = get_session(read_only=True)
+    try:
+        query = session.query(ArchivedMonthTotal.month).distinct()
+        if start is not None:
+            query = query.filter(ArchivedMonthTotal.month >= start.replace(day=1))
+        if end is not None:
+            query = query.filter(ArchivedMonthTotal.month < end)
+        return [month for month, in query.order_by(ArchivedMonthTotal.month)]
+    except Exception as e:
+        session.rollback()
+        logger.error("Error fetching archived months: %s", e)
         raise e
     finally:
         session.close()
 
 def fetch_labels():
-    session = get_session()
+    session = get_session(read_only=True)
     try:
         labels = session.query(Label).all()
         return labels
@@ -54,194 +158,651 @@ def update_transaction_label(transaction_id, label_name):
         if not label:
             raise ValueError(f'Label "{label_name}" not found')
 
+        transaction = session.query(Transaction.company).filter(Transaction.id == transaction_id).first()
+        if transaction is None:
+            # Also archived transactions (archive.py): their years are closed
+            raise ValueError(f'Transaction {transaction_id} not found')
+        company = transaction.company
         transaction_label = session.query(TransactionLabel).filter_by(transaction_id=transaction_id).first()
+        previous_label_id = transaction_label.label_id if transaction_label else None
         if transaction_label:
             transaction_label.label_id = label.id
         else:
             new_transaction_label = TransactionLabel(transaction_id=transaction_id, label_id=label.id)
             session.add(new_transaction_label)
 
+        # One transaction fewer left to label for this merchant
+        requeue = None
+        if previous_label_id is None:
+            entry = session.get(LabelingQueueEntry, normalize(company), with_for_update=True)
+            if entry is not None and entry.transaction_count > 1:
+                entry.transaction_count -= 1
+                requeue = entry.merchant
+            elif entry is not None:
+                session.delete(entry)
+
+        label_id = label.id
+        versions = publish(session, 'transaction_labels')
         session.commit()
-        logging.info(f'Label "{label_name}" linked to transaction {transaction_id}')
+        logger.info('Label "%s" linked to transaction %s', label_name, transaction_id)
+
+        # Keep this process' columnar store in step
+        store = peek_store()
+        if store:
+            store.relabel(int(transaction_id), label_id)
+            store.note_own_write(versions)
+        index = peek_label_index()
+        if index is not None:
+            index.relabel(company, previous_label_id, label_id)
+            index.note_own_write(versions)
+        if requeue:
+            try:
+                _rerank_queue_entry(requeue)
+            except Exception as e:
+                logger.warning("Labeling queue entry %s not re-ranked: %s", requeue, e)
     except Exception as e:
         session.rollback()
-        logging.error(f'Error updating transaction label: {e}')
+        logger.error('Error updating transaction label: %s', e)
         raise e
     finally:
         session.close()
 
-def fetch_transactions(month_start=None):
-    # Load your custom model (ensure the path is correct)
-    MODEL_PATH = 'label_predictor.joblib'
-    custom_model = joblib.load(MODEL_PATH)
+def _suggest_labels(session, companies):
+    """(label name, probability) per company, as configured by LABEL_SUGGESTIONS.
+
+    'index' asks the nearest-neighbour index, 'model' the joblib model and
+    'hybrid' the index first and the model for the companies it has no match for.
+    """
+    mode = current_app.config['LABEL_SUGGESTIONS']
+    suggestions = [(None, 0.0)] * len(companies)
+    missing = range(len(companies))
+
+    if mode in ('index', 'hybrid'):
+        label_names = _label_names(session)
+        for i, (label_id, similarity) in enumerate(get_suggestion_index().suggest(companies)):
+            if label_id in label_names:
+                suggestions[i] = (label_names[label_id], similarity)
+        missing = [i for i, (label, _) in enumerate(suggestions) if label is None]
+
+    if mode in ('model', 'hybrid') and missing:
+        # Load your custom model (cached per process); one call for all rows
+        custom_model = get_model()
+        model_input = [companies[i] for i in missing]
+        with model_timer('predict'):
+            predicted = custom_model.predict(model_input)
+        with model_timer('predict_proba'):
+            probabilities = custom_model.predict_proba(model_input)
+        class_index = {label: position for position, label in enumerate(custom_model.classes_)}
+        for i, label, label_probabilities in zip(missing, predicted, probabilities):
+            suggestions[i] = (label, label_probabilities[class_index[label]])
+    return suggestions
+
+def _queue_uncertainties(companies, suggestions):
+    """Uncertainty per company that ranks the labeling queue: 1 - the model's top probability.
+
+    The same scale for every merchant, also in 'hybrid' mode, where some
+    suggestions carry an index similarity instead of a probability. With
+    LABEL_SUGGESTIONS='index' no model is used and the similarity ranks.
+    """
+    if current_app.config['LABEL_SUGGESTIONS'] == 'index':
+        return [1 - float(probability) for _, probability in suggestions]
+    if not companies:
+        return []
+    with model_timer('predict_proba'):
+        probabilities = get_model().predict_proba(companies)
+    return [1 - float(top) for top in probabilities.max(axis=1)]
+
+def suggest_labels(companies):
+    """Nearest-neighbour suggestions for a batch of company names (index only)."""
+    session = get_session(read_only=True)
+    try:
+        label_names = _label_names(session)
+        return [
+            {'company': company, 'label': label_names.get(label_id), 'similarity': similarity}
+            for company, (label_id, similarity) in zip(companies, get_suggestion_index().suggest(companies))
+        ]
+    except Exception as e:
+        session.rollback()
+        logger.error("Error suggesting labels: %s", e)
+        raise e
+    finally:
+        session.close()
 
+def _unlabeled_merchants(session, merchants=None):
+    """{merchant: (most frequent company spelling, unlabeled transactions)}, optionally only for `merchants`."""
+    counts = session.query(Transaction.company, func.count()) \
+        .outerjoin(TransactionLabel, Transaction.id == TransactionLabel.transaction_id) \
+        .filter(TransactionLabel.id.is_(None)) \
+        .group_by(Transaction.company)
+    spellings = {}
+    for company, count in counts:
+        merchant = normalize(company)
+        if merchant and (merchants is None or merchant in merchants):
+            spellings.setdefault(merchant, Counter())[company] += count
+    return {merchant: (companies.most_common(1)[0][0], sum(companies.values()))
+            for merchant, companies in spellings.items()}
+
+def refresh_labeling_queue(merchants=None):
+    """Recompute the labeling queue, or only the entries of `merchants` (normalized companies).
+
+    One label suggestion per merchant instead of per transaction. Runs after
+    imports, at bootstrap and from
+    `flask --app app refresh-labeling-queue` (e.g. after retraining the model).
+    """
+    session = get_session()
+    try:
+        groups = _unlabeled_merchants(session, merchants)
+        companies = [company for company, _ in groups.values()]
+        suggestions = _suggest_labels(session, companies)
+        uncertainties = _queue_uncertainties(companies, suggestions)
+
+        stale = session.query(LabelingQueueEntry)
+        if merchants is not None:
+            stale = stale.filter(LabelingQueueEntry.merchant.in_(list(merchants)))
+        stale.filter(LabelingQueueEntry.merchant.not_in(list(groups))).delete(synchronize_session=False)
+
+        rows = [
+            {'merchant': merchant, 'company': company, 'transaction_count': count, 'suggested_label': label,
+             'label_probability': float(probability), 'uncertainty': uncertainty}
+            for (merchant, (company, count)), (label, probability), uncertainty
+            in zip(groups.items(), suggestions, uncertainties)
+        ]
+        if rows:
+            statement = insert(LabelingQueueEntry)
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[LabelingQueueEntry.merchant],
+                set_={column: statement.excluded[column] for column in rows[0] if column != 'merchant'}
+                     | {'updated_at': func.now()}
+            ), rows)
+        session.commit()
+        logger.info("Labeling queue refreshed: %d merchants", len(rows))
+    except Exception as e:
+        session.rollback()
+        logger.error("Error refreshing labeling queue: %s", e)
+        raise e
+    finally:
+        session.close()
 
+def _rerank_queue_entry(merchant):
+    # After a label update the merchant's remaining transactions are usually a
+    # confident match for the new label: refresh its suggestion and priority
     session = get_session()
     try:
+        entry = session.get(LabelingQueueEntry, merchant, with_for_update=True)
+        if entry is not None:
+            suggestions = _suggest_labels(session, [entry.company])
+            (label, probability), = suggestions
+            entry.suggested_label = label
+            entry.label_probability = float(probability)
+            entry.uncertainty, = _queue_uncertainties([entry.company], suggestions)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def _encode_queue_cursor(entry):
+    key = [entry.uncertainty, entry.transaction_count, entry.merchant]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def _decode_queue_cursor(cursor):
+    try:
+        uncertainty, count, merchant = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(uncertainty), int(count), str(merchant)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def fetch_labeling_queue(limit=50, cursor=None):
+    """One page of merchants to label, most uncertain suggestion first.
+
+    Keyset paging on (uncertainty, transaction_count, merchant), all
+    descending: every page is one range scan of ix_labeling_queue_priority,
+    however deep into the queue it is. Pass the returned next_cursor to get
+    the following page; it is None on the last one.
+    """
+    limit = max(1, min(limit, LABELING_QUEUE_MAX_PER_PAGE))
+    after = _decode_queue_cursor(cursor) if cursor else None
+    key = (LabelingQueueEntry.uncertainty, LabelingQueueEntry.transaction_count, LabelingQueueEntry.merchant)
+    session = get_session(read_only=True)
+    try:
+        query = session.query(LabelingQueueEntry).order_by(*(column.desc() for column in key))
+        if after:
+            query = query.filter(tuple_(*key) < tuple_(*after))
+        entries = query.limit(limit + 1).all()
+        return {
+            'results': [{
+                'merchant': entry.merchant,
+                'company': entry.company,
+                'transaction_count': entry.transaction_count,
+                'suggested_label': entry.suggested_label,
+                'label_probability': entry.label_probability,
+            } for entry in entries[:limit]],
+            'next_cursor': _encode_queue_cursor(entries[limit - 1]) if len(entries) > limit else None,
+        }
+    except Exception as e:
+        session.rollback()
+        logger.error("Error fetching labeling queue: %s", e)
+        raise e
+    finally:
+        session.close()
+
+def _transaction_query(session, *extra_columns):
+    """The columns fetch_transactions() returns per transaction, with its label."""
+    return session.query(
+        Transaction.id,
+        Transaction.datum,
+        Transaction.company,
+        Transaction.rekening,
+        Transaction.tegenrekening,
+        Transaction.code,
+        Transaction.af_bij,
+        Transaction.amount_cents,
+        Transaction.mededelingen,
+        Transaction.mutatiesoort,
+        Label.name.label('label'),
+        *extra_columns
+    ).outerjoin(TransactionLabel, Transaction.id == TransactionLabel.transaction_id) \
+     .outerjoin(Label, TransactionLabel.label_id == Label.id)
+
+def _transaction_rows(session, transactions):
+    suggestions = _suggest_labels(session, [transaction.company for transaction in transactions])
+
+    transaction_data = []
+    for transaction, (suggested_label, suggested_label_probability) in zip(transactions, suggestions):
+        # Only check for time if mutatiesoort is 'Betaalautomaat' or 'iDEAL'
+        if transaction.mutatiesoort in ['Betaalautomaat', 'iDEAL']:
+            # Search for time pattern (HH:MM) in 'mededelingen'
+            time_match = re.search(r'\b([01]?[0-9]|2[0-3]):[0-5][0-9]\b', transaction.mededelingen)
+            if time_match:
+                time_str = time_match.group(0)
+                # Combine date and time
+                datetime_obj = datetime.combine(transaction.datum, datetime.strptime(time_str, '%H:%M').time())
+                datum_with_time = datetime_obj.strftime('%d-%m-%Y %H:%M')
+            else:
+                datum_with_time = transaction.datum.strftime('%d-%m-%Y')
+        else:
+            datum_with_time = transaction.datum.strftime('%d-%m-%Y')
+        
+        row_logger.debug("Suggested label for %s: %s (%.2f)", transaction.company, suggested_label, suggested_label_probability)
+
+        transaction_data.append({
+            'id': transaction.id,
+            'datum': datum_with_time,
+            'company': transaction.company,
+            'rekening': transaction.rekening,
+            'tegenrekening': transaction.tegenrekening,
+            'code': transaction.code,
+            'af_bij': transaction.af_bij,
+            'bedrag_eur': cents_to_decimal(abs(transaction.amount_cents)),
+            'mededelingen': transaction.mededelingen,
+            'mutatiesoort': transaction.mutatiesoort,
+            'label': transaction.label,
+            'suggested_label': suggested_label,
+            'label_probability': suggested_label_probability  # Store only the probability for the suggested label
+        })
+    return transaction_data
+
+def _archived_transactions(session, start=None, end=None):
+    # Rows of the archived years in range, shaped like _transaction_query() rows.
+    # Only for a bounded range: without one, the listing stays on the live table
+    # instead of reading every archived file at row level.
+    if start is None or end is None:
+        return []
+    table = read_rows(session, start, end)
+    if table is None:
+        return []
+    label_names = _label_names(session)
+    return [SimpleNamespace(**row, label=label_names.get(row['label_id'])) for row in table.to_pylist()]
+
+def fetch_transactions(month_start=None, start=None, end=None):
+    session = get_session(read_only=True)
+    try:
+        query = _transaction_query(session)
+        if month_start:
+            start, end = month_bounds(month_start)
+        query = filter_date_range(query, start, end)
+
+        return _transaction_rows(session, _archived_transactions(session, start, end) + query.all())
+    except Exception as e:
+        session.rollback()
+        logger.error("Error fetching transactions: %s", e)
+        raise e
+    finally:
+        session.close()
+
+def _encode_change_cursor(xid, seq):
+    return base64.urlsafe_b64encode(json.dumps([xid, seq]).encode()).decode()
+
+def _decode_change_cursor(cursor):
+    try:
+        xid, seq = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(xid), int(seq)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def _change_horizon(session):
+    # Every transaction with a lower id has committed or aborted: no change
+    # stamped below it can still appear (see migrations._change_xid)
+    return session.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+
+def fetch_changes(since=None, limit=500):
+    """Transactions inserted, updated or relabeled after the cursor `since`.
+
+    Rows are those of fetch_transactions(), oldest change first, and `cursor`
+    is what to pass as `since` next time. A client first asks for a cursor
+    without `since`, then loads its months as usual and from then on only
+    fetches what changed. With has_more set, the next page follows straight
+    away. Changes of transactions that are still running, or that started
+    before one that is, come in a later call. Removed label assignments are
+    not reported; the app only ever replaces them.
+    """
+    limit = max(1, min(limit, CHANGES_MAX_PER_PAGE))
+    session = get_session(read_only=True)
+    try:
+        horizon = _change_horizon(session)
+        if since is None:
+            return {'changes': [], 'cursor': _encode_change_cursor(horizon, 0), 'has_more': False}
+        since_xid, since_seq = _decode_change_cursor(since)
+
+        def newer(model):
+            return tuple_(model.change_xid, model.change_seq) > tuple_(since_xid, since_seq)
+
+        changed = union(
+            select(Transaction.id).where(newer(Transaction)),
+            select(TransactionLabel.transaction_id).where(newer(TransactionLabel)),
+        ).subquery()
+        # The newer of the row's and its label's stamps; change_seq alone is unique
+        label_newer = tuple_(func.coalesce(TransactionLabel.change_xid, -1),
+                             func.coalesce(TransactionLabel.change_seq, -1)) \
+            > tuple_(Transaction.change_xid, Transaction.change_seq)
+        xid = case((label_newer, TransactionLabel.change_xid), else_=Transaction.change_xid)
+        seq = case((label_newer, TransactionLabel.change_seq), else_=Transaction.change_seq)
+        transactions = _transaction_query(session, xid.label('change_xid'), seq.label('change_seq')) \
+            .filter(Transaction.id.in_(select(changed.c[0])),
+                    tuple_(xid, seq) > tuple_(since_xid, since_seq), xid < horizon) \
+            .order_by(xid, seq).limit(limit + 1).all()
+
+        page = transactions[:limit]
+        return {
+            'changes': _transaction_rows(session, page),
+            'cursor': _encode_change_cursor(page[-1].change_xid, page[-1].change_seq) if page else since,
+            'has_more': len(transactions) > limit,
+        }
+    except Exception as e:
+        session.rollback()
+        logger.error("Error fetching changes: %s", e)
+        raise e
+    finally:
+        session.close()
+
+
+def _trigram_enabled(session):
+    global _has_trigram
+    if _has_trigram is None:
+        _has_trigram = session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).first() is not None
+    return _has_trigram
+
+def search_transactions(q, page=1, per_page=50, start=None, end=None):
+    """Full-text search over company and mededelingen, best matches first.
+
+    Uses the GIN index on search_vector (websearch syntax: words, "phrases",
+    -exclusions, OR). With pg_trgm installed, companies that fuzzily contain
+    the query (typos, partial merchant names) match as well.
+    Pages are fetched with one extra row to report `has_more` without a COUNT.
+    """
+    per_page = max(1, min(per_page, SEARCH_MAX_PER_PAGE))
+    page = max(1, page)
+    session = get_session(read_only=True)
+    try:
+        tsquery = func.websearch_to_tsquery('simple', q)
+        match = Transaction.search_vector.bool_op('@@')(tsquery)
+        rank = func.ts_rank_cd(Transaction.search_vector, tsquery)
+        if _trigram_enabled(session):
+            # `q <% company`: word similarity, served by ix_transactions_company_trgm
+            match = or_(match, literal(q).bool_op('<%')(Transaction.company))
+            rank = func.greatest(rank, func.word_similarity(q, Transaction.company))
+        rank = rank.label('rank')
+
         query = session.query(
             Transaction.id,
             Transaction.datum,
             Transaction.company,
             Transaction.rekening,
-            Transaction.tegenrekening,
-            Transaction.code,
             Transaction.af_bij,
-            Transaction.bedrag_eur,
+            Transaction.amount_cents,
             Transaction.mededelingen,
             Transaction.mutatiesoort,
-            Label.name.label('label')
+            Label.name.label('label'),
+            rank
         ).outerjoin(TransactionLabel, Transaction.id == TransactionLabel.transaction_id) \
-         .outerjoin(Label, TransactionLabel.label_id == Label.id)
-
-        if month_start:
-            month_start_date = pd.to_datetime(month_start).date()
-            query = query.filter(func.date_trunc('month', Transaction.datum) == month_start_date)
-
-        transactions = query.all()
-
-        transaction_data = []
-        for transaction in transactions:
-            # Only check for time if mutatiesoort is 'Betaalautomaat' or 'iDEAL'
-            if transaction.mutatiesoort in ['Betaalautomaat', 'iDEAL']:
-                # Search for time pattern (HH:MM) in 'mededelingen'
-                time_match = re.search(r'\b([01]?[0-9]|2[0-3]):[0-5][0-9]\b', transaction.mededelingen)
-                if time_match:
-                    time_str = time_match.group(0)
-                    # Combine date and time
-                    datetime_obj = datetime.combine(transaction.datum, datetime.strptime(time_str, '%H:%M').time())
-                    datum_with_time = datetime_obj.strftime('%d-%m-%Y %H:%M')
-                else:
-                    datum_with_time = transaction.datum.strftime('%d-%m-%Y')
-            else:
-                datum_with_time = transaction.datum.strftime('%d-%m-%Y')
-            
-            # Get the suggested label from the model
-            # Prepare input for the model (you might need to adjust the input format based on your model)
-            model_input = [transaction.company]  # Assuming company is used for prediction
-            suggested_label = custom_model.predict(model_input)[0]  # Predict label
-            label_probabilities = custom_model.predict_proba(model_input)[0]  # Get probabilities for all labels
-
-            # Find the index of the suggested label
-            label_classes = custom_model.classes_  # Get the list of all labels
-            suggested_label_index = list(label_classes).index(suggested_label)
-            suggested_label_probability = label_probabilities[suggested_label_index]  # Get probability for the suggested label
-
-            logging.info(f"Model input: {model_input}")
-            logging.info(f"Predicted probabilities: {label_probabilities}")
-
-            transaction_data.append({
-                'id': transaction.id,
-                'datum': datum_with_time,
-                'company': transaction.company,
-                'rekening': transaction.rekening,
-                'tegenrekening': transaction.tegenrekening,
-                'code': transaction.code,
-                'af_bij': transaction.af_bij,
-                'bedrag_eur': transaction.bedrag_eur,
-                'mededelingen': transaction.mededelingen,
-                'mutatiesoort': transaction.mutatiesoort,
-                'label': transaction.label,
-                'suggested_label': suggested_label,
-                'label_probability': suggested_label_probability  # Store only the probability for the suggested label
-            })
-
-        return transaction_data
+         .outerjoin(Label, TransactionLabel.label_id == Label.id) \
+         .filter(match)
+        query = filter_date_range(query, start, end)
+
+        rows = query.order_by(rank.desc(), Transaction.datum.desc(), Transaction.id.desc()) \
+                    .offset((page - 1) * per_page).limit(per_page + 1).all()
+
+        results = [{
+            'id': row.id,
+            'datum': row.datum.strftime('%d-%m-%Y'),
+            'company': row.company,
+            'rekening': row.rekening,
+            'af_bij': row.af_bij,
+            'bedrag_eur': cents_to_decimal(abs(row.amount_cents)),
+            'mededelingen': row.mededelingen,
+            'mutatiesoort': row.mutatiesoort,
+            'label': row.label,
+            'rank': round(float(row.rank), 4),
+        } for row in rows[:per_page]]
+
+        return {'results': results, 'page': page, 'per_page': per_page, 'has_more': len(rows) > per_page}
     except Exception as e:
         session.rollback()
-        logging.error(f"Error fetching transactions: {e}")
+        logger.error("Error searching transactions: %s", e)
         raise e
     finally:
         session.close()
 
 
-def fetch_chart_data():
-    session = get_session()
+def _category_with_descendants(session, name):
+    """Ids of the category called `name` and every category below it."""
+    categories = session.query(LabelCategory.id, LabelCategory.name, LabelCategory.parent_id).all()
+    selected = {category.id for category in categories if category.name == name}
+    if not selected:
+        raise ValueError(f'Category "{name}" not found')
+    added = selected
+    while added:
+        added = {category.id for category in categories if category.parent_id in added} - selected
+        selected |= added
+    return selected
+
+def iter_export_batches(start=None, end=None, category=None, batch_size=5000):
+    """Iterator over lists of transaction rows with their label and category, oldest first.
+
+    Rows come from a server-side cursor (yield_per) `batch_size` at a time, so
+    memory use doesn't grow with the table. `category` limits the export to
+    transactions labeled within that category or any of its subcategories.
+    """
+    session = get_session(read_only=True)
     try:
         query = session.query(
-            func.date_trunc('month', Transaction.datum).label('month'),
+            Transaction.id,
+            Transaction.datum,
+            Transaction.company,
+            Transaction.rekening,
+            Transaction.tegenrekening,
+            Transaction.code,
             Transaction.af_bij,
-            func.sum(Transaction.bedrag_eur).label('total')
-        ).group_by(
-            func.date_trunc('month', Transaction.datum),
-            Transaction.af_bij
-        ).order_by('month')
-        
-        result = query.all()
-        data = {'month': [], 'af_bij': [], 'total': []}
-        for row in result:
-            data['month'].append(row.month)
-            data['af_bij'].append(row.af_bij)
-            data['total'].append(row.total)
-        df = pd.DataFrame(data)
-        return df
+            Transaction.amount_cents,
+            Transaction.mutatiesoort,
+            Transaction.mededelingen,
+            Label.name.label('label'),
+            LabelCategory.name.label('category')
+        ).outerjoin(TransactionLabel, Transaction.id == TransactionLabel.transaction_id) \
+         .outerjoin(Label, TransactionLabel.label_id == Label.id) \
+         .outerjoin(LabelCategory, Label.category_id == LabelCategory.id)
+
+        query = filter_date_range(query, start, end)
+        category_ids = None
+        if category:
+            category_ids = _category_with_descendants(session, category)
+            query = query.filter(Label.category_id.in_(category_ids))
+
+        # Archived years in range are read from their files between the live rows around them
+        archived = sorted(archived_years(session, start, end).items())
+        labels = {label.id: (label.name, label.category.name if label.category else None, label.category_id)
+                  for label in session.query(Label)} if archived else {}
+
+        result = session.execute(query.order_by(Transaction.datum, Transaction.id).statement
+                                 .execution_options(yield_per=batch_size))
     except Exception as e:
-        session.rollback()
-        raise e
-    finally:
         session.close()
+        logger.error("Error exporting transactions: %s", e)
+        raise e
+
+    def archived_batches(path):
+        table = read_files([path], start, end)
+        batch = []
+        for row in table.to_pylist():
+            label, category_name, category_id = labels.get(row['label_id'], (None, None, None))
+            if category_ids is not None and category_id not in category_ids:
+                continue
+            batch.append(ExportRow(*(row[column] for column in ExportRow._fields[:10]), label, category_name))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    # Errors above (e.g. an unknown category) surface before anything is streamed
+    def batches():
+        try:
+            pending = list(archived)
+            for partition in result.partitions():
+                done = 0
+                while pending and partition[-1].datum.year > pending[0][0]:
+                    year, path = pending.pop(0)
+                    cut = next((i for i in range(done, len(partition)) if partition[i].datum.year > year),
+                               len(partition))
+                    if cut > done:
+                        yield partition[done:cut]
+                        done = cut
+                    yield from archived_batches(path)
+                if done < len(partition):
+                    yield partition[done:]
+            for _, path in pending:
+                yield from archived_batches(path)
+        finally:
+            session.close()
+    return batches()
+
+def fetch_chart_data(start=None, end=None):
+    import pandas as pd
+    snapshot = get_transaction_store().snapshot()
+    months, is_credit, totals = month_direction_sums(snapshot, day_range_mask(snapshot, start, end))
+
+    data = {
+        'month': pd.to_datetime([month_key(month) for month in months]),
+        'af_bij': ['Bij' if credit else 'Af' for credit in is_credit],
+        'total': [cents_to_decimal(total) for total in totals]
+    }
+    df = pd.DataFrame(data)
+    return df
+
+def load_csv_data(paths=None):
+    """Import bank statement CSVs (default: the files matching IMPORT_GLOB).
+
+    Files are parsed by app/parsers.py, in parallel when there are several;
+    rows that already exist in the database or earlier in the batch are skipped.
+    """
+    from .parsers import CANONICAL, parse_files  # pandas; only needed for imports
+
+    if paths is None:
+        paths = sorted(glob.glob(current_app.config['IMPORT_GLOB']))
+        if not paths:
+            raise FileNotFoundError(f"No files match {current_app.config['IMPORT_GLOB']}")
+    frames = parse_files(paths)
 
-def load_csv_data():
     session = get_session()
-    total_lines = 0
+    total_lines = sum(len(frame) for frame in frames)
     new_lines = 0
     existing_lines = 0
+    new_values = []
 
     try:
+        # The partitions of every month in the files, before the long import
+        # transaction takes any lock (see partitions.py); archived years are skipped
+        closed = set(archived_years(session))
+        session.rollback()
+        create_partitions(current_app.engine, {day for frame in frames for day in frame['datum'].unique()
+                                               if day.year not in closed})
+
         with session.begin():  # Begin a transaction
-            with open('data.csv', 'r', encoding='utf-8') as file:  # Added encoding
-                reader = csv.DictReader(file)
-
-                # Strip whitespace from fieldnames just in case
-                reader.fieldnames = [field.strip() for field in reader.fieldnames]
-
-                # Ensure 'Bedrag (EUR)' is in the headers
-                if 'Bedrag (EUR)' not in reader.fieldnames:
-                    raise ValueError("Column 'Bedrag (EUR)' not found in CSV file.")
-
-                for row in reader:
-                    total_lines += 1
-
-                    bedrag_eur = row['Bedrag (EUR)'].replace(',', '.')  # Replace comma with period
-
-                    # Convert date string to a datetime object
-                    datum = datetime.strptime(row['Datum'], '%Y%m%d').date()
-
-                    # Check if the record already exists
-                    exists = session.query(Transaction.id).filter_by(
-                        datum=datum,
-                        company=row['Naam / Omschrijving'],
-                        rekening=row['Rekening'],
-                        tegenrekening=row['Tegenrekening'],
-                        code=row['Code'],
-                        af_bij=row['Af Bij'],
-                        bedrag_eur=bedrag_eur,
-                        mutatiesoort=row['Mutatiesoort'],
-                        mededelingen=row['Mededelingen']
-                    ).first()
-
-                    if not exists:
-                        # Insert new record
-                        new_transaction = Transaction(
-                            datum=datum,
-                            company=row['Naam / Omschrijving'],
-                            rekening=row['Rekening'],
-                            tegenrekening=row['Tegenrekening'],
-                            code=row['Code'],
-                            af_bij=row['Af Bij'],
-                            bedrag_eur=bedrag_eur,
-                            mutatiesoort=row['Mutatiesoort'],
-                            mededelingen=row['Mededelingen']
-                        )
-                        session.add(new_transaction)
-                        new_lines += 1
-                    else:
-                        existing_lines += 1
+            dates = [frame['datum'] for frame in frames if len(frame)]
+            if dates:
+                # One query for the keys of every transaction in the covered date
+                # range, instead of an existence check per row
+                first, last = min(d.min() for d in dates), max(d.max() for d in dates)
+                key_columns = [getattr(Transaction, column) for column in CANONICAL]
+                seen = set(map(tuple, session.query(*key_columns).filter(Transaction.datum >= first, Transaction.datum <= last)))
+                archived = read_rows(session, first, last + timedelta(days=1), CANONICAL)
+                if archived is not None:
+                    seen.update(zip(*(archived.column(column).to_pylist() for column in CANONICAL)))
+
+                for frame in frames:
+                    for record in frame.itertuples(index=False, name=None):
+                        if record in seen:
+                            existing_lines += 1
+                            continue
+                        seen.add(record)
+                        values = dict(zip(CANONICAL, record))
+                        values['amount_cents'] = int(values['amount_cents'])
+                        new_values.append(values)
+
+            new_rows = []
+            versions = {}
+            if new_values:
+                closed = sorted({values['datum'].year for values in new_values} & set(archived_years(session)))
+                if closed:
+                    raise ValueError(f"New transactions dated in archived year(s) {', '.join(map(str, closed))}; "
+                                     f"restore them first (flask --app app restore-transactions YEAR)")
+                new_lines = len(new_values)
+                # Normally created above already; this only reads the catalog
+                ensure_partitions(session.connection(), {values['datum'] for values in new_values})
+                # Bulk insert; ids come back in parameter order for the columnar store
+                ids = session.execute(
+                    insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True), new_values
+                ).scalars().all()
+                new_rows = [(transaction_id, values['datum'], values['amount_cents'], values['rekening'], None)
+                            for transaction_id, values in zip(ids, new_values)]
+                versions = publish(session, 'transactions')
+                # Backdated rows change every later balance checkpoint
+                invalidate_checkpoints(session, min(values['datum'] for values in new_values))
 
         session.commit()  # Commit the transaction
-        logging.info(f"CSV data loaded successfully: {new_lines} new lines, {existing_lines} existing lines out of {total_lines} total lines.")
+
+        store = peek_store()
+        if store:
+            store.append(new_rows)
+            store.note_own_write(versions)
+        if new_values:
+            try:
+                refresh_labeling_queue({normalize(values['company']) for values in new_values})
+            except Exception as e:
+                # The import itself succeeded; `flask --app app refresh-labeling-queue` catches up
+                logger.warning("Labeling queue not updated after import: %s", e)
+            try:
+                rebuild_balance_checkpoints()
+            except Exception as e:
+                # Balances stay correct, summing from the last checkpoint before the import
+                logger.warning("Balance checkpoints not rebuilt after import: %s", e)
+        logger.info("CSV data loaded successfully: %s new lines, %s existing lines out of %s total lines.", new_lines, existing_lines, total_lines)
     except Exception as e:
         session.rollback()  # Rollback the transaction if an exception occurs
-        logging.error(f"Error loading CSV data: {e}")
+        logger.error("Error loading CSV data: %s", e)
         raise e
     finally:
         session.close()
@@ -253,6 +814,137 @@ def load_csv_data():
     }
 
 
+def rebuild_balance_checkpoints(full=False):
+    """Add the missing monthly balance checkpoints (see balances.py); `full` recomputes all of them."""
+    session = get_session()
+    try:
+        if full:
+            invalidate_checkpoints(session, date.min)
+        written = rebuild_checkpoints(session)
+        session.commit()
+        logger.info("Balance checkpoints rebuilt: %d written", written)
+        return written
+    except Exception as e:
+        session.rollback()
+        logger.error("Error rebuilding balance checkpoints: %s", e)
+        raise e
+    finally:
+        session.close()
+
+def fetch_balances(day=None, rekening=None):
+    """Balance per account at the end of `day` (default today)."""
+    day = day or date.today()
+    session = get_session(read_only=True)
+    try:
+        balances = balances_at(session, day + timedelta(days=1), rekening)
+        return {
+            'date': day.isoformat(),
+            'balances': {account: cents_to_decimal(cents) for account, cents in sorted(balances.items())},
+        }
+    except Exception as e:
+        session.rollback()
+        logger.error("Error fetching balances: %s", e)
+        raise e
+    finally:
+        session.close()
+
+def fetch_balance_series(start=None, end=None, rekening=None, interval='month'):
+    """Balance per account at the end of every day or month in [start, end), by default all history."""
+    session = get_session(read_only=True)
+    try:
+        if start is None or end is None:
+            first, last = session.query(func.min(Transaction.datum), func.max(Transaction.datum)).one()
+            archived_first, archived_last = session.query(func.min(ArchivedMonthTotal.month),
+                                                          func.max(ArchivedMonthTotal.month)).one()
+            first = min(filter(None, [first, archived_first]), default=None)
+            if archived_last is not None:
+                last = max(filter(None, [last, (archived_last + timedelta(days=31)).replace(day=1) - timedelta(days=1)]))
+            if first is None:
+                return {'interval': interval, 'dates': [], 'balances': {}}
+            start = start or first
+            end = end or last + timedelta(days=1)
+        dates, series = balance_series(session, start, end, rekening, interval)
+        return {
+            'interval': interval,
+            'dates': [day.isoformat() for day in dates],
+            'balances': {account: [cents_to_decimal(cents) for cents in values] for account, values in series.items()},
+        }
+    except Exception as e:
+        session.rollback()
+        logger.error("Error fetching balance series: %s", e)
+        raise e
+    finally:
+        session.close()
+
+def archive_transactions(before_year):
+    """Archive every year before `before_year` that still has transactions (see archive.py).
+
+    Each year is moved in its own database transaction. Returns {year: transactions archived}.
+    """
+    if before_year > date.today().year:
+        raise ValueError('Only past years can be archived')
+    archive_dir = current_app.config['ARCHIVE_DIR']
+    if not archive_dir or not os.path.isabs(archive_dir):
+        # The files become the only copy of the rows: not on a pod's own filesystem
+        raise ValueError('ARCHIVE_DIR must be set to an absolute path on shared, persistent storage')
+    session = get_session(read_only=True)
+    try:
+        first = session.query(func.min(Transaction.datum)).scalar()
+    finally:
+        session.close()
+    if first is None:
+        return {}
+
+    archived = {}
+    for year in range(first.year, before_year):
+        session = get_session()
+        path = None
+        try:
+            count, path = archive_year(session, year)
+            session.commit()
+            if count:
+                archived[year] = count
+                logger.info("Archived %d transactions of %d to %s", count, year, path)
+        except Exception as e:
+            session.rollback()
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+            logger.error("Error archiving %d: %s", year, e)
+            raise e
+        finally:
+            session.close()
+
+    if archived:
+        try:
+            refresh_labeling_queue()
+        except Exception as e:
+            logger.warning("Labeling queue not updated after archiving: %s", e)
+    return archived
+
+def restore_archived_year(year):
+    """Move an archived year back into the transactions table. Returns the number of transactions."""
+    create_partitions(current_app.engine, month_range(date(year, 1, 1), date(year, 12, 31)))
+    session = get_session()
+    try:
+        count, path = restore_year(session, year)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error("Error restoring %d: %s", year, e)
+        raise e
+    finally:
+        session.close()
+
+    # The manifest no longer lists the file once committed
+    os.remove(path)
+    logger.info("Restored %d transactions of %d from %s", count, year, path)
+    try:
+        refresh_labeling_queue()
+    except Exception as e:
+        logger.warning("Labeling queue not updated after restoring: %s", e)
+    return count
+
+
 def create_tables():
     session = get_session()
     try:
@@ -320,146 +1012,119 @@ def create_tables():
                 session.flush()
 
             session.commit()
-            logging.info("Tables and initial data created successfully.")
+            logger.info("Tables and initial data created successfully.")
         else:
-            logging.info("Labels already exist.")
+            logger.info("Labels already exist.")
     except Exception as e:
         session.rollback()
-        logging.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
     finally:
         session.close()
 
 def get_ordered_labels_as_dataframe():
-    session = get_session()
+    session = get_session(read_only=True)
     try:
         # Fetch all labels and categories from the database
         labels = session.query(Label).all()
         categories = session.query(LabelCategory).all()
-
-        # Prepare the label and category data with their respective fields
-        label_data = [{'id': label.id, 'name': label.name, 'category_id': label.category_id, 'type': 'label'} for label in labels]
-        category_data = [{'id': category.id, 'name': category.name, 'parent_id': category.parent_id, 'type': 'category'} for category in categories]
-
-        # Create a dictionary of categories for easy lookup
-        category_dict = {cat['id']: cat for cat in category_data}
-
-        # Recursive function to build the tree structure
-        def build_tree(category_id):
-            category = category_dict.get(category_id)
-            if not category:
-                return None
-            # Recursively build the tree for child categories
-            children = [build_tree(cat['id']) for cat in category_data if cat['parent_id'] == category_id]
-            return {
-                'id': category['id'],
-                'name': category['name'],
-                'type': 'category',  # Explicitly mark this as a category
-                'children': [child for child in children if child]  # Filter out None values
-            }
-
-        # Find the root categories (those without a parent)
-        roots = [build_tree(cat['id']) for cat in category_data if cat['parent_id'] is None]
-
-        # Function to append labels to each category node
-        def append_labels(node):
-            if 'id' in node:
-                node['labels'] = [label for label in label_data if label['category_id'] == node['id']]
-            # Recursively append labels to child nodes
-            for child in node.get('children', []):
-                append_labels(child)
-
-        # Attach labels to each root category
-        for root in roots:
-            append_labels(root)
-
-        return roots
-
+        return _build_label_tree(labels, categories)
     finally:
         session.close()
 
 
-def fetch_transactions_by_label_and_month():
-    session = get_session()
-    try:
-        # Query to fetch transactions with their labels
-        logging.info("Fetching transactions from the database")
-        query = session.query(
-            Transaction.datum,
-            Transaction.bedrag_eur,
-            Label.name.label('label')
-        ).outerjoin(TransactionLabel, Transaction.id == TransactionLabel.transaction_id) \
-         .outerjoin(Label, TransactionLabel.label_id == Label.id)
+def _build_label_tree(labels, categories):
+    # Prepare the label and category data with their respective fields
+    label_data = [{'id': label.id, 'name': label.name, 'category_id': label.category_id, 'type': 'label'} for label in labels]
+    category_data = [{'id': category.id, 'name': category.name, 'parent_id': category.parent_id, 'type': 'category'} for category in categories]
 
-        transactions = query.all()
-        logging.info(f"Fetched {len(transactions)} transactions")
+    # Create a dictionary of categories for easy lookup
+    category_dict = {cat['id']: cat for cat in category_data}
 
-        # Create a DataFrame from the transactions
-        data = {
-            'datum': [transaction.datum for transaction in transactions],
-            'bedrag_eur': [transaction.bedrag_eur for transaction in transactions],
-            'label': [transaction.label for transaction in transactions]
+    # Recursive function to build the tree structure
+    def build_tree(category_id):
+        category = category_dict.get(category_id)
+        if not category:
+            return None
+        # Recursively build the tree for child categories
+        children = [build_tree(cat['id']) for cat in category_data if cat['parent_id'] == category_id]
+        return {
+            'id': category['id'],
+            'name': category['name'],
+            'type': 'category',  # Explicitly mark this as a category
+            'children': [child for child in children if child]  # Filter out None values
         }
-        df = pd.DataFrame(data)
-        logging.info("Created DataFrame from transactions")
 
-        # Ensure 'datum' is parsed correctly
-        def parse_date(date_val):
-            try:
-                if isinstance(date_val, date):  # If date_val is already a datetime.date object
-                    return pd.to_datetime(date_val)
-                elif isinstance(date_val, str):
-                    if len(date_val) == 8:  # Format YYYYMMDD
-                        return pd.to_datetime(date_val, format='%Y%m%d')
-                    else:
-                        return pd.to_datetime(date_val)  # Default parser
-                else:
-                    return pd.NaT  # Return NaT (Not a Time) for invalid cases
-            except Exception as e:
-                logging.error(f"Error parsing date: {date_val} - {e}")
-                return pd.NaT
+    # Find the root categories (those without a parent)
+    roots = [build_tree(cat['id']) for cat in category_data if cat['parent_id'] is None]
 
-        df['datum'] = df['datum'].apply(parse_date)
-        logging.info("Parsed 'datum' column to datetime")
+    # Function to append labels to each category node
+    def append_labels(node):
+        if 'id' in node:
+            node['labels'] = [label for label in label_data if label['category_id'] == node['id']]
+        # Recursively append labels to child nodes
+        for child in node.get('children', []):
+            append_labels(child)
 
-        # Drop rows with invalid dates
-        df = df.dropna(subset=['datum'])
-        logging.info(f"Filtered DataFrame to remove rows with invalid dates, resulting in {len(df)} records")
+    # Attach labels to each root category
+    for root in roots:
+        append_labels(root)
 
-        # Add 'month' and 'year' columns
-        df['month'] = df['datum'].dt.month_name()
-        df['year'] = df['datum'].dt.year
-        logging.info("Added 'month' and 'year' columns")
+    return roots
 
-        # Filter the DataFrame for the specific year (if required)
-        df = df[df['year'] == 2024]  # Assuming we are interested in the year 2024
-        logging.info(f"Filtered DataFrame for the year 2024, resulting in {len(df)} records")
 
-        # Group by 'label' and 'month', then sum 'bedrag_eur'
-        summary = df.groupby(['label', 'month'])['bedrag_eur'].sum().unstack(fill_value=0)
-        logging.info("Grouped and summed DataFrame by 'label' and 'month'")
+def _label_names(session):
+    return {label.id: label.name for label in session.query(Label.id, Label.name)}
+
+def fetch_transactions_by_label_and_month(start=None, end=None):
+    session = get_session(read_only=True)
+    try:
+        label_names = _label_names(session)
+        snapshot = get_transaction_store().snapshot()
+
+        # The summary has one column per month name, so it covers one calendar
+        # year: by default that of the most recent transaction, else the year
+        # of whichever bound is given
+        if start is None and end is None:
+            if not len(snapshot):
+                return []
+            year = np.datetime64(int(snapshot.day.max()), 'D').astype(object).year
+            start, end = date(year, 1, 1), date(year + 1, 1, 1)
+        elif end is None:
+            end = date(start.year + 1, 1, 1)
+        elif start is None:
+            start = date((end - timedelta(days=1)).year, 1, 1)
+        if start.year != (end - timedelta(days=1)).year:
+            raise ValueError('The summary covers one calendar year; from and to must be in the same year')
+        mask = day_range_mask(snapshot, start, end)
+
+        # Sum the cents per label and month
+        label_ids, months, totals = label_month_sums(snapshot, mask)
+        logger.debug("Grouped and summed transactions by 'label' and 'month'")
 
-        # Ensure all months are present
         all_months = ['January', 'February', 'March', 'April', 'May', 'June', 
                       'July', 'August', 'September', 'October', 'November', 'December']
-        summary = summary.reindex(columns=all_months, fill_value=0)
-        logging.info("Reindexed summary to ensure all months are present")
-
-        # Reset index to make 'label' a column again
-        summary = summary.reset_index()
-        logging.info("Reset index to make 'label' a column")
-
-        result = summary.to_dict(orient='records')
-        logging.info(f"Final summary: {result}")
+        summary = {}
+        for label_id, month, total in zip(label_ids, months, totals):
+            name = label_names.get(int(label_id))
+            if name is not None:
+                summary.setdefault(name, [0] * 12)[int(month) % 12] = total
+
+        # Convert cents to euros once, while building the records
+        result = [
+            {'label': name, **{month: cents_to_decimal(cents) if cents else 0 for month, cents in zip(all_months, summary[name])}}
+            for name in sorted(summary)
+        ]
+        logger.debug("Final summary: %s", result)
 
         return result
 
     except Exception as e:
         session.rollback()
-        logging.error(f"Error fetching transactions by label and month: {e}")
+        logger.error("Error fetching transactions by label and month: %s", e)
         raise e
     finally:
         session.close()
-        logging.info("Database session closed")
+        logger.debug("Database session closed")
 
 def update_label_order(label_order_data):
     session = get_session()
@@ -488,11 +1153,12 @@ def update_label_order(label_order_data):
         for category in label_order_data:
             process_node(category, parent_category_id=None)
 
+        publish(session, 'labels', 'label_categories')
         session.commit()
-        logging.info("Label order and categories updated successfully in the database.")
+        logger.info("Label order and categories updated successfully in the database.")
     except Exception as e:
         session.rollback()
-        logging.error(f"Error updating label order and categories: {e}")
+        logger.error("Error updating label order and categories: %s", e)
         raise e
     finally:
         session.close()
@@ -507,11 +1173,12 @@ def add_label_to_db(name, category_id=None):
 
         label_id = new_label.id  # Retrieve the ID of the newly inserted label
 
+        publish(session, 'labels')
         session.commit()  # Commit the transaction
-        logging.info(f"Label '{name}' inserted successfully with ID {label_id}.")
+        logger.info("Label '%s' inserted successfully with ID %s.", name, label_id)
     except Exception as e:
         session.rollback()  # Rollback if there is an error
-        logging.error(f"Error inserting label '{name}' into the database: {e}")
+        logger.error("Error inserting label '%s' into the database: %s", name, e)
         raise e
     finally:
         session.close()
@@ -528,212 +1195,111 @@ def add_category_to_db(name):
 
         category_id = new_category.id  # Retrieve the ID of the newly inserted category
 
+        publish(session, 'label_categories')
         session.commit()  # Commit the transaction
-        logging.info(f"Category '{name}' inserted successfully with ID {category_id}.")
+        logger.info("Category '%s' inserted successfully with ID %s.", name, category_id)
     except Exception as e:
         session.rollback()  # Rollback if there is an error
-        logging.error(f"Error inserting category '{name}' into the database: {e}")
+        logger.error("Error inserting category '%s' into the database: %s", name, e)
         raise e
     finally:
         session.close()
     
     return category_id
-def fetch_transaction_sums_per_label_per_month():
+def fetch_transaction_sums_per_label_per_month(start=None, end=None):
 
-    session = get_session()
+    session = get_session(read_only=True)
     try:
-        query = session.query(
-            Transaction.id,
-            Transaction.datum,
-            Transaction.company,
-            Transaction.rekening,
-            Transaction.tegenrekening,
-            Transaction.code,
-            Transaction.af_bij,
-            Transaction.bedrag_eur,
-            Transaction.mededelingen,
-            Transaction.mutatiesoort,
-            Label.name.label('label')
-        ).outerjoin(TransactionLabel, Transaction.id == TransactionLabel.transaction_id) \
-         .outerjoin(Label, TransactionLabel.label_id == Label.id)
-
-        transactions = query.all()
-
-        # Prepare data for aggregation
-        transaction_data = []
-        for transaction in transactions:
-            # Only check for time if mutatiesoort is 'Betaalautomaat' or 'iDEAL'
-            if transaction.mutatiesoort in ['Betaalautomaat', 'iDEAL']:
-                # Search for time pattern (HH:MM) in 'mededelingen'
-                time_match = re.search(r'\b([01]?[0-9]|2[0-3]):[0-5][0-9]\b', transaction.mededelingen)
-                if time_match:
-                    time_str = time_match.group(0)
-                    # Combine date and time
-                    datetime_obj = datetime.combine(transaction.datum, datetime.strptime(time_str, '%H:%M').time())
-                    datum_with_time = datetime_obj.strftime('%d-%m-%Y %H:%M')
-                else:
-                    datum_with_time = transaction.datum.strftime('%d-%m-%Y')
-            else:
-                datum_with_time = transaction.datum.strftime('%d-%m-%Y')
-            
-
-            transaction_data.append({
-                'datum': transaction.datum,
-                'label': transaction.label,
-                'bedrag_eur': transaction.bedrag_eur
-            })
-
-        # Convert to DataFrame for easy aggregation
-        df = pd.DataFrame(transaction_data)
+        label_names = _label_names(session)
+        snapshot = get_transaction_store().snapshot()
 
-        # Ensure 'datum' is a datetime object
-        df['datum'] = pd.to_datetime(df['datum'])
+        # Sum the cents per label and month
+        label_ids, months, totals = label_month_sums(snapshot, day_range_mask(snapshot, start, end))
 
-        # Extract year and month for grouping
-        df['year_month'] = df['datum'].dt.to_period('M')
-
-        # Group by label and year_month, then sum the amounts
-        aggregated = df.groupby(['label', 'year_month'])['bedrag_eur'].sum().reset_index()
-
-        # Convert year_month back to string for JSON serialization
-        aggregated['year_month'] = aggregated['year_month'].astype(str)
-
-        # Convert to list of dictionaries
-        result = aggregated.to_dict(orient='records')
-
-        return jsonify(result)
+        return jsonify(_label_month_rows(label_names, label_ids, months, totals))
     except Exception as e:
         session.rollback()
-        logging.error(f"Error fetching transaction sums: {e}")
+        logger.error("Error fetching transaction sums: %s", e)
         raise e
     finally:
         session.close()
 
-def get_reserveringsuitgaven_sum_per_month():
-    session = get_session()
+def _label_month_rows(label_names, label_ids, months, totals):
+    # Convert to list of dictionaries, cents to euros once per group
+    result = [
+        {'label': label_names[int(label_id)], 'year_month': month_key(month), 'bedrag_eur': cents_to_decimal(total)}
+        for label_id, month, total in zip(label_ids, months, totals)
+        if int(label_id) in label_names
+    ]
+    result.sort(key=lambda row: (row['label'], row['year_month']))
+    return result
+
+def get_reserveringsuitgaven_sum_per_month(start=None, end=None):
+    session = get_session(read_only=True)
     try:
         # Get the LabelCategory object for 'RESERVERINGSUITGAVEN'
         reserveringsuitgaven_category = session.query(LabelCategory).filter(LabelCategory.name == 'RESERVERINGSUITGAVEN').first()
         if not reserveringsuitgaven_category:
             raise ValueError("Category 'RESERVERINGSUITGAVEN' not found")
 
-        # Get the labels linked to this category
-        labels = reserveringsuitgaven_category.labels
-
-        # Get the names of the labels
-        label_names = [label.name for label in labels]
-
-        # Fetch transactions for these labels
-        query = session.query(
-            Transaction.datum,
-            Transaction.bedrag_eur,
-            Label.name.label('label')
-        ).join(TransactionLabel, Transaction.id == TransactionLabel.transaction_id) \
-         .join(Label, TransactionLabel.label_id == Label.id) \
-         .filter(Label.name.in_(label_names))
-
-        transactions = query.all()
-        logging.info(f"Fetched {len(transactions)} transactions")
-
-        # Create a DataFrame from the transactions
-        data = {
-            'datum': [transaction.datum for transaction in transactions],
-            'bedrag_eur': [transaction.bedrag_eur for transaction in transactions],
-            'label': [transaction.label for transaction in transactions]
-        }
-        df = pd.DataFrame(data)
-        logging.info("Created DataFrame from transactions")
-
-        # Ensure 'datum' is parsed correctly
-        def parse_date(date_val):
-            try:
-                if isinstance(date_val, date):  # If date_val is already a datetime.date object
-                    return pd.to_datetime(date_val)
-                elif isinstance(date_val, str):
-                    if len(date_val) == 8:  # Format YYYYMMDD
-                        return pd.to_datetime(date_val, format='%Y%m%d')
-                    else:
-                        return pd.to_datetime(date_val)  # Default parser
-                else:
-                    return pd.NaT  # Return NaT (Not a Time) for invalid cases
-            except Exception as e:
-                logging.error(f"Error parsing date: {date_val} - {e}")
-                return pd.NaT
-
-        df['datum'] = df['datum'].apply(parse_date)
-        logging.info("Parsed 'datum' column to datetime")
-
-        # Drop rows with invalid dates
-        df = df.dropna(subset=['datum'])
-        logging.info(f"Filtered DataFrame to remove rows with invalid dates, resulting in {len(df)} records")
-
-        # Extract year and month for grouping
-        df['year_month'] = df['datum'].dt.to_period('M')
-
-        # Group by year_month and sum the amounts
-        aggregated = df.groupby(['year_month'])['bedrag_eur'].sum().reset_index()
+        # Get the IDs of the labels linked to this category
+        label_ids = [label.id for label in reserveringsuitgaven_category.labels]
 
-        # Convert year_month back to string for JSON serialization
-        aggregated['year_month'] = aggregated['year_month'].astype(str)
+        # Sum the cents per month for transactions with these labels
+        snapshot = get_transaction_store().snapshot()
+        mask = combine_masks(np.isin(snapshot.label, label_ids), day_range_mask(snapshot, start, end))
+        months, totals = month_sums(snapshot, mask)
 
-        # Convert to list of dictionaries
-        result = aggregated.to_dict(orient='records')
+        # Convert to list of dictionaries, cents to euros once per month
+        result = [
+            {'year_month': month_key(month), 'bedrag_eur': cents_to_decimal(total)}
+            for month, total in zip(months, totals)
+        ]
 
         return jsonify(result)
     except Exception as e:
         session.rollback()
-        logging.error(f"Error fetching RESERVERINGSUITGAVEN transaction sums: {e}")
+        logger.error("Error fetching RESERVERINGSUITGAVEN transaction sums: %s", e)
         raise e
     finally:
         session.close()
 
 
-def get_expenses_per_main_category():
-    session = get_session()
+def get_expenses_per_main_category(start=None, end=None):
+    session = get_session(read_only=True)
     sys.setrecursionlimit(1500)
     try:
-        logging.info("Fetching UITGAVEN category")
+        logger.debug("Fetching UITGAVEN category")
 
         # Get the LabelCategory object for 'UITGAVEN'
         uitgaven_category = session.query(LabelCategory).filter(LabelCategory.name == 'UITGAVEN').first()
         if not uitgaven_category:
             raise ValueError("Category 'UITGAVEN' not found")
 
-        logging.info(f"Fetched UITGAVEN category with ID: {uitgaven_category.id}")
+        logger.debug("Fetched UITGAVEN category with ID: %s", uitgaven_category.id)
 
         # Get the first-level children of the 'UITGAVEN' category
         first_level_children = session.query(LabelCategory).filter(LabelCategory.parent_id == uitgaven_category.id).all()
 
-        logging.info(f"Fetched {len(first_level_children)} first-level children of UITGAVEN category")
+        logger.info("Fetched %d first-level children of UITGAVEN category", len(first_level_children))
 
         results = []
+        snapshot = get_transaction_store().snapshot()
+        range_mask = day_range_mask(snapshot, start, end)
 
         for child in first_level_children:
-            logging.info(f"Processing child category: {child.name}")
-
-            # Get the labels linked to this child category
-            labels = child.labels
-
-            # Get the names of the labels
-            label_names = [label.name for label in labels]
+            logger.debug("Processing child category: %s", child.name)
 
-            logging.info(f"Fetched {len(label_names)} labels for child category: {child.name}")
+            # Get the IDs of the labels linked to this child category
+            label_ids = [label.id for label in child.labels]
 
-            # Fetch transactions for these labels
-            query = session.query(
-                func.date_trunc('month', Transaction.datum).label('month'),
-                func.sum(Transaction.bedrag_eur).label('total_amount')
-            ).join(TransactionLabel, Transaction.id == TransactionLabel.transaction_id) \
-             .join(Label, TransactionLabel.label_id == Label.id) \
-             .filter(Label.name.in_(label_names)) \
-             .group_by(func.date_trunc('month', Transaction.datum))
+            logger.debug("Fetched %d labels for child category: %s", len(label_ids), child.name)
 
-            transactions = query.all()
-
-            logging.info(f"Fetched {len(transactions)} transactions for child category: {child.name}")
+            # Sum the cents per month for transactions with these labels
+            months, totals = month_sums(snapshot, combine_masks(np.isin(snapshot.label, label_ids), range_mask))
 
             # Convert results to list of dictionaries
-            monthly_sums = [{'month': transaction.month.strftime('%Y-%m'), 'total_amount': transaction.total_amount} for transaction in transactions]
+            monthly_sums = [{'month': month_key(month), 'total_amount': cents_to_decimal(total)} for month, total in zip(months, totals)]
 
             results.append({
                 'category': child.name,
@@ -743,13 +1309,13 @@ def get_expenses_per_main_category():
         return jsonify(results)
     except Exception as e:
         session.rollback()
-        logging.error(f"Error fetching UITGAVEN transaction sums: {e}")
+        logger.error("Error fetching UITGAVEN transaction sums: %s", e)
         raise e
     finally:
         session.close()
 
-def fetch_transactions_overview():
-    session = get_session()
+def fetch_transactions_overview(start=None, end=None):
+    session = get_session(read_only=True)
 
     try:
         # Fetch all categories
@@ -758,24 +1324,46 @@ def fetch_transactions_overview():
         # Fetch all labels
         labels = session.query(Label).all()
 
-        # Fetch all transactions and sum the total values per month per label
-        transactions = session.query(
-            TransactionLabel.label_id,
-            func.date_trunc('month', Transaction.datum).label('month'),
-            func.sum(Transaction.bedrag_eur).label('total_amount')
-        ).join(Transaction, Transaction.id == TransactionLabel.transaction_id) \
-         .group_by(TransactionLabel.label_id, func.date_trunc('month', Transaction.datum)).all()
+        # Sum the cents per month per label from the columnar store
+        snapshot = get_transaction_store().snapshot()
+        label_ids, months, totals = label_month_sums(snapshot, day_range_mask(snapshot, start, end))
 
-        # Create a dictionary to hold the categories
-        category_dict = {category.id: category for category in categories}
+        return jsonify(_build_overview(categories, labels, label_ids, months, totals))
+    except Exception as e:
+        session.rollback()
+        logger.error("Error in fetch_transactions_overview: %s", e, exc_info=True)
+        raise e
+    finally:
+        session.close()
 
-        # Create a nested dictionary to represent the hierarchical structure
-        overview = []
 
-        def add_category_to_overview(category):
-            if category.parent_id is None:
-                if not any(cat['name'] == category.name for cat in overview):
-                    overview.append({
+def _build_overview(categories, labels, label_ids, months, totals):
+    """Category tree with per-label and per-category totals, from label_month_sums() output."""
+    # Create a dictionary to hold the categories
+    category_dict = {category.id: category for category in categories}
+
+    # Create a nested dictionary to represent the hierarchical structure
+    overview = []
+
+    def add_category_to_overview(category):
+        if category.parent_id is None:
+            if not any(cat['name'] == category.name for cat in overview):
+                overview.append({
+                    'name': category.name,
+                    'id': category.id,
+                    'parent_id': category.parent_id,
+                    'labels': [],
+                    'subcategories': [],
+                    'transactions_total': 0,
+                    'monthly_total': {}
+                })
+        else:
+            parent_category = category_dict.get(category.parent_id)
+            if parent_category:
+                parent_name = parent_category.name
+                parent_overview = find_category_in_overview(overview, parent_name)
+                if parent_overview:
+                    parent_overview['subcategories'].append({
                         'name': category.name,
                         'id': category.id,
                         'parent_id': category.parent_id,
@@ -784,85 +1372,134 @@ def fetch_transactions_overview():
                         'transactions_total': 0,
                         'monthly_total': {}
                     })
-            else:
-                parent_category = category_dict.get(category.parent_id)
-                if parent_category:
-                    parent_name = parent_category.name
-                    parent_overview = find_category_in_overview(overview, parent_name)
-                    if parent_overview:
-                        parent_overview['subcategories'].append({
-                            'name': category.name,
-                            'id': category.id,
-                            'parent_id': category.parent_id,
-                            'labels': [],
-                            'subcategories': [],
-                            'transactions_total': 0,
-                            'monthly_total': {}
-                        })
-
-        def find_category_in_overview(overview, category_name):
-            for category in overview:
-                if category['name'] == category_name:
-                    return category
-                result = find_category_in_overview(category['subcategories'], category_name)
-                if result:
-                    return result
-            return None
 
-        def add_label_to_category(label, transactions_dict):
-            category = category_dict.get(label.category_id)
-            if category:
-                category_overview = find_category_in_overview(overview, category.name)
-                if category_overview:
-                    transactions_total = sum(transactions_dict.get(label.id, {}).values())
-                    category_overview['labels'].append({
-                        'name': label.name,
-                        'id': label.id,
-                        'transactions_monthly': transactions_dict.get(label.id, {}),
-                        'transactions_total': transactions_total
-                    })
-                    category_overview['transactions_total'] += transactions_total
-                    for month, amount in transactions_dict.get(label.id, {}).items():
-                        if month not in category_overview['monthly_total']:
-                            category_overview['monthly_total'][month] = 0
-                        category_overview['monthly_total'][month] += amount
-
-        def update_category_totals(category):
-            for subcategory in category['subcategories']:
-                update_category_totals(subcategory)
-                category['transactions_total'] += subcategory['transactions_total']
-                for month, amount in subcategory['monthly_total'].items():
-                    if month not in category['monthly_total']:
-                        category['monthly_total'][month] = 0
-                    category['monthly_total'][month] += amount
-
-        # Sum transactions per label
-        transactions_dict = {}
-        for transaction in transactions:
-            label_id = transaction.label_id
-            month = transaction.month.strftime('%Y-%m')
-            if label_id not in transactions_dict:
-                transactions_dict[label_id] = {}
-            if month not in transactions_dict[label_id]:
-                transactions_dict[label_id][month] = 0
-            transactions_dict[label_id][month] += transaction.total_amount
-
-        # Add all categories to the overview
-        for category in categories:
-            add_category_to_overview(category)
-
-        # Add all labels to the appropriate categories
-        for label in labels:
-            add_label_to_category(label, transactions_dict)
-
-        # Update transactions_total and monthly_total for each category
+    def find_category_in_overview(overview, category_name):
         for category in overview:
-            update_category_totals(category)
-
-        return jsonify(overview)
+            if category['name'] == category_name:
+                return category
+            result = find_category_in_overview(category['subcategories'], category_name)
+            if result:
+                return result
+        return None
+
+    def add_label_to_category(label, transactions_dict):
+        category = category_dict.get(label.category_id)
+        if category:
+            category_overview = find_category_in_overview(overview, category.name)
+            if category_overview:
+                transactions_total = sum(transactions_dict.get(label.id, {}).values())
+                category_overview['labels'].append({
+                    'name': label.name,
+                    'id': label.id,
+                    'transactions_monthly': transactions_dict.get(label.id, {}),
+                    'transactions_total': transactions_total
+                })
+                category_overview['transactions_total'] += transactions_total
+                for month, amount in transactions_dict.get(label.id, {}).items():
+                    if month not in category_overview['monthly_total']:
+                        category_overview['monthly_total'][month] = 0
+                    category_overview['monthly_total'][month] += amount
+
+    def update_category_totals(category):
+        for subcategory in category['subcategories']:
+            update_category_totals(subcategory)
+            category['transactions_total'] += subcategory['transactions_total']
+            for month, amount in subcategory['monthly_total'].items():
+                if month not in category['monthly_total']:
+                    category['monthly_total'][month] = 0
+                category['monthly_total'][month] += amount
+
+    # Sum transactions per label
+    transactions_dict = {}
+    for label_id, month, total in zip(label_ids, months, totals):
+        transactions_dict.setdefault(int(label_id), {})[month_key(month)] = int(total)
+
+    # Add all categories to the overview
+    for category in categories:
+        add_category_to_overview(category)
+
+    # Add all labels to the appropriate categories
+    for label in labels:
+        add_label_to_category(label, transactions_dict)
+
+    # Update transactions_total and monthly_total for each category
+    for category in overview:
+        update_category_totals(category)
+
+    # Totals were summed as integer cents; convert to euros once for the response
+    def convert_cents(category):
+        category['transactions_total'] = cents_to_decimal(category['transactions_total']) if category['transactions_total'] else 0
+        category['monthly_total'] = {month: cents_to_decimal(amount) for month, amount in category['monthly_total'].items()}
+        for label in category['labels']:
+            label['transactions_total'] = cents_to_decimal(label['transactions_total']) if label['transactions_total'] else 0
+            label['transactions_monthly'] = {month: cents_to_decimal(amount) for month, amount in label['transactions_monthly'].items()}
+        for subcategory in category['subcategories']:
+            convert_cents(subcategory)
+
+    for category in overview:
+        convert_cents(category)
+
+    return overview
+
+
+def _chart_series(months, is_credit, totals):
+    """month_direction_sums() output in the /api/data response layout."""
+    labels, af_data, bij_data = [], [], []
+    for month, credit, total in zip(months, is_credit, totals):
+        if not labels or labels[-1][0] != month:
+            labels.append((month, datetime.strptime(month_key(month), '%Y-%m').strftime('%B %Y')))
+            af_data.append(0)
+            bij_data.append(0)
+        (bij_data if credit else af_data)[-1] = cents_to_decimal(total)
+    return {'labels': [name for _, name in labels], 'af_data': af_data, 'bij_data': bij_data}
+
+def _category_month_rows(category_name, categories, labels, label_ids, months, totals):
+    """Per-month totals of one category's labels, from label_month_sums() output."""
+    category_ids = {category.id for category in categories if category.name == category_name}
+    wanted = [label.id for label in labels if label.category_id in category_ids]
+    selected = np.isin(label_ids, wanted)
+    month_values, month_codes = np.unique(months[selected], return_inverse=True)
+    sums = np.bincount(month_codes, weights=totals[selected], minlength=len(month_values))
+    return [{'year_month': month_key(month), 'bedrag_eur': cents_to_decimal(int(np.rint(total)))}
+            for month, total in zip(month_values, sums)]
+
+def fetch_dashboard(start=None, end=None):
+    """Everything the home page needs on load, computed from one consistent read.
+
+    Labels and categories are read in a single REPEATABLE READ transaction and
+    all amounts come from one columnar store snapshot. The per-label monthly
+    sums are computed once and shared by the transaction sums, savings and
+    overview views; the chart kernel runs alongside them.
+    """
+    session = get_session(read_only=True)
+    try:
+        session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        labels = session.query(Label.id, Label.name, Label.category_id).all()
+        categories = session.query(LabelCategory.id, LabelCategory.name, LabelCategory.parent_id).all()
+        session.commit()
     except Exception as e:
         session.rollback()
-        logging.error(f"Error in fetch_transactions_overview: {e}", exc_info=True)
+        logger.error("Error fetching dashboard labels: %s", e)
         raise e
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+    return _dashboard_views(labels, categories, get_transaction_store().snapshot(), start, end)
+
+def _dashboard_views(labels, categories, snapshot, start=None, end=None):
+    """The fetch_dashboard() response from label/category rows and a store snapshot."""
+    range_mask = day_range_mask(snapshot, start, end)
+    chart_future = _dashboard_executor.submit(month_direction_sums, snapshot, range_mask)
+    sums_future = _dashboard_executor.submit(label_month_sums, snapshot, range_mask)
+
+    label_tree = _build_label_tree(labels, categories)
+    label_ids, months, totals = sums_future.result()
+    label_names = {label.id: label.name for label in labels}
+
+    return {
+        'chart': _chart_series(*chart_future.result()),
+        'savings': _category_month_rows('RESERVERINGSUITGAVEN', categories, labels, label_ids, months, totals),
+        'labels': label_tree,
+        'transaction_sums': _label_month_rows(label_names, label_ids, months, totals),
+        'overview': _build_overview(categories, labels, label_ids, months, totals),
+    }
@@ -0,0 +1,84 @@
+import csv
+import io
+from .amounts import cents_to_decimal
+
+# Encoders for /api/export. Each takes the row batches from
+# db.iter_export_batches() and yields bytes as soon as a batch is encoded, so a
+# response streams with chunked transfer encoding and only one batch is in
+# memory at a time.
+
+COLUMNS = ['id', 'datum', 'company', 'rekening', 'tegenrekening', 'code', 'af_bij', 'bedrag_eur',
+           'mutatiesoort', 'mededelingen', 'label', 'category']
+
+
+def _values(row):
+    # Same amount convention as the API: unsigned euros plus af_bij
+    return [row.id, row.datum.isoformat(), row.company, row.rekening, row.tegenrekening, row.code, row.af_bij,
+            cents_to_decimal(abs(row.amount_cents)), row.mutatiesoort, row.mededelingen, row.label, row.category]
+
+
+def csv_stream(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        writer.writerows(_values(row) for row in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_stream(batches):
+    """One Parquet row group per batch; the footer follows the last one."""
+    import pyarrow as pa  # only needed for Parquet exports
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('datum', pa.date32()),
+        ('company', pa.string()),
+        ('rekening', pa.string()),
+        ('tegenrekening', pa.string()),
+        ('code', pa.string()),
+        ('af_bij', pa.string()),
+        ('bedrag_eur', pa.decimal128(18, 2)),
+        ('mutatiesoort', pa.string()),
+        ('mededelingen', pa.string()),
+        ('label', pa.string()),
+        ('category', pa.string()),
+    ])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            columns = list(zip(*batch)) if batch else [[] for _ in range(12)]
+            arrays = [
+                pa.array(columns[0], pa.int64()),
+                pa.array(columns[1], pa.date32()),
+                *(pa.array(values, pa.string()) for values in columns[2:7]),
+                pa.array([cents_to_decimal(abs(cents)) for cents in columns[7]], pa.decimal128(18, 2)),
+                *(pa.array(values, pa.string()) for values in columns[8:12]),
+            ]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
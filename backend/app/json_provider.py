@@ -0,0 +1,58 @@
+import decimal
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # optional; create_app() keeps Flask's provider without it
+    orjson = None
+
+# JSON provider backed by orjson, selected with JSON_PROVIDER=orjson (default).
+# Responses are the same documents Flask's DefaultJSONProvider produces:
+# Decimal amounts as strings, dates in HTTP date format, sorted keys. Only the
+# bytes differ (no whitespace, non-ASCII as UTF-8 rather than \u escapes).
+
+
+def _default(o):
+    # Types orjson doesn't handle natively, or (dates) handles differently from Flask
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+
+    @staticmethod
+    def available():
+        return orjson is not None
+
+    def _options(self, pretty=False):
+        # NumPy scalars: the json module accepts numpy.float64 (a float subclass)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # orjson has no equivalent for json.dumps arguments (indent, separators, ...)
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=_default, option=self._options(pretty))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
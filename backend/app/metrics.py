@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from prometheus_client import (Counter, Histogram, CollectorRegistry, generate_latest,
+                               CONTENT_TYPE_LATEST, REGISTRY, multiprocess)
+
+logger = logging.getLogger(__name__)
+
+# Request, SQL and model metrics in Prometheus format.
+# Under gunicorn set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates all workers.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    'pf_request_duration_seconds', 'Request latency per route',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    'pf_request_sql_statements', 'SQL statements executed per request',
+    ['route'], buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+)
+REQUEST_DB_SECONDS = Histogram(
+    'pf_request_db_duration_seconds', 'Time spent in the database per request',
+    ['route'], buckets=LATENCY_BUCKETS
+)
+SLOW_REQUESTS = Counter(
+    'pf_slow_requests_total', 'Requests slower than SLOW_REQUEST_THRESHOLD_MS',
+    ['method', 'route']
+)
+MODEL_INFERENCE_SECONDS = Histogram(
+    'pf_model_inference_duration_seconds', 'Label model inference time per call',
+    ['operation'], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5)
+)
+
+
+def _route():
+    # Use the URL rule (e.g. /api/transactions) rather than the raw path to keep label cardinality bounded
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def start_request():
+    g.request_start = time.perf_counter()
+    g.sql_statements = 0
+    g.db_seconds = 0.0
+
+
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = _route()
+
+    REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(elapsed)
+    REQUEST_SQL_STATEMENTS.labels(route).observe(g.sql_statements)
+    REQUEST_DB_SECONDS.labels(route).observe(g.db_seconds)
+
+    threshold_ms = current_app.config['SLOW_REQUEST_THRESHOLD_MS']
+    if elapsed * 1000 >= threshold_ms:
+        SLOW_REQUESTS.labels(request.method, route).inc()
+        logger.warning(
+            "Slow request: %s %s took %.0f ms (%d SQL statements, %.0f ms in DB)",
+            request.method, route, elapsed * 1000, g.sql_statements, g.db_seconds * 1000
+        )
+    return response
+
+
+@contextmanager
+def model_timer(operation):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        MODEL_INFERENCE_SECONDS.labels(operation).observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine):
+    """Count statements and DB time for the current request via engine events."""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if has_request_context() and 'request_start' in g:
+            g.sql_statements += 1
+            g.db_seconds += elapsed
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        # after_cursor_execute doesn't fire for failed statements
+        conn = context.connection
+        if conn is not None and conn.info.get('query_start'):
+            conn.info['query_start'].pop()
+
+
+def render():
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
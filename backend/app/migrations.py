@@ -0,0 +1,236 @@
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from .models import SEARCH_VECTOR_SQL, Transaction
+from .changes import TABLES as CACHE_TABLES
+from .partitions import is_partitioned, ensure_default_partition, ensure_partitions, month_range
+
+logger = logging.getLogger(__name__)
+
+# Schema migrations for existing databases. Fresh databases get the current
+# schema from Base.metadata.create_all(); every migration therefore checks the
+# catalog first and is a no-op when its change is already in place.
+# Applied versions are recorded in schema_migrations.
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent pods migrate one at a time
+MIGRATION_LOCK_KEY = 724001
+# Held by every transaction that took change_seq values before _change_xid
+CHANGE_SEQ_LOCK_KEY = 724003
+
+
+def _column_exists(conn, table, column):
+    return conn.execute(text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column"
+    ), {'table': table, 'column': column}).first() is not None
+
+
+def _amount_cents(conn):
+    # bedrag_eur (unsigned DECIMAL) + af_bij -> signed BIGINT cents
+    if not _column_exists(conn, 'transactions', 'bedrag_eur'):
+        return
+    conn.execute(text("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS amount_cents BIGINT"))
+    # bedrag_eur was nullable. Sums skipped NULL amounts, so they become 0:
+    # the totals stay the same and the rows can be corrected by hand
+    missing = conn.execute(text("SELECT id FROM transactions WHERE bedrag_eur IS NULL ORDER BY id")).scalars().all()
+    if missing:
+        logger.warning("%d transactions without an amount get amount_cents 0, ids: %s%s", len(missing),
+                       ', '.join(map(str, missing[:50])), ' ...' if len(missing) > 50 else '')
+    conn.execute(text(
+        "UPDATE transactions SET amount_cents = "
+        "coalesce(round(bedrag_eur * 100)::bigint, 0) * CASE WHEN af_bij = 'Af' THEN -1 ELSE 1 END"
+    ))
+    conn.execute(text("ALTER TABLE transactions ALTER COLUMN amount_cents SET NOT NULL"))
+    conn.execute(text("ALTER TABLE transactions DROP COLUMN bedrag_eur"))
+
+
+def _datum_index(conn):
+    # Supports the datum >= ... AND datum < ... range filters
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_datum ON transactions (datum)"))
+
+
+def _extension_available(conn, name):
+    return conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = :name"),
+                        {'name': name}).first() is not None
+
+
+def _search_indexes(conn):
+    # Generated tsvector column + GIN index for /api/transactions/search
+    conn.execute(text(
+        "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transactions_search_vector ON transactions USING gin (search_vector)"
+    ))
+
+    # Trigram index for fuzzy company matching. pg_trgm ships with the contrib
+    # package; without it search falls back to full-text matching only.
+    if not _extension_available(conn, 'pg_trgm'):
+        logger.warning("pg_trgm is not available; fuzzy company search is disabled")
+        return
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError as e:
+        logger.warning("Could not create extension pg_trgm (%s); fuzzy company search is disabled", e.orig)
+        return
+    _trigram_index(conn)
+
+
+def _trigram_index(conn):
+    if conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is None:
+        return
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transactions_company_trgm ON transactions USING gin (company gin_trgm_ops)"
+    ))
+
+
+def _partition_transactions(conn):
+    # Monthly range partitions on datum (see partitions.py). A foreign key to a
+    # partitioned table must include the partition key, so transaction_labels
+    # keeps an index on transaction_id instead.
+    conn.execute(text(
+        "ALTER TABLE transaction_labels DROP CONSTRAINT IF EXISTS transaction_labels_transaction_id_fkey"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transaction_labels_transaction_id ON transaction_labels (transaction_id)"
+    ))
+    if is_partitioned(conn):
+        # Fresh database: create_all() already made the partitioned table
+        ensure_default_partition(conn)
+        return
+
+    # Postgres can't partition a table in place: move the old one aside, create
+    # the partitioned table and copy the rows across.
+    conn.execute(text("ALTER TABLE transactions RENAME TO transactions_unpartitioned"))
+    conn.execute(text("ALTER SEQUENCE transactions_id_seq RENAME TO transactions_unpartitioned_id_seq"))
+    conn.execute(text("ALTER INDEX transactions_pkey RENAME TO transactions_unpartitioned_pkey"))
+    for index in ('ix_transactions_datum', 'ix_transactions_search_vector', 'ix_transactions_company_trgm'):
+        conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+    Transaction.__table__.create(conn)
+    _trigram_index(conn)
+    ensure_default_partition(conn)
+    first, last = conn.execute(text("SELECT min(datum), max(datum) FROM transactions_unpartitioned")).one()
+    if first is not None:
+        ensure_partitions(conn, month_range(first, last))
+
+    columns = 'id, datum, company, rekening, tegenrekening, code, af_bij, amount_cents, mutatiesoort, mededelingen'
+    moved = conn.execute(text(
+        f"INSERT INTO transactions ({columns}) SELECT {columns} FROM transactions_unpartitioned"
+    )).rowcount
+    conn.execute(text(
+        "SELECT setval(pg_get_serial_sequence('transactions', 'id'), "
+        "(SELECT coalesce(max(id), 0) + 1 FROM transactions), false)"
+    ))
+    conn.execute(text("DROP TABLE transactions_unpartitioned"))
+    conn.execute(text("ANALYZE transactions"))
+    logger.info("Moved %d transactions into monthly partitions", moved)
+
+
+def _cache_versions(conn):
+    # Per-table change counters for cache invalidation (app/changes.py)
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS cache_versions ("
+        "table_name VARCHAR(64) PRIMARY KEY, "
+        "version BIGINT NOT NULL DEFAULT 0, "
+        "updated_at TIMESTAMP NOT NULL DEFAULT now())"
+    ))
+    conn.execute(text(
+        "INSERT INTO cache_versions (table_name) SELECT unnest(CAST(:tables AS TEXT[])) "
+        "ON CONFLICT (table_name) DO NOTHING"
+    ), {'tables': list(CACHE_TABLES)})
+
+
+def _change_seq(conn):
+    # Change sequence numbers for /api/changes: a trigger stamps every inserted
+    # or updated transaction and label assignment with the next value of one
+    # shared sequence. Sequence values are handed out in call order, not commit
+    # order; the trigger therefore first takes a transaction-level advisory
+    # lock, so writers take their numbers one transaction at a time and commit
+    # them in sequence order. A reader never sees number n before every lower
+    # number has been committed, and a client that synced up to n can safely
+    # ask for everything after n.
+    conn.execute(text("CREATE SEQUENCE IF NOT EXISTS change_seq"))
+    for table in ('transactions', 'transaction_labels'):
+        if not _column_exists(conn, table, 'change_seq'):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN change_seq BIGINT NOT NULL DEFAULT 0"))
+            # Existing rows count as changed once, in id order
+            conn.execute(text(
+                f"UPDATE {table} t SET change_seq = s.seq FROM "
+                f"(SELECT id, nextval('change_seq') AS seq FROM (SELECT id FROM {table} ORDER BY id) ids) s "
+                f"WHERE t.id = s.id"
+            ))
+            conn.execute(text(f"ANALYZE {table}"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_change_seq ON {table} (change_seq)"))
+
+    conn.execute(text(
+        "CREATE OR REPLACE FUNCTION stamp_change_seq() RETURNS trigger AS $$ "
+        "BEGIN "
+        f"PERFORM pg_advisory_xact_lock({CHANGE_SEQ_LOCK_KEY}); "
+        "NEW.change_seq := nextval('change_seq'); "
+        "RETURN NEW; "
+        "END $$ LANGUAGE plpgsql"
+    ))
+    for table in ('transactions', 'transaction_labels'):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_change_seq ON {table}"))
+        conn.execute(text(
+            f"CREATE TRIGGER {table}_change_seq BEFORE INSERT OR UPDATE ON {table} "
+            "FOR EACH ROW EXECUTE FUNCTION stamp_change_seq()"
+        ))
+
+
+def _change_xid(conn):
+    # Replaces the advisory lock of _change_seq, which every writing
+    # transaction held until it committed: a label update waited for a
+    # running import. Rows are now also stamped with the id of the transaction
+    # that wrote them, and change_seq values are taken without a lock.
+    # /api/changes only returns rows written by transactions older than the
+    # reading snapshot's xmin, which have all committed or aborted, in
+    # (change_xid, change_seq) order; see db.fetch_changes.
+    for table in ('transactions', 'transaction_labels'):
+        if not _column_exists(conn, table, 'change_xid'):
+            # Existing rows count as written before any transaction still running
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN change_xid BIGINT NOT NULL DEFAULT 0"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_change ON {table} (change_xid, change_seq)"))
+        conn.execute(text(f"DROP INDEX IF EXISTS ix_{table}_change_seq"))
+
+    conn.execute(text(
+        "CREATE OR REPLACE FUNCTION stamp_change_seq() RETURNS trigger AS $$ "
+        "BEGIN "
+        "NEW.change_xid := pg_current_xact_id()::text::bigint; "
+        "NEW.change_seq := nextval('change_seq'); "
+        "RETURN NEW; "
+        "END $$ LANGUAGE plpgsql"
+    ))
+
+
+MIGRATIONS = [
+    (1, 'amount_cents', _amount_cents),
+    (2, 'datum_index', _datum_index),
+    (3, 'search_indexes', _search_indexes),
+    (4, 'partition_transactions', _partition_transactions),
+    (5, 'cache_versions', _cache_versions),
+    (6, 'change_seq', _change_seq),
+    (7, 'change_xid', _change_xid),
+]
+
+
+def run_migrations(engine):
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        ))
+        applied = {row.version for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info("Applying migration %s: %s", version, name)
+            migrate(conn)
+            conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                         {'version': version, 'name': name})
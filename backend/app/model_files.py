@@ -0,0 +1,52 @@
+import os
+import click
+import logging
+from flask import current_app
+from flask.cli import with_appcontext
+
+logger = logging.getLogger(__name__)
+
+# Label model files, stored so that workers can share the model's arrays.
+#
+# save_model() writes the joblib file uncompressed. joblib then stores every
+# NumPy array (coefficients, IDF weights, sparse matrix parts) as one aligned
+# raw block, and load_model() maps those blocks read-only (mmap_mode='r')
+# instead of copying them onto the heap. Every worker and replica on a node
+# that loads the same file shares one copy in the page cache; only the Python
+# objects in the pipeline (parameters, the vectorizer vocabulary) are unpickled
+# per process. Compressed files still load, entirely into memory;
+# `flask --app app convert-model` rewrites them.
+#
+# A mapped file must not be changed in place: truncating it under a running
+# worker kills that worker with SIGBUS on its next predict. save_model()
+# therefore writes a new file and renames it over the old one. Running
+# workers keep the old inode until they restart.
+
+
+def load_model(path, mmap=True):
+    import joblib  # pulls in the model's dependencies (sklearn) on first use
+    return joblib.load(path, mmap_mode='r' if mmap else None)
+
+
+def save_model(model, path):
+    """Write `model` to `path` in the memory-mappable layout, replacing any file there atomically."""
+    import joblib
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    try:
+        joblib.dump(model, tmp_path, compress=0)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+@click.command('convert-model')
+@click.option('--output', default=None, help='Write here instead of replacing MODEL_PATH.')
+@with_appcontext
+def convert_model_command(output):
+    """Rewrite the label model (e.g. a compressed joblib file) so workers can memory-map it."""
+    path = current_app.config['MODEL_PATH']
+    model = load_model(path, mmap=False)
+    save_model(model, output or path)
+    click.echo(f'Model written to {output or path}')
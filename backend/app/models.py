@@ -1,20 +1,46 @@
-from sqlalchemy import Column, Integer, String, Date, DECIMAL, ForeignKey, Text, create_engine
-from sqlalchemy.orm import relationship, declarative_base, sessionmaker, backref
+from sqlalchemy import Column, Integer, BigInteger, Boolean, String, Date, DateTime, Float, ForeignKey, Text, Computed, Index, create_engine, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, declarative_base, sessionmaker, backref, deferred
 
 Base = declarative_base()
 
+# Weighted search document: company ranks above mededelingen. 'simple' (no
+# stemming, no stop words) because most of the text is merchant names and codes.
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(company, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(mededelingen, '')), 'B')"
+)
+
 class Transaction(Base):
     __tablename__ = 'transactions'
-    id = Column(Integer, primary_key=True)
-    datum = Column(Date)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Partition key (monthly ranges, see partitions.py); Postgres requires it in
+    # the primary key. The ORM still identifies transactions by id alone.
+    datum = Column(Date, primary_key=True, index=True)
     company = Column(String(255))
     rekening = Column(String(255))
     tegenrekening = Column(String(255))
     code = Column(String(50))
     af_bij = Column(String(50))
-    bedrag_eur = Column(DECIMAL)
+    # Signed amount in cents: negative for 'Af', positive for 'Bij'
+    amount_cents = Column(BigInteger, nullable=False)
     mutatiesoort = Column(String(255))
     mededelingen = Column(Text)
+    # Full-text search document, maintained by Postgres on every insert/update.
+    # Deferred so regular ORM loads don't fetch it.
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True)))
+    # Set on every insert and update by a trigger (see migrations._change_seq and
+    # _change_xid): the writing transaction's id and a number from the change_seq
+    # sequence. /api/changes returns rows newer than a client's last sync.
+    change_xid = Column(BigInteger, nullable=False, server_default='0')
+    change_seq = Column(BigInteger, nullable=False, server_default='0')
+
+    __table_args__ = (
+        Index('ix_transactions_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_transactions_change', 'change_xid', 'change_seq'),
+        {'postgresql_partition_by': 'RANGE (datum)'},
+    )
+    __mapper_args__ = {'primary_key': [id]}
 
 class LabelCategory(Base):
     __tablename__ = 'label_categories'
@@ -33,7 +59,69 @@ class Label(Base):
 class TransactionLabel(Base):
     __tablename__ = 'transaction_labels'
     id = Column(Integer, primary_key=True)
-    transaction_id = Column(Integer, ForeignKey('transactions.id'))
+    # No foreign key: a key referencing the partitioned transactions table
+    # would have to include datum as well
+    transaction_id = Column(Integer, index=True)
     label_id = Column(Integer, ForeignKey('labels.id'))
-    transaction = relationship('Transaction', backref=backref('transaction_labels', cascade="all, delete-orphan"))
-    label = relationship('Label', backref=backref('transaction_labels', cascade="all, delete-orphan")) 
\ No newline at end of file
+    # As Transaction.change_xid and change_seq
+    change_xid = Column(BigInteger, nullable=False, server_default='0')
+    change_seq = Column(BigInteger, nullable=False, server_default='0')
+    transaction = relationship('Transaction', primaryjoin='foreign(TransactionLabel.transaction_id) == Transaction.id',
+                               backref=backref('transaction_labels', cascade="all, delete-orphan"))
+    label = relationship('Label', backref=backref('transaction_labels', cascade="all, delete-orphan"))
+
+    __table_args__ = (
+        Index('ix_transaction_labels_change', 'change_xid', 'change_seq'),
+    )
+
+class LabelingQueueEntry(Base):
+    # One row per merchant with unlabeled transactions, most uncertain first
+    # (see db.refresh_labeling_queue). Paged by keyset on the priority index.
+    __tablename__ = 'labeling_queue'
+    merchant = Column(String(255), primary_key=True)  # normalized company, see suggest.normalize
+    company = Column(String(255), nullable=False)  # most frequent spelling, for display
+    transaction_count = Column(Integer, nullable=False)  # unlabeled transactions
+    suggested_label = Column(String(255))
+    label_probability = Column(Float, nullable=False)
+    uncertainty = Column(Float, nullable=False)  # 1 - the model's top probability, see db._queue_uncertainties
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('ix_labeling_queue_priority', 'uncertainty', 'transaction_count', 'merchant'),
+    )
+
+class BalanceCheckpoint(Base):
+    # Balance of every account at the start of every month up to the month of
+    # the latest transaction (see balances.py). Rebuilt from the first
+    # invalidated month after a backdated import.
+    __tablename__ = 'balance_checkpoints'
+    as_of = Column(Date, primary_key=True)  # first day of a month; the balance excludes this day
+    rekening = Column(String(255), primary_key=True)
+    balance_cents = Column(BigInteger, nullable=False)  # sum of amount_cents with datum < as_of
+
+class ArchivedYear(Base):
+    # Years moved out of `transactions` into Parquet (see archive.py)
+    __tablename__ = 'archived_years'
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    path = Column(String(1024), nullable=False)  # Parquet file, relative to ARCHIVE_DIR
+    transactions = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class ArchivedMonthTotal(Base):
+    # Archived transactions summed per month, label, account and direction:
+    # the columnar store loads these in place of the archived rows
+    __tablename__ = 'archived_month_totals'
+    id = Column(Integer, primary_key=True)
+    month = Column(Date, nullable=False, index=True)  # first day of the month
+    label_id = Column(Integer)  # None: unlabeled
+    rekening = Column(String(255))
+    is_credit = Column(Boolean, nullable=False)
+    transactions = Column(Integer, nullable=False)
+    amount_cents = Column(BigInteger, nullable=False)  # signed, as Transaction.amount_cents
+
+class ArchivedLabelCount(Base):
+    # Labeled archived transactions per company, for the label suggestion index
+    __tablename__ = 'archived_label_counts'
+    company = Column(String(255), primary_key=True)
+    label_id = Column(Integer, primary_key=True, autoincrement=False)
+    transactions = Column(Integer, nullable=False)
@@ -0,0 +1,150 @@
+import csv
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Bank statement parsers. Every supported export layout is a BankFormat in
+# FORMATS that maps its columns onto the `transactions` columns; the format of
+# a file is detected from its header line. Parsing works on whole columns at a
+# time and returns a DataFrame with the CANONICAL columns:
+#
+#   datum          datetime.date
+#   amount_cents   int64, signed ('Af' negative)
+#   af_bij         'Af' or 'Bij'
+#   the rest       str ('' when the bank doesn't provide the field)
+
+CANONICAL = ['datum', 'company', 'rekening', 'tegenrekening', 'code', 'af_bij', 'amount_cents',
+             'mutatiesoort', 'mededelingen']
+
+TEXT_FIELDS = ['company', 'rekening', 'tegenrekening', 'code', 'mutatiesoort', 'mededelingen']
+
+
+class BankFormat:
+    """Column mapping and type coercions for one bank's CSV export.
+
+    `columns` maps the text fields in TEXT_FIELDS to source column names
+    (missing fields stay empty). Amounts are either unsigned with a separate
+    `direction_column` whose `debit_value` marks debits, or signed when
+    `direction_column` is None.
+    """
+
+    def __init__(self, name, columns, date_column, date_format, amount_column,
+                 direction_column=None, debit_value='Af', delimiter=',', decimal=',',
+                 thousands=None, encoding='utf-8'):
+        self.name = name
+        self.columns = columns
+        self.date_column = date_column
+        self.date_format = date_format
+        self.amount_column = amount_column
+        self.direction_column = direction_column
+        self.debit_value = debit_value
+        self.delimiter = delimiter
+        self.decimal = decimal
+        self.thousands = thousands
+        self.encoding = encoding
+
+    @property
+    def required_columns(self):
+        required = set(self.columns.values()) | {self.date_column, self.amount_column}
+        if self.direction_column:
+            required.add(self.direction_column)
+        return required
+
+    def matches(self, header):
+        return self.required_columns <= set(header)
+
+    def parse(self, path):
+        df = pd.read_csv(path, sep=self.delimiter, dtype=str, keep_default_na=False, encoding=self.encoding)
+        df.columns = df.columns.str.strip()
+
+        out = pd.DataFrame(index=df.index)
+        out['datum'] = pd.to_datetime(df[self.date_column].str.strip(), format=self.date_format).dt.date
+
+        amounts = df[self.amount_column].str.strip()
+        if self.thousands:
+            amounts = amounts.str.replace(self.thousands, '', regex=False)
+        if self.decimal != '.':
+            amounts = amounts.str.replace(self.decimal, '.', regex=False)
+        # float64 holds every 2-decimal amount below ~10^13 closely enough for rint to be exact
+        cents = np.rint(pd.to_numeric(amounts).to_numpy(dtype=np.float64) * 100).astype(np.int64)
+
+        if self.direction_column:
+            af_bij = df[self.direction_column].str.strip()
+            debit = (af_bij == self.debit_value).to_numpy()
+            out['af_bij'] = np.where(debit, 'Af', 'Bij')
+            cents = np.where(debit, -np.abs(cents), np.abs(cents))
+        else:
+            out['af_bij'] = np.where(cents < 0, 'Af', 'Bij')
+        out['amount_cents'] = cents
+
+        for field in TEXT_FIELDS:
+            source = self.columns.get(field)
+            out[field] = df[source] if source else ''
+        return out[CANONICAL]
+
+
+FORMATS = []
+
+
+def register(bank_format):
+    """Add a format; earlier registrations win when several match a header."""
+    FORMATS.append(bank_format)
+    return bank_format
+
+
+_ING_COLUMNS = {
+    'company': 'Naam / Omschrijving',
+    'rekening': 'Rekening',
+    'tegenrekening': 'Tegenrekening',
+    'code': 'Code',
+    'mutatiesoort': 'Mutatiesoort',
+    'mededelingen': 'Mededelingen',
+}
+
+# ING "Af- en bijschrijvingen", comma separated (the original data.csv layout)
+register(BankFormat('ing', _ING_COLUMNS, date_column='Datum', date_format='%Y%m%d',
+                    amount_column='Bedrag (EUR)', direction_column='Af Bij'))
+
+# ING, semicolon separated (newer exports, adds 'Saldo na mutatie' and 'Tag')
+register(BankFormat('ing-semicolon', _ING_COLUMNS, date_column='Datum', date_format='%Y%m%d',
+                    amount_column='Bedrag (EUR)', direction_column='Af Bij', delimiter=';'))
+
+# Rabobank CSV: signed amounts, ISO dates, ISO-8859-1 encoded
+register(BankFormat('rabobank', {
+    'company': 'Naam tegenpartij',
+    'rekening': 'IBAN/BBAN',
+    'tegenrekening': 'Tegenrekening IBAN/BBAN',
+    'code': 'Code',
+    'mededelingen': 'Omschrijving-1',
+}, date_column='Datum', date_format='%Y-%m-%d', amount_column='Bedrag', encoding='iso-8859-1'))
+
+
+def detect_format(path):
+    """The first registered format whose columns all appear in the file's header."""
+    for bank_format in FORMATS:
+        with open(path, 'r', encoding=bank_format.encoding, errors='replace', newline='') as file:
+            line = file.readline()
+        header = [field.strip() for field in next(csv.reader([line], delimiter=bank_format.delimiter), [])]
+        if bank_format.matches(header):
+            return bank_format
+    raise ValueError(f'{os.path.basename(path)}: unrecognized bank statement format')
+
+
+def parse_file(path):
+    """Detect the format of `path` and parse it into a CANONICAL DataFrame."""
+    return detect_format(path).parse(path)
+
+
+def parse_files(paths):
+    """Parse several files, in parallel worker processes when there is more than one.
+
+    Workers are spawned rather than forked: the web workers that call this run
+    threads (gunicorn gthread, logging), which fork() doesn't copy safely.
+    """
+    if len(paths) == 1:
+        return [parse_file(paths[0])]
+    workers = min(len(paths), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(parse_file, paths))
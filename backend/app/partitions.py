@@ -0,0 +1,88 @@
+import logging
+from datetime import date
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# `transactions` is range-partitioned by month on datum:
+#
+#   transactions_y2024m10   FOR VALUES FROM ('2024-10-01') TO ('2024-11-01')
+#   transactions_default    rows no monthly partition covers
+#
+# Monthly partitions are created before rows are inserted, so the default
+# partition normally stays empty. Creating one locks `transactions` and scans
+# the default partition, and both last until commit: writers create them with
+# create_partitions() in a short transaction of their own before their insert
+# transaction starts, and bootstrap creates the coming months up front. Queries with
+# `datum >= ... AND datum < ...` only scan the months they need, and an old
+# month can be vacuumed, detached or dropped on its own:
+#
+#   ALTER TABLE transactions DETACH PARTITION transactions_y2021m01;
+
+PARENT = 'transactions'
+DEFAULT_PARTITION = f'{PARENT}_default'
+
+# Serializes partition creation between workers ingesting at the same time
+PARTITION_LOCK_KEY = 724002
+
+
+def partition_name(month_start):
+    return f'{PARENT}_y{month_start.year:04d}m{month_start.month:02d}'
+
+
+def _next_month(month_start):
+    return date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+
+
+def month_range(first, last):
+    """First day of every month from `first` through `last` (dates)."""
+    month_start = first.replace(day=1)
+    while month_start <= last:
+        yield month_start
+        month_start = _next_month(month_start)
+
+
+def is_partitioned(conn):
+    return conn.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(:parent)"
+    ), {'parent': PARENT}).scalar() == 'p'
+
+
+def existing_partitions(conn):
+    return set(conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:parent)"
+    ), {'parent': PARENT}).scalars())
+
+
+def ensure_default_partition(conn):
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+
+
+def ensure_partitions(conn, days, known=None):
+    """Create the monthly partitions for `days` (dates) that don't exist yet.
+
+    `known` is a set of existing partition names, as returned by
+    existing_partitions(). It is updated in place, so a caller inserting row by
+    row reads the catalog once and only runs DDL for months it hasn't seen.
+    """
+    if known is None:
+        known = existing_partitions(conn)
+    for month_start in sorted({day.replace(day=1) for day in days if day is not None}):
+        name = partition_name(month_start)
+        if name in known:
+            continue
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': PARTITION_LOCK_KEY})
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT} "
+            f"FOR VALUES FROM ('{month_start.isoformat()}') TO ('{_next_month(month_start).isoformat()}')"
+        ))
+        known.add(name)
+        logger.info("Created partition %s", name)
+    return known
+
+
+def create_partitions(engine, days):
+    """ensure_partitions() in a transaction of its own, committed straight away."""
+    with engine.begin() as conn:
+        return ensure_partitions(conn, days)
@@ -0,0 +1,228 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from flask import g, request, current_app
+
+logger = logging.getLogger(__name__)
+
+# Statistical profiles of single requests, off by default.
+#
+# A request is profiled when it carries `X-Profile: 1` together with a valid
+# `X-Admin-Token` (ADMIN_TOKEN), or at random with PROFILE_SAMPLE_RATE. While
+# it runs, one sampler thread per process records the stack of the request's
+# thread every PROFILE_INTERVAL_MS (sys._current_frames(), no tracing hooks),
+# so the request itself runs unmodified. Work handed to other threads (the
+# /api/dashboard executor) shows up as the request waiting on it, and a
+# streamed body (/api/export) is produced after the profile ends.
+#
+# Each profile is written to PROFILE_DIR as two files:
+#
+#   <id>.folded  one "frame;frame;frame count" line per stack, root first:
+#                the input of flamegraph.pl, inferno and speedscope
+#   <id>.json    route, status, duration, SQL statements and sample count
+#
+# Only the newest PROFILE_KEEP profiles are kept. The response of a profiled
+# request carries its id in X-Profile-Id; /api/admin/profiles lists and
+# serves them (see routes.py). With profiling off, the per-request cost is
+# one header lookup and one config lookup.
+
+PROFILE_HEADER = 'X-Profile'
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+PROFILE_ID = re.compile(r'^\d{8}T\d{12}Z-\d+-[0-9a-f]{8}$')
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+class Sampler:
+    """Samples the stacks of the threads being profiled, from one background thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}  # thread id -> Counter of folded stacks
+        self._labels = {}  # code object -> frame label
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        threading.Thread(target=self._run, name='profile-sampler', daemon=True).start()
+
+    def start(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = Counter()
+            self._wakeup.notify()
+
+    def stop(self, thread_id):
+        """The folded stacks sampled for `thread_id` since start(), or None."""
+        with self._lock:
+            return self._active.pop(thread_id, None)
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            for marker in ('site-packages' + os.sep, os.sep + 'backend' + os.sep):
+                filename = filename.split(marker, 1)[-1]
+            label = f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+            self._labels[code] = label
+        return label
+
+    def _fold(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wakeup.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._fold(frame)] += 1
+
+
+def _get_sampler():
+    # Started on first use, so a preloaded gunicorn master never owns the thread
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = Sampler(current_app.config['PROFILE_INTERVAL_MS'] / 1000)
+    return _sampler
+
+
+def is_admin():
+    token = current_app.config['ADMIN_TOKEN']
+    return bool(token) and hmac.compare_digest(request.headers.get(ADMIN_TOKEN_HEADER, ''), token)
+
+
+def _trigger():
+    if PROFILE_HEADER in request.headers and is_admin():
+        return 'header'
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def start_profile():
+    """before_request hook: start sampling this request if it is to be profiled."""
+    trigger = _trigger()
+    if trigger is None:
+        return
+    g.profile = (trigger, time.perf_counter(), datetime.now(timezone.utc))
+    _get_sampler().start(threading.get_ident())
+
+
+def finish_profile(response):
+    """after_request hook: store the profile of this request, if any."""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    trigger, started, created = profile
+    stacks = _get_sampler().stop(threading.get_ident())
+    elapsed = time.perf_counter() - started
+    try:
+        profile_id = save_profile(stacks or Counter(), {
+            'created': created.isoformat(timespec='milliseconds'),
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else 'unmatched',
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 1),
+            'sql_statements': g.get('sql_statements'),
+            'db_ms': round(g.get('db_seconds', 0) * 1000, 1),
+            'trigger': trigger,
+        }, created)
+        response.headers['X-Profile-Id'] = profile_id
+    except Exception as e:
+        # The request itself succeeded; a profile that can't be stored is dropped
+        logger.warning("Profile of %s not stored: %s", request.path, e)
+    return response
+
+
+def discard_profile(exc=None):
+    """teardown_request hook: stop sampling a request that never reached finish_profile()."""
+    if g.pop('profile', None) is not None:
+        _get_sampler().stop(threading.get_ident())
+
+
+def _profile_dir():
+    return os.path.abspath(current_app.config['PROFILE_DIR'])
+
+
+def save_profile(stacks, metadata, created):
+    """Write the .folded and .json files of a profile; returns its id."""
+    directory = _profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f'{created:%Y%m%dT%H%M%S%fZ}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+    interval_ms = current_app.config['PROFILE_INTERVAL_MS']
+    metadata = {'id': profile_id, **metadata, 'samples': sum(stacks.values()), 'interval_ms': interval_ms,
+                'pid': os.getpid()}
+
+    with open(os.path.join(directory, f'{profile_id}.folded'), 'w') as file:
+        for stack, count in stacks.most_common():
+            file.write(f'{stack} {count}\n')
+    # The metadata goes last: list_profiles() only shows profiles that have it
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w') as file:
+        json.dump(metadata, file)
+
+    _prune(directory, current_app.config['PROFILE_KEEP'])
+    logger.info("Profile %s stored: %s %s, %.0f ms, %d samples", profile_id, metadata['method'],
+                metadata['route'], metadata['duration_ms'], metadata['samples'])
+    return profile_id
+
+
+def _stored_ids(directory):
+    # Ids start with their UTC timestamp, so they sort oldest first
+    return sorted(name[:-len('.json')] for name in os.listdir(directory)
+                  if name.endswith('.json') and PROFILE_ID.match(name[:-len('.json')]))
+
+
+def _prune(directory, keep):
+    stored = _stored_ids(directory)
+    for profile_id in stored[:max(len(stored) - keep, 0)]:
+        for extension in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(directory, profile_id + extension))
+            except FileNotFoundError:
+                pass  # pruned by another worker
+
+
+def list_profiles(limit=50):
+    """Metadata of the newest stored profiles, newest first."""
+    directory = _profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for profile_id in reversed(_stored_ids(directory)):
+        if len(profiles) >= limit:
+            break
+        try:
+            with open(os.path.join(directory, f'{profile_id}.json')) as file:
+                profiles.append(json.load(file))
+        except (FileNotFoundError, ValueError):
+            continue  # pruned or still being written
+    return profiles
+
+
+def profile_path(profile_id):
+    """Path of the .folded file of a stored profile, or None."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(_profile_dir(), f'{profile_id}.folded')
+    return path if os.path.exists(path) else None
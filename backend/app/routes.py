@@ -1,29 +1,148 @@
 import os
-import pandas as pd
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, Response, send_file
 from dotenv import load_dotenv
-from .db import fetch_transactions, fetch_chart_data, load_csv_data, get_ordered_labels_as_dataframe, fetch_all_transactions, update_transaction_label, fetch_transactions_by_label_and_month, update_label_order, add_category_to_db, add_label_to_db, fetch_transaction_sums_per_label_per_month, get_reserveringsuitgaven_sum_per_month, get_expenses_per_main_category, fetch_transactions_overview
+from .db import fetch_transactions, fetch_chart_data, load_csv_data, get_ordered_labels_as_dataframe, fetch_all_transactions, update_transaction_label, fetch_transactions_by_label_and_month, update_label_order, add_category_to_db, add_label_to_db, fetch_transaction_sums_per_label_per_month, get_reserveringsuitgaven_sum_per_month, get_expenses_per_main_category, fetch_transactions_overview, search_transactions, fetch_dashboard, iter_export_batches, suggest_labels, fetch_labeling_queue, fetch_changes, fetch_balances, fetch_balance_series, fetch_archived_months
+from . import metrics, async_db, profiling
+from .export import csv_stream, parquet_stream
+from .routing import set_primary_cookie
+from .changes import start_listener
+from .compression import compress_response
+from .balances import INTERVALS as BALANCE_INTERVALS
+from datetime import date, timedelta
 import logging
 
 
 bp = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
 
+# Opt-in sampling profiles of single requests (see profiling.py). after_request
+# hooks run in reverse order, so registered first it also covers the others.
+bp.before_request(profiling.start_profile)
+bp.after_request(profiling.finish_profile)
+bp.teardown_request(profiling.discard_profile)
+
+# Per-request latency, SQL statement count and DB time (see metrics.py)
+bp.before_request(metrics.start_request)
+bp.after_request(metrics.record_request)
+
+# Read-your-writes: keep a client's reads on the primary briefly after it wrote
+bp.after_request(set_primary_cookie)
+
+# gzip/brotli for large responses (see compression.py)
+bp.after_request(compress_response)
+
+# Hear about writes made by other pods and workers (see changes.py)
+bp.before_request(start_listener)
+
+
+def parse_date_range(args):
+    """Read ?from=YYYY-MM-DD, ?to=YYYY-MM-DD (both inclusive) and ?year=YYYY.
+
+    Returns a half-open (start, end) date range; either side may be None.
+    Raises ValueError on malformed input.
+    """
+    start = end = None
+    year = args.get('year')
+    if year:
+        start, end = date(int(year), 1, 1), date(int(year) + 1, 1, 1)
+    if args.get('from'):
+        start = max(filter(None, [start, date.fromisoformat(args['from'])]))
+    if args.get('to'):
+        end = min(filter(None, [end, date.fromisoformat(args['to']) + timedelta(days=1)]))
+    return start, end
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 
 @bp.route('/api/transactions', methods=['GET'])
 def get_transactions():
     month = request.args.get('month')
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         if month:
             transactions = fetch_transactions(month_start=month)
         else:
-            transactions = fetch_transactions()
+            transactions = fetch_transactions(start=start, end=end)
         return jsonify(transactions)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/api/changes', methods=['GET'])
+def get_changes():
+    try:
+        limit = int(request.args.get('limit', 500))
+        return jsonify(fetch_changes(request.args.get('since'), limit))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/balances', methods=['GET'])
+def get_balances():
+    try:
+        day = date.fromisoformat(request.args['date']) if request.args.get('date') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify(fetch_balances(day, request.args.get('rekening')))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/balances/series', methods=['GET'])
+def get_balance_series():
+    interval = request.args.get('interval', 'month')
+    if interval not in BALANCE_INTERVALS:
+        return jsonify({'error': f"interval must be one of {', '.join(BALANCE_INTERVALS)}"}), 400
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify(fetch_balance_series(start, end, request.args.get('rekening'), interval))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/transactions/search', methods=['GET'])
+def search_transactions_route():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    try:
+        start, end = parse_date_range(request.args)
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 50))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify(search_transactions(q, page, per_page, start, end))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# format -> (encoder, mimetype)
+EXPORT_FORMATS = {
+    'csv': (csv_stream, 'text/csv'),
+    'parquet': (parquet_stream, 'application/vnd.apache.parquet'),
+}
+
+@bp.route('/api/export', methods=['GET'])
+def export_transactions():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format "{fmt}", use one of: {", ".join(EXPORT_FORMATS)}'}), 400
+    try:
+        start, end = parse_date_range(request.args)
+        batches = iter_export_batches(start, end, request.args.get('category'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    # A generator body is sent with chunked transfer encoding as it is produced
+    encode, mimetype = EXPORT_FORMATS[fmt]
+    return Response(encode(batches), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="transactions.{fmt}"'})
+
 @bp.route('/api/dbinfo', methods=['GET'])
 def db_info():
     
@@ -51,7 +170,12 @@ def db_info():
 @bp.route('/api/data', methods=['GET'])
 def get_chart_data():
     try:
-        df = fetch_chart_data()
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        import pandas as pd  # imported on first use to keep worker start-up fast
+        df = fetch_chart_data(start, end)
 
         # Ensure 'month' column is converted to datetime if it's not already
         df['month'] = pd.to_datetime(df['month'])
@@ -78,6 +202,18 @@ def get_chart_data():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify(fetch_dashboard(start, end))
+    except Exception as e:
+        logger.error("Error building dashboard: %s", e)
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('/api/load-data', methods=['GET'])
 def load_data():
 
@@ -99,7 +235,7 @@ def get_labels():
             "details": label_tree
         }), 200
     except Exception as e:
-        logging.error("An error occurred: %s", str(e))
+        logger.error("An error occurred: %s", str(e))
         return jsonify({'error': str(e)}), 500
 
 
@@ -107,8 +243,12 @@ def get_labels():
 @bp.route('/api/getlabelmonth', methods=['GET'])
 def get_label_month():
     try:
-        transactions = fetch_all_transactions()  # Fetch all transactions from the database
-        logging.info(f"Num of transactions: {len(transactions)}")
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        transactions = fetch_all_transactions(start, end)  # Fetch the transactions in range from the database
+        logger.info("Num of transactions: %d", len(transactions))
 
         # Extract years and months from the transaction data
         years_set = set()
@@ -117,15 +257,19 @@ def get_label_month():
             date = transaction.datum
             years_set.add(date.year)
             months_set.add(date.month)
+        # Archived years keep their months in the database (see archive.py)
+        for month in fetch_archived_months(start, end):
+            years_set.add(month.year)
+            months_set.add(month.month)
 
-        logging.info(f"Years: {years_set}, Months: {months_set}")
+        logger.info("Years: %s, Months: %s", years_set, months_set)
 
         return jsonify({
             'years': list(years_set),
             'months': list(months_set)
         })
     except Exception as e:
-        logging.error(f"Error in /api/getlabelmonth: {e}")
+        logger.error("Error in /api/getlabelmonth: %s", e)
         return jsonify({'error': str(e)}), 500
     
 @bp.route('/api/updateLabel', methods=['POST'])
@@ -139,15 +283,41 @@ def update_label():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
+@bp.route('/api/labeling-queue', methods=['GET'])
+def get_labeling_queue():
+    try:
+        limit = int(request.args.get('limit', 50))
+        return jsonify(fetch_labeling_queue(limit, request.args.get('cursor')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/suggest-labels', methods=['POST'])
+def suggest_labels_route():
+    companies = (request.get_json(silent=True) or {}).get('companies')
+    if not isinstance(companies, list) or not all(isinstance(company, str) for company in companies):
+        return jsonify({'error': "'companies' must be a list of strings"}), 400
+    try:
+        return jsonify(suggest_labels(companies))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('/api/transactions/summary', methods=['GET'])
 def get_transaction_summary():
     try:
-        logging.info("Received request to /api/transactions/summary")
-        summary = fetch_transactions_by_label_and_month()
-        logging.info("Returning transaction summary")
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        logger.info("Received request to /api/transactions/summary")
+        summary = fetch_transactions_by_label_and_month(start, end)
+        logger.info("Returning transaction summary")
         return jsonify(summary)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logging.error(f"Error in /api/transactions/summary: {e}")
+        logger.error("Error in /api/transactions/summary: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/api/update_label_order', methods=['POST'])
@@ -186,7 +356,7 @@ def update_label_order_route():
         return jsonify({"message": "Label order updated successfully."}), 200
 
     except Exception as e:
-        logging.error(f"Error in /api/update_label_order: {e}")
+        logger.error("Error in /api/update_label_order: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -222,7 +392,11 @@ def add_category():
 @bp.route('/api/transaction-sums', methods=['GET'])
 def get_transaction_sums():
     try:
-        transaction_sums = fetch_transaction_sums_per_label_per_month()
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        transaction_sums = fetch_transaction_sums_per_label_per_month(start, end)
         return transaction_sums
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -230,15 +404,23 @@ def get_transaction_sums():
 @bp.route('/api/getsavings', methods=['GET'])
 def get_savings():
     try:
-        savings_transations = get_reserveringsuitgaven_sum_per_month();
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        savings_transations = get_reserveringsuitgaven_sum_per_month(start, end)
         return savings_transations
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/api/get-expenses-category', methods=['GET'])
-def get_expenses_per_main_category():
+def get_expenses_category():
     try:
-        expenses_per_main_category = get_expenses_per_main_category()
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        expenses_per_main_category = get_expenses_per_main_category(start, end)
         return expenses_per_main_category
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -246,12 +428,77 @@ def get_expenses_per_main_category():
 @bp.route('/api/fetch-transactions-overview', methods=['GET'])
 def fetch_transactions_overview_route():
     try:
-        transactions_overview = fetch_transactions_overview()
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        transactions_overview = fetch_transactions_overview(start, end)
         return transactions_overview
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
 
+# Async variants of the multi-query views (see async_db.py); same parameters and responses
+
+@bp.route('/api/async/dashboard', methods=['GET'])
+async def get_dashboard_async():
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify(await async_db.fetch_dashboard(start, end))
+    except Exception as e:
+        logger.error("Error building dashboard: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/async/get-expenses-category', methods=['GET'])
+async def get_expenses_category_async():
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify(await async_db.get_expenses_per_main_category(start, end))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/async/fetch-transactions-overview', methods=['GET'])
+async def fetch_transactions_overview_async():
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify(await async_db.fetch_transactions_overview(start, end))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    data, content_type = metrics.render()
+    return Response(data, mimetype=content_type)
+
+@bp.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    if not profiling.is_admin():
+        return jsonify({'error': 'Admin token required'}), 403
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(profiling.list_profiles(limit))
+
+@bp.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    if not profiling.is_admin():
+        return jsonify({'error': 'Admin token required'}), 403
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        return jsonify({'error': f'Profile {profile_id} not found'}), 404
+    # Folded stacks: flamegraph.pl, inferno-flamegraph or speedscope render them
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=f'{profile_id}.folded')
+
 @bp.route('/api/hello', methods=['GET'])
 def say_hello():
     return jsonify({"message": "Hello, World!"})
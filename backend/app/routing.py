@@ -0,0 +1,43 @@
+import time
+from flask import current_app, g, has_request_context, request
+
+# Read/write routing between the primary database and the optional read
+# replica (SQLALCHEMY_REPLICA_URI). Read-only functions in db.py ask for a
+# read session, everything else goes to the primary. After a write the client
+# gets a cookie that keeps its reads on the primary for READ_AFTER_WRITE_SECONDS,
+# so it sees its own changes even while the replica is catching up.
+
+PRIMARY_COOKIE = 'db_primary_until'
+
+
+def mark_write():
+    if has_request_context():
+        g.db_wrote = True
+
+
+def reads_from_primary():
+    if not has_request_context():
+        return False
+    if g.get('db_wrote'):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def session_factory(read_only=False):
+    if not read_only:
+        mark_write()
+    elif not reads_from_primary():
+        return current_app.replica_session_factory
+    return current_app.session_factory
+
+
+def set_primary_cookie(response):
+    """after_request hook: pin this client's reads to the primary after a write."""
+    if g.get('db_wrote'):
+        window = current_app.config['READ_AFTER_WRITE_SECONDS']
+        response.set_cookie(PRIMARY_COOKIE, f'{time.time() + window:.0f}',
+                            max_age=window, httponly=True, samesite='Lax')
+    return response
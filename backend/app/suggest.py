@@ -0,0 +1,257 @@
+import re
+import time
+import logging
+import threading
+import numpy as np
+from sqlalchemy import func, select
+from .models import Transaction, TransactionLabel, ArchivedLabelCount
+from .changes import read_versions, behind, lag_delay
+
+logger = logging.getLogger(__name__)
+
+# Nearest-neighbour label suggestions from the transactions labeled so far.
+#
+# Every distinct company string with labeled transactions is one document: a
+# TF-IDF vector of character trigrams (within words, padded with spaces) plus
+# the number of transactions per label. Digits and punctuation are dropped
+# first, so 'AH 1234 Utrecht' and 'AH 5678 Utrecht' are the same merchant.
+# A query company is vectorized the same way and its K most cosine-similar
+# documents vote for their labels, weighted by similarity; the winner comes
+# back with the best similarity among the documents that voted for it.
+#
+# Label updates change the counts in place. A new company appends a row of
+# trigram counts and the TF-IDF weights are recomputed on the next query.
+
+K = 5
+MIN_SIMILARITY = 0.3
+
+# Tables the index is built from
+LABEL_TABLES = ('transaction_labels',)
+
+_NOT_LETTERS = re.compile(r'[\W\d_]+')
+
+
+def normalize(company):
+    return ' '.join(_NOT_LETTERS.sub(' ', (company or '').lower()).split())
+
+
+def trigrams(text):
+    for word in text.split():
+        padded = f' {word} '
+        for i in range(len(padded) - 2):
+            yield padded[i:i + 3]
+
+
+class LabelIndex:
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._versions = {}
+        # Loads in a row that were behind the known versions, and when to retry
+        self._lagging_loads = 0
+        self._retry_at = 0
+        self._vocab = {}
+        self._documents = {}  # normalized company -> row
+        self._terms = []      # per row: (trigram ids, counts)
+        self._labels = []     # per row: {label_id: transactions}
+        self._matrix = None   # L2-normalized TF-IDF rows, None until (re)built
+        self._idf = None
+        self._unseen_idf = None
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def __len__(self):
+        return len(self._terms)
+
+    def is_stale(self, primary=False):
+        if not self.loaded:
+            return True
+        if behind(self._versions, LABEL_TABLES):
+            # A load from the primary is current; from the replica, not before
+            # a lagging replica had time to catch up (see changes.py)
+            return primary or time.monotonic() >= self._retry_at
+        return self.max_age is not None and time.monotonic() - self._loaded_at > self.max_age
+
+    def load(self, session):
+        """(Re)build the index from the label counts per company."""
+        start = time.perf_counter()
+        versions = read_versions(session, LABEL_TABLES)
+        rows = session.execute(
+            select(Transaction.company, TransactionLabel.label_id, func.count())
+            .join(TransactionLabel, Transaction.id == TransactionLabel.transaction_id)
+            .group_by(Transaction.company, TransactionLabel.label_id)
+        ).all()
+        # Plus the archived years' counts (archive.py); _add_locked sums duplicates
+        rows += session.execute(
+            select(ArchivedLabelCount.company, ArchivedLabelCount.label_id, ArchivedLabelCount.transactions)
+        ).all()
+        with self._lock:
+            self._vocab, self._documents, self._terms, self._labels = {}, {}, [], []
+            self._matrix = None
+            for company, label_id, count in rows:
+                self._add_locked(company, label_id, count)
+            self._versions = versions
+            self._loaded_at = time.monotonic()
+            if behind(versions, LABEL_TABLES):
+                self._retry_at = self._loaded_at + lag_delay(self._lagging_loads)
+                self._lagging_loads += 1
+            else:
+                self._retry_at, self._lagging_loads = 0, 0
+        logger.info("Label index built from %d labeled companies in %.0f ms",
+                    len(self._terms), (time.perf_counter() - start) * 1000)
+
+    def _term_counts(self, text, grow):
+        counts = {}
+        for gram in trigrams(text):
+            term = self._vocab.get(gram)
+            if term is None:
+                if not grow:
+                    continue
+                term = self._vocab[gram] = len(self._vocab)
+            counts[term] = counts.get(term, 0) + 1
+        return np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)), \
+            np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+
+    def _unseen_counts(self, text):
+        # Counts of the trigrams of a query that no labeled company has
+        counts = {}
+        for gram in trigrams(text):
+            if gram not in self._vocab:
+                counts[gram] = counts.get(gram, 0) + 1
+        return np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+
+    def _add_locked(self, company, label_id, count=1):
+        key = normalize(company)
+        if not key:
+            return
+        row = self._documents.get(key)
+        if row is None:
+            row = self._documents[key] = len(self._terms)
+            self._terms.append(self._term_counts(key, grow=True))
+            self._labels.append({})
+            self._matrix = None
+        self._labels[row][label_id] = self._labels[row].get(label_id, 0) + count
+
+    def relabel(self, company, old_label_id, new_label_id):
+        """Move one transaction of `company` from `old_label_id` (None: unlabeled) to `new_label_id`."""
+        if not self.loaded:
+            return
+        with self._lock:
+            if old_label_id is not None:
+                row = self._documents.get(normalize(company))
+                if row is not None and self._labels[row].get(old_label_id):
+                    self._labels[row][old_label_id] -= 1
+                    if not self._labels[row][old_label_id]:
+                        del self._labels[row][old_label_id]
+            self._add_locked(company, new_label_id)
+
+    def note_own_write(self, versions):
+        """As TransactionStore.note_own_write(): current again after relabel() of our own write."""
+        with self._lock:
+            version = versions.get('transaction_labels')
+            if version is not None and self._versions.get('transaction_labels') == version - 1:
+                self._versions['transaction_labels'] = version
+
+    def _weighted(self, rows, shape, unseen=None):
+        from scipy import sparse  # loaded with the first index query, not at start-up
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(terms) for terms, _ in rows], out=indptr[1:])
+        indices = np.concatenate([terms for terms, _ in rows]) if rows else np.empty(0, dtype=np.int32)
+        data = np.concatenate([counts for _, counts in rows]) if rows else np.empty(0)
+        matrix = sparse.csr_matrix((data * self._idf[indices], indices, indptr), shape=shape)
+        squares = np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()
+        if unseen is not None:
+            # Trigrams outside the vocabulary match no document but still count
+            # towards the length of the query, at the IDF of a term in no document
+            squares += [np.sum((counts * self._unseen_idf) ** 2) for counts in unseen]
+        norms = np.sqrt(squares)
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+    def _build_locked(self):
+        n, size = len(self._terms), len(self._vocab)
+        document_frequency = np.bincount(
+            np.concatenate([terms for terms, _ in self._terms]) if self._terms else np.empty(0, dtype=np.int32),
+            minlength=size)
+        # Smoothed IDF, as sklearn's TfidfVectorizer
+        self._idf = np.log((1 + n) / (1 + document_frequency)) + 1
+        self._unseen_idf = np.log(1 + n) + 1
+        self._matrix = self._weighted(self._terms, (n, size))
+
+    def suggest(self, companies):
+        """(label_id, similarity) per company; (None, 0.0) when no labeled company is similar enough."""
+        results = [(None, 0.0)] * len(companies)
+        with self._lock:
+            if not self._terms or not companies:
+                return results
+            if self._matrix is None:
+                self._build_locked()
+            keys = [normalize(company) for company in companies]
+            queries = self._weighted([self._term_counts(key, grow=False) for key in keys],
+                                     (len(companies), self._matrix.shape[1]),
+                                     unseen=[self._unseen_counts(key) for key in keys])
+            similarities = (queries @ self._matrix.T).tocsr()
+
+            for i in range(len(companies)):
+                start, end = similarities.indptr[i], similarities.indptr[i + 1]
+                if start == end:
+                    continue
+                scores = similarities.data[start:end]
+                rows = similarities.indices[start:end]
+                if len(scores) > K:
+                    top = np.argpartition(scores, -K)[-K:]
+                    scores, rows = scores[top], rows[top]
+
+                votes, best = {}, {}
+                for row, score in zip(rows, scores):
+                    counts = self._labels[row]
+                    total = sum(counts.values())
+                    if score < MIN_SIMILARITY or not total:
+                        continue
+                    for label_id, count in counts.items():
+                        votes[label_id] = votes.get(label_id, 0.0) + score * count / total
+                        best[label_id] = max(best.get(label_id, 0.0), score)
+                if votes:
+                    label_id = max(votes, key=votes.get)
+                    results[i] = (label_id, min(1.0, float(best[label_id])))
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_label_index(session_factory, max_age=None, primary=False):
+    """Return this process' index, building it on first use or when out of date.
+
+    `primary` as for columnar.get_store().
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LabelIndex(max_age=max_age)
+    if _index.is_stale(primary):
+        # One thread rebuilds; others keep using the current index meanwhile
+        # (a client that must see its own writes waits for it instead)
+        if _index_lock.acquire(blocking=primary or not _index.loaded):
+            try:
+                if _index.is_stale(primary):
+                    session = session_factory()
+                    try:
+                        _index.load(session)
+                    finally:
+                        session.close()
+            finally:
+                _index_lock.release()
+    return _index
+
+
+def peek_label_index():
+    """The index if this process has one, without building it (for write hooks)."""
+    return _index
@@ -0,0 +1,32 @@
+"""Compare two db_bench result files.
+
+    python -m benchmarks.compare bench_results/before.json bench_results/after.json
+"""
+import json
+import sys
+
+
+def load(path):
+    with open(path) as file:
+        report = json.load(file)
+    return {(run['rows'], name): result
+            for run in report['runs'] for name, result in run['functions'].items()}
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) != 2:
+        print(__doc__)
+        return 2
+    before, after = load(argv[0]), load(argv[1])
+    print(f'{"rows":>9}  {"function":<45} {"before":>10} {"after":>10} {"ratio":>7}')
+    for key in sorted(set(before) & set(after)):
+        old, new = before[key].get('median_s'), after[key].get('median_s')
+        if old is None or new is None:
+            continue
+        print(f'{key[0]:>9}  {key[1]:<45} {old:>10.4f} {new:>10.4f} {new / old:>6.2f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
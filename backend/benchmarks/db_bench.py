@@ -0,0 +1,200 @@
+"""Time every public query path in app/db.py against synthetic data.
+
+Run from the backend directory:
+
+    python -m benchmarks.db_bench --sizes 1000,100000,1000000 --output bench_results/run.json
+    python -m benchmarks.compare bench_results/before.json bench_results/after.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from app import create_app
+from app import db, columnar, suggest
+from app.models import Base
+from app.bootstrap import bootstrap_database
+from . import synthetic
+from .pg import throwaway_postgres
+
+# Paths that run model inference per row are capped by default; at 1M rows they
+# take hours and would dominate the run. --no-caps removes the cap.
+CASES = [
+    # (name, function, row cap or None)
+    ('fetch_all_transactions', lambda ctx: db.fetch_all_transactions(), None),
+    ('fetch_labels', lambda ctx: db.fetch_labels(), None),
+    ('fetch_transactions[month]', lambda ctx: db.fetch_transactions(month_start='October 2024'), None),
+    ('fetch_transactions[all]', lambda ctx: db.fetch_transactions(), 20000),
+    ('search_transactions[word]', lambda ctx: db.search_transactions('jumbo'), None),
+    ('search_transactions[phrase]', lambda ctx: db.search_transactions('"albert heijn" utrecht'), None),
+    ('suggest_labels', lambda ctx: db.suggest_labels(ctx['companies']), None),
+    ('fetch_chart_data', lambda ctx: db.fetch_chart_data(), None),
+    ('get_ordered_labels_as_dataframe', lambda ctx: db.get_ordered_labels_as_dataframe(), None),
+    ('fetch_transactions_by_label_and_month', lambda ctx: db.fetch_transactions_by_label_and_month(), None),
+    ('fetch_transaction_sums_per_label_per_month', lambda ctx: db.fetch_transaction_sums_per_label_per_month(), None),
+    ('get_reserveringsuitgaven_sum_per_month', lambda ctx: db.get_reserveringsuitgaven_sum_per_month(), None),
+    ('get_expenses_per_main_category', lambda ctx: db.get_expenses_per_main_category(), None),
+    ('fetch_transactions_overview', lambda ctx: db.fetch_transactions_overview(), None),
+    ('fetch_dashboard', lambda ctx: db.fetch_dashboard(), None),
+    ('update_transaction_label', lambda ctx: db.update_transaction_label(ctx['next_id'](), ctx['label_name']), None),
+    ('update_label_order', lambda ctx: db.update_label_order(ctx['label_order']), None),
+    ('add_category_to_db', lambda ctx: db.add_category_to_db(ctx['unique_name']('bench category')), None),
+    ('add_label_to_db', lambda ctx: db.add_label_to_db(ctx['unique_name']('bench label')), None),
+]
+
+
+def label_order_tree(categories, labels):
+    """The tree in the format posted by LabelsPage.js to /api/update_label_order."""
+    def node(name):
+        children = [node(child) for child, parent in categories if parent == name]
+        children += [{'title': label, 'type': 'label', 'children': []} for label, cat in labels if cat == name]
+        return {'title': name, 'type': 'category', 'children': children}
+    return [node(name) for name, parent in categories if parent is None]
+
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        'repeat': repeat,
+        'min_s': min(timings),
+        'median_s': statistics.median(timings),
+        'max_s': max(timings),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_size(app, n, args, workdir):
+    categories, labels = synthetic.build_label_tree(args.depth, args.breadth, args.labels_per_category)
+    merchants = synthetic.build_merchants(labels, args.merchants, seed=args.seed)
+
+    with app.app_context():
+        session = db.get_session()
+        try:
+            synthetic.reset_database(session)
+            label_ids = synthetic.load_label_tree(session, categories, labels)
+            load_start = time.perf_counter()
+            synthetic.load_transactions(session, n, merchants, label_ids, args.labeled_fraction, seed=args.seed)
+            load_seconds = time.perf_counter() - load_start
+        finally:
+            session.close()
+        # The columnar store and label index are per-process and nothing
+        # publishes the bulk load: drop them so this size's cases load its rows
+        columnar._store = None
+        suggest._index = None
+
+        counter = {'id': 0, 'name': 0}
+
+        def next_id():
+            counter['id'] = counter['id'] % n + 1
+            return counter['id']
+
+        def unique_name(prefix):
+            counter['name'] += 1
+            return f'{prefix} {n}-{counter["name"]}'
+
+        ctx = {
+            'next_id': next_id,
+            'unique_name': unique_name,
+            'label_name': labels[-1][0],
+            'label_order': label_order_tree(categories, labels),
+            'companies': [company for company, _ in merchants],
+        }
+
+        results = {'rows': n, 'bulk_load_s': load_seconds, 'functions': {}}
+        for name, fn, cap in CASES:
+            if args.only and name not in args.only:
+                continue
+            if cap is not None and n > cap and not args.no_caps:
+                results['functions'][name] = {'skipped': f'rows > cap ({cap})'}
+                continue
+            try:
+                results['functions'][name] = time_call(lambda: fn(ctx), args.repeat)
+            except Exception as e:
+                results['functions'][name] = {'error': str(e)}
+            print(f'  {n:>9} {name:<45} {results["functions"][name]}', flush=True)
+
+        # Ingest last: it adds rows. The CSV holds fresh rows plus duplicates of existing ones.
+        if not args.only or 'load_csv_data' in args.only:
+            fresh = list(synthetic.generate_csv_rows(args.csv_rows, merchants, seed=args.seed + n + 7))
+            dupes = list(synthetic.generate_csv_rows(min(args.csv_rows, n), merchants, seed=args.seed))
+            synthetic.write_csv(os.path.join(workdir, 'data.csv'), fresh + dupes)
+            try:
+                results['functions']['load_csv_data'] = time_call(db.load_csv_data, 1)
+            except Exception as e:
+                results['functions']['load_csv_data'] = {'error': str(e)}
+            print(f'  {n:>9} {"load_csv_data":<45} {results["functions"]["load_csv_data"]}', flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,100000,1000000', help='comma-separated transaction counts')
+    parser.add_argument('--depth', type=int, default=3, help='category tree depth below UITGAVEN')
+    parser.add_argument('--breadth', type=int, default=3, help='child categories per category')
+    parser.add_argument('--labels-per-category', type=int, default=3)
+    parser.add_argument('--labeled-fraction', type=float, default=0.6)
+    parser.add_argument('--merchants', type=int, default=500)
+    parser.add_argument('--csv-rows', type=int, default=1000, help='new rows in the load_csv_data file')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='*', help='only run these function names')
+    parser.add_argument('--no-caps', action='store_true', help='run capped cases at every size')
+    parser.add_argument('--output', default=None, help='JSON results file (default bench_results/<timestamp>.json)')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    output = args.output or os.path.join('bench_results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+
+    workdir = tempfile.mkdtemp(prefix='pf-bench-')
+    categories, labels = synthetic.build_label_tree(args.depth, args.breadth, args.labels_per_category)
+    model_path = synthetic.train_model(synthetic.build_merchants(labels, args.merchants, seed=args.seed),
+                                       os.path.join(workdir, 'label_predictor.joblib'))
+
+    with throwaway_postgres() as uri:
+        # load_csv_data() reads data.csv from the working directory
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'MODEL_PATH': model_path})
+            with app.app_context():
+                Base.metadata.drop_all(app.engine)
+                bootstrap_database()
+            runs = []
+            for n in sizes:
+                print(f'Benchmarking {n} transactions', flush=True)
+                runs.append(run_size(app, n, args, workdir))
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'runs': runs,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
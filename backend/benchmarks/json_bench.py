@@ -0,0 +1,147 @@
+"""Serialization time and response size per endpoint, per JSON provider and encoding.
+
+For every endpoint the response payload is captured once and then:
+  - serialized with Flask's default provider and with the orjson provider
+  - compressed with gzip and brotli (bytes on the wire and compression time)
+and the whole request is timed with each provider.
+
+Run from the backend directory:
+
+    python -m benchmarks.json_bench --rows 20000 --output bench_results/json.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import create_app, db
+from app.models import Base
+from app.bootstrap import bootstrap_database
+from app.json_provider import OrjsonProvider
+from app.compression import brotli, compress
+from . import synthetic
+from .db_bench import git_revision
+from .pg import throwaway_postgres
+
+ENDPOINTS = [
+    '/api/transactions?year=2024',
+    '/api/transactions/search?q=jumbo&per_page=200',
+    '/api/data',
+    '/api/getlabels',
+    '/api/getlabelmonth',
+    '/api/transaction-sums',
+    '/api/getsavings',
+    '/api/get-expenses-category',
+    '/api/fetch-transactions-overview',
+    '/api/dashboard',
+]
+
+
+def median_s(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def capture_payload(app, client, path):
+    """The object the endpoint passes to jsonify()."""
+    captured = []
+    provider = app.json
+    original = provider.response
+
+    def recording(*args, **kwargs):
+        captured.append(provider._prepare_response_obj(args, kwargs))
+        return original(*args, **kwargs)
+
+    provider.response = recording
+    try:
+        response = client.get(path)
+    finally:
+        del provider.response
+    if response.status_code != 200 or not captured:
+        raise RuntimeError(f'{path}: {response.status_code} {response.get_data(as_text=True)[:200]}')
+    return captured[-1]
+
+
+def bench_endpoint(app, client, path, repeat):
+    payload = capture_payload(app, client, path)
+    providers = {'default': DefaultJSONProvider(app), 'orjson': OrjsonProvider(app)}
+    result = {'serialize_ms': {}, 'request_ms': {}, 'bytes': {}, 'compress_ms': {}}
+
+    body = None
+    for name, provider in providers.items():
+        result['serialize_ms'][name] = median_s(lambda: provider.response(payload), repeat) * 1000
+        app.json = provider
+        result['request_ms'][name] = median_s(lambda: client.get(path), repeat) * 1000
+        body = provider.response(payload).get_data()
+        result['bytes'][name] = len(body)
+
+    with app.app_context():
+        for encoding in ('gzip', 'br') if brotli is not None else ('gzip',):
+            result['bytes'][encoding] = len(compress(body, encoding))
+            result['compress_ms'][encoding] = median_s(lambda: compress(body, encoding), repeat) * 1000
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000, help='synthetic transactions')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help='JSON results file (default bench_results/json-<timestamp>.json)')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='pf-bench-')
+    categories, labels = synthetic.build_label_tree()
+    merchants = synthetic.build_merchants(labels, seed=args.seed)
+    model_path = synthetic.train_model(merchants, os.path.join(workdir, 'label_predictor.joblib'))
+
+    endpoints = {}
+    with throwaway_postgres() as uri:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'MODEL_PATH': model_path, 'CACHE_INVALIDATION': 'off'})
+        with app.app_context():
+            Base.metadata.drop_all(app.engine)
+            bootstrap_database()
+            session = db.get_session()
+            try:
+                synthetic.reset_database(session)
+                label_ids = synthetic.load_label_tree(session, categories, labels)
+                synthetic.load_transactions(session, args.rows, merchants, label_ids, seed=args.seed)
+            finally:
+                session.close()
+
+        client = app.test_client()
+        for path in ENDPOINTS:
+            endpoints[path] = bench_endpoint(app, client, path, args.repeat)
+            r = endpoints[path]
+            sizes = ', '.join(f'{name} {size / 1024:.1f} KiB' for name, size in r['bytes'].items())
+            print(f'{path:<48} serialize default {r["serialize_ms"]["default"]:7.2f} ms, '
+                  f'orjson {r["serialize_ms"]["orjson"]:6.2f} ms; {sizes}', flush=True)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'endpoints': endpoints,
+    }
+    output = args.output or os.path.join('bench_results', datetime.now().strftime('json-%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
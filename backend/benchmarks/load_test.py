@@ -0,0 +1,402 @@
+"""Load test: replay the frontend's request mix at increasing concurrency.
+
+Starts a throwaway PostgreSQL with synthetic data and the backend under
+gunicorn (gunicorn.conf.py) on top of it, unless --url points at a backend
+that is already running. Virtual users then loop over the page scenarios
+below, with exponentially distributed think time between actions, for
+--stage-seconds at every concurrency in --stages. Per stage and endpoint the
+report holds throughput, p50/p95/p99 latency and error rate.
+
+Run from the backend directory:
+
+    python -m benchmarks.load_test --rows 50000 --stages 1,5,10,25,50 --stage-seconds 30
+    python -m benchmarks.load_test --url http://localhost:5000 --read-only --stages 10
+    python -m benchmarks.load_test --baseline bench_results/load-before.json
+
+Results are written to bench_results/load-<timestamp>.json; with --baseline
+the throughput and p95 of every stage and endpoint are compared to an earlier
+run. The scenarios write (label clicks, label order saves, new labels) unless
+--read-only is given, so only point --url at a disposable database.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+
+from sqlalchemy.engine import make_url
+
+from . import synthetic
+from .db_bench import git_revision
+from .pg import throwaway_postgres, _free_port
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September',
+               'October', 'November', 'December']
+
+
+class StageOver(Exception):
+    """Raised inside a scenario when its stage has ended."""
+
+
+class Recorder:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # endpoint -> [(seconds, ok)]
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((seconds, ok))
+
+
+class User:
+    """One browser tab: a keep-alive connection, its own RNG and think time."""
+
+    def __init__(self, base_url, recorder, stop, rng, think_time, read_only):
+        parts = urlsplit(base_url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+        self.recorder = recorder
+        self.stop = stop
+        self.rng = rng
+        self.think_time = think_time
+        self.read_only = read_only
+
+    def think(self):
+        if self.think_time:
+            self.stop.wait(self.rng.expovariate(1 / self.think_time))
+
+    def request(self, method, path, body=None):
+        if self.stop.is_set():
+            raise StageOver()
+        endpoint = f'{method} {path.split("?")[0]}'
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            data, ok = None, False
+        self.recorder.record(endpoint, time.perf_counter() - start, ok)
+        if not ok:
+            return None
+        if response.getheader('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        return json.loads(data) if data else None
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post(self, path, body):
+        if self.read_only:
+            return None
+        return self.request('POST', path, body)
+
+
+def label_names(details):
+    names = []
+    for node in details:
+        names += [label['name'] for label in node.get('labels', [])]
+        names += label_names(node.get('children', []))
+    return names
+
+
+def label_order_tree(details):
+    """The tree LabelsPage.js posts to /api/update_label_order, built from /api/getlabels."""
+    return [{
+        'title': node['name'],
+        'type': 'category',
+        'children': label_order_tree(node.get('children', []))
+                    + [{'title': label['name'], 'type': 'label', 'children': []} for label in node.get('labels', [])],
+    } for node in details]
+
+
+# --- Page scenarios, following the fetches in frontend/src ------------------------
+
+def home(user):
+    # Home.js: the dashboard, then a click on a chart bar shows that month
+    dashboard = user.get('/api/dashboard') or {}
+    months = dashboard.get('chart', {}).get('labels') or []
+    if months and user.rng.random() < 0.5:
+        user.think()
+        user.get(f'/api/transactions?month={quote(user.rng.choice(months))}')
+
+
+def label_data(user):
+    # LabelData.js: pick a month, then label some of its unlabeled transactions,
+    # mostly by applying the suggested label
+    label_months = user.get('/api/getlabelmonth') or {}
+    labels = label_names((user.get('/api/getlabels') or {}).get('details', []))
+    if not label_months.get('years') or not label_months.get('months') or not labels:
+        return
+    user.think()
+    month = f'{MONTH_NAMES[user.rng.choice(label_months["months"]) - 1]} {user.rng.choice(label_months["years"])}'
+    transactions = user.get(f'/api/transactions?month={quote(month)}') or []
+    unlabeled = [transaction for transaction in transactions if not transaction['label']]
+    for transaction in user.rng.sample(unlabeled, min(len(unlabeled), user.rng.randint(1, 5))):
+        user.think()
+        suggested = transaction.get('suggested_label')
+        label = suggested if suggested and user.rng.random() < 0.7 else user.rng.choice(labels)
+        user.post('/api/updateLabel', {'transactionId': transaction['id'], 'labelName': label})
+
+
+def finance_overview(user):
+    # FinanceOverview.js (the browser sends these three in parallel)
+    user.get('/api/data')
+    user.get('/api/getlabels')
+    user.get('/api/transaction-sums')
+
+
+def labels_page(user):
+    # LabelsPage.js: view the tree; now and then add a label or category, or save the order
+    details = (user.get('/api/getlabels') or {}).get('details', [])
+    action = user.rng.random()
+    if action < 0.1 and details:
+        user.think()
+        user.post('/api/update_label_order', label_order_tree(details))
+    elif action < 0.13:
+        user.think()
+        user.post('/api/add-label', {'name': f'load test label {uuid.uuid4().hex[:8]}'})
+    elif action < 0.15:
+        user.think()
+        user.post('/api/add-category', {'name': f'load test category {uuid.uuid4().hex[:8]}'})
+
+
+# (scenario, share of page visits)
+SCENARIOS = [
+    (home, 0.4),
+    (label_data, 0.3),
+    (finance_overview, 0.2),
+    (labels_page, 0.1),
+]
+
+
+def run_user(user):
+    scenarios, weights = zip(*SCENARIOS)
+    try:
+        while not user.stop.is_set():
+            user.rng.choices(scenarios, weights)[0](user)
+            user.think()
+    except StageOver:
+        pass
+    finally:
+        user.connection.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(samples, seconds):
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': errors / len(samples) if samples else 0.0,
+        'throughput_rps': len(samples) / seconds,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+    }
+
+
+def run_stage(base_url, users, seconds, args, seed):
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=run_user, daemon=True, args=(
+            User(base_url, recorder, stop, random.Random(seed + i), args.think_time, args.read_only),))
+        for i in range(users)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    # Requests still in flight at the end count too; measure over the real span
+    elapsed = time.perf_counter() - start
+
+    endpoints = {endpoint: summarize(samples, elapsed) for endpoint, samples in sorted(recorder.samples.items())}
+    return {
+        'users': users,
+        'seconds': elapsed,
+        'total': summarize([sample for samples in recorder.samples.values() for sample in samples], elapsed),
+        'endpoints': endpoints,
+    }
+
+
+def seed_database(uri, args, workdir):
+    from app import create_app, db
+    from app.models import Base
+    from app.bootstrap import bootstrap_database
+
+    categories, labels = synthetic.build_label_tree()
+    merchants = synthetic.build_merchants(labels, seed=args.seed)
+    model_path = synthetic.train_model(merchants, os.path.join(workdir, 'label_predictor.joblib'))
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'CACHE_INVALIDATION': 'off'})
+    with app.app_context():
+        Base.metadata.drop_all(app.engine)
+        bootstrap_database()
+        session = db.get_session()
+        try:
+            synthetic.reset_database(session)
+            label_ids = synthetic.load_label_tree(session, categories, labels)
+            synthetic.load_transactions(session, args.rows, merchants, label_ids, seed=args.seed)
+        finally:
+            session.close()
+    for engine in {app.engine, app.replica_engine}:
+        engine.dispose()
+    return model_path
+
+
+@contextmanager
+def local_backend(uri, model_path, args, workdir):
+    """Run gunicorn with the production config against `uri`; yields its base URL."""
+    url = make_url(uri)
+    port = _free_port()
+    env = dict(
+        os.environ,
+        POSTGRES_USER=url.username or '',
+        POSTGRES_PASSWORD=url.password or '',
+        POSTGRES_HOST=url.host,
+        POSTGRES_PORT=str(url.port),
+        POSTGRES_DB=url.database,
+        MODEL_PATH=model_path,
+        PORT=str(port),
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+        LOG_LEVEL='WARNING',
+        GUNICORN_LOG_LEVEL='warning',
+    )
+    log_path = os.path.join(workdir, 'gunicorn.log')
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null'],
+                                   cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with {process.returncode}, see {log_path}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', '/api/hello')
+                if connection.getresponse().status == 200:
+                    break
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'backend did not start, see {log_path}')
+            time.sleep(0.5)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def print_stage(stage):
+    total = stage['total']
+    print(f'{stage["users"]:>4} users: {total["throughput_rps"]:7.1f} req/s, p50 {total["p50_ms"] or 0:7.1f} ms, '
+          f'p95 {total["p95_ms"] or 0:7.1f} ms, p99 {total["p99_ms"] or 0:7.1f} ms, '
+          f'errors {total["error_rate"]:.1%}', flush=True)
+    for endpoint, result in stage['endpoints'].items():
+        print(f'        {endpoint:<36} {result["throughput_rps"]:7.1f} req/s  p50 {result["p50_ms"]:7.1f}  '
+              f'p95 {result["p95_ms"]:7.1f}  p99 {result["p99_ms"]:7.1f} ms  errors {result["error_rate"]:.1%}')
+
+
+def compare(baseline, report):
+    before = {(stage['users'], endpoint): result
+              for stage in baseline['stages'] for endpoint, result in [('total', stage['total']), *stage['endpoints'].items()]}
+    print(f'\n{"users":>5}  {"endpoint":<36} {"req/s before":>12} {"after":>8} {"p95 before":>11} {"after":>8}')
+    for stage in report['stages']:
+        for endpoint, result in [('total', stage['total']), *stage['endpoints'].items()]:
+            old = before.get((stage['users'], endpoint))
+            if old is None or old['p95_ms'] is None or result['p95_ms'] is None:
+                continue
+            print(f'{stage["users"]:>5}  {endpoint:<36} {old["throughput_rps"]:>12.1f} {result["throughput_rps"]:>8.1f} '
+                  f'{old["p95_ms"]:>11.1f} {result["p95_ms"]:>8.1f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='backend to test instead of starting one (e.g. http://localhost:5000)')
+    parser.add_argument('--rows', type=int, default=50000, help='synthetic transactions for the local backend')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers for the local backend')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker for the local backend')
+    parser.add_argument('--stages', default='1,5,10,25,50', help='comma-separated concurrent users per stage')
+    parser.add_argument('--stage-seconds', type=float, default=30)
+    parser.add_argument('--think-time', type=float, default=1.0, help='mean seconds between user actions (0: none)')
+    parser.add_argument('--read-only', action='store_true', help='skip the POST requests')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', help='earlier load test result file to compare against')
+    parser.add_argument('--output', default=None, help='JSON results file (default bench_results/load-<timestamp>.json)')
+    args = parser.parse_args(argv)
+
+    stages = [int(users) for users in args.stages.split(',')]
+    workdir = tempfile.mkdtemp(prefix='pf-load-')
+
+    def run(base_url):
+        results = []
+        for i, users in enumerate(stages):
+            stage = run_stage(base_url, users, args.stage_seconds, args, args.seed + 1000 * i)
+            print_stage(stage)
+            results.append(stage)
+        return results
+
+    if args.url:
+        results = run(args.url)
+    else:
+        with throwaway_postgres() as uri:
+            model_path = seed_database(uri, args, workdir)
+            with local_backend(uri, model_path, args, workdir) as base_url:
+                results = run(base_url)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+        'stages': results,
+    }
+    output = args.output or os.path.join('bench_results', datetime.now().strftime('load-%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'Results written to {output}')
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(json.load(file), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Resident memory per worker with the label model loaded, with and without memory-mapping.
+
+Starts --workers processes that each hold the model and run one batch of
+predictions, the way gunicorn workers do, and reads their memory from
+/proc/<pid>/smaps_rollup (Linux only):
+
+  rss  resident pages, including pages shared with other processes
+  pss  proportional set size: shared pages divided over the processes sharing
+       them; the sum over all workers is what they really cost the node
+  uss  pages only this process has (private)
+
+Both ways workers can come to hold the model are measured:
+
+  spawn  every worker loads the file itself: gunicorn without preload, workers
+         in other replicas on the node, or a model reloaded after a restart
+  fork   the master loads the model and forks (preload_app, see wsgi.py)
+
+Figures are net of a worker that imported sklearn but loaded no model.
+
+Run from the backend directory:
+
+    python -m benchmarks.model_memory --workers 4
+    python -m benchmarks.model_memory --model label_predictor.joblib --output bench_results/model-memory.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+
+from app.model_files import load_model, save_model
+from . import synthetic
+from .db_bench import git_revision
+
+FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty')
+
+
+def memory_kib(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as file:
+        for line in file:
+            name, _, rest = line.partition(':')
+            if name in FIELDS:
+                values[name] = int(rest.split()[0])
+    return {'rss': values['Rss'], 'pss': values['Pss'], 'uss': values['Private_Clean'] + values['Private_Dirty']}
+
+
+def import_sklearn():
+    # What a process imports before its first prediction, so baselines import it too
+    import sklearn.pipeline, sklearn.feature_extraction.text, sklearn.linear_model  # noqa: E401,F401
+
+
+def worker(path, mmap, companies, ready, done, model=None):
+    import_sklearn()
+    if path is not None and model is None:
+        model = load_model(path, mmap=mmap)
+    if model is not None:
+        model.predict_proba(companies)
+    ready.put(os.getpid())
+    done.wait()
+
+
+def measure(context, workers, path, mmap, companies, model=None):
+    """Memory per worker (KiB), sampled while all `workers` processes are alive."""
+    ready, done = context.Queue(), context.Event()
+    processes = [context.Process(target=worker, args=(path, mmap, companies, ready, done, model))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        pids = [ready.get(timeout=120) for _ in processes]
+        return [memory_kib(pid) for pid in pids]
+    finally:
+        done.set()
+        for process in processes:
+            process.join()
+
+
+def preloaded_master(workers, path, mmap, companies, results):
+    # A fresh master per measurement, so no earlier run's heap is inherited
+    import_sklearn()
+    model = load_model(path, mmap=mmap) if path is not None else None
+    results.put(measure(multiprocessing.get_context('fork'), workers, None, mmap, companies, model))
+
+
+def run(start_method, workers, path, mmap, companies):
+    context = multiprocessing.get_context('spawn')
+    if start_method == 'spawn':
+        return measure(context, workers, path, mmap, companies)
+    results = context.Queue()
+    master = context.Process(target=preloaded_master, args=(workers, path, mmap, companies, results))
+    master.start()
+    try:
+        return results.get(timeout=300)
+    finally:
+        master.join()
+
+
+def net(samples, baseline):
+    """Mean per worker and sum over workers, minus the no-model baseline."""
+    result = {}
+    for key in ('rss', 'pss', 'uss'):
+        base = sum(sample[key] for sample in baseline) / len(baseline)
+        values = [sample[key] - base for sample in samples]
+        result[key] = {'per_worker_mib': sum(values) / len(values) / 1024, 'total_mib': sum(values) / 1024}
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=None, help='model file to measure (default: train a synthetic one)')
+    parser.add_argument('--merchants', type=int, default=20000, help='merchants for the synthetic model')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None,
+                        help='JSON results file (default bench_results/model-memory-<timestamp>.json)')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='pf-bench-')
+    categories, labels = synthetic.build_label_tree()
+    merchants = synthetic.build_merchants(labels, count=args.merchants, seed=args.seed)
+    companies = [company for company, _ in merchants[:500]]
+    path = os.path.join(workdir, 'label_predictor.joblib')
+    if args.model:
+        # Rewritten in the memory-mappable layout in case it is compressed
+        save_model(load_model(args.model, mmap=False), path)
+    else:
+        synthetic.train_model(merchants, path)
+    print(f'Model file: {os.path.getsize(path) / 2 ** 20:.1f} MiB', flush=True)
+
+    results = {}
+    for start_method in ('spawn', 'fork'):
+        baseline = run(start_method, args.workers, None, False, companies)
+        for mmap in (False, True):
+            samples = run(start_method, args.workers, path, mmap, companies)
+            name = f'{start_method}/{"mmap" if mmap else "heap"}'
+            results[name] = {'net': net(samples, baseline), 'samples_kib': samples, 'baseline_kib': baseline}
+
+            r = results[name]['net']
+            print(f'{name:<12} per worker: rss {r["rss"]["per_worker_mib"]:6.1f} MiB, '
+                  f'pss {r["pss"]["per_worker_mib"]:6.1f} MiB, uss {r["uss"]["per_worker_mib"]:6.1f} MiB; '
+                  f'{args.workers} workers pss total {r["pss"]["total_mib"]:6.1f} MiB', flush=True)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'model_bytes': os.path.getsize(path),
+        'results': results,
+    }
+    output = args.output or os.path.join('bench_results', datetime.now().strftime('model-memory-%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+# Throwaway PostgreSQL for benchmarks. Set BENCH_DATABASE_URI to use an existing
+# (disposable!) database instead; its tables are truncated by the benchmarks.
+
+
+def _find_binary(name):
+    path = shutil.which(name)
+    if path:
+        return path
+    # Debian/Ubuntu keep the server binaries out of PATH
+    candidates = sorted(glob.glob(f'/usr/lib/postgresql/*/bin/{name}'))
+    if candidates:
+        return candidates[-1]
+    raise RuntimeError(f"'{name}' not found; install PostgreSQL or set BENCH_DATABASE_URI")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def throwaway_postgres():
+    """Yield a database URI for a temporary PostgreSQL cluster, removed afterwards."""
+    uri = os.getenv('BENCH_DATABASE_URI')
+    if uri:
+        yield uri
+        return
+
+    initdb = _find_binary('initdb')
+    pg_ctl = _find_binary('pg_ctl')
+    workdir = tempfile.mkdtemp(prefix='pf-bench-pg-')
+    datadir = os.path.join(workdir, 'data')
+    port = _free_port()
+    subprocess.run([initdb, '-D', datadir, '-U', 'bench', '--auth=trust'],
+                   check=True, stdout=subprocess.DEVNULL)
+    # Durability is irrelevant for a throwaway cluster
+    options = (f'-p {port} -k {workdir} -c listen_addresses=127.0.0.1 '
+               '-c fsync=off -c synchronous_commit=off -c full_page_writes=off')
+    subprocess.run([pg_ctl, '-D', datadir, '-o', options, '-l', os.path.join(workdir, 'postgres.log'), '-w', 'start'],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f'postgresql://bench@127.0.0.1:{port}/postgres'
+    finally:
+        subprocess.run([pg_ctl, '-D', datadir, '-m', 'immediate', 'stop'], stdout=subprocess.DEVNULL)
+        shutil.rmtree(workdir, ignore_errors=True)
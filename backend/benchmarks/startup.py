@@ -0,0 +1,106 @@
+"""Measure backend cold start and fail when it regresses.
+
+Every sample is a fresh interpreter that imports the app and calls
+create_app(), the work each gunicorn master and dev server does before it can
+serve. No database is needed: create_app() doesn't connect.
+
+Run from the backend directory:
+
+    python -m benchmarks.startup --runs 7 --max-ms 1500
+    python -m benchmarks.startup --baseline bench_results/startup.json --output bench_results/startup-new.json
+
+Exits with status 1 when the median start-up time is above --max-ms or more
+than --tolerance times the baseline median, or when a module that should load
+lazily (pandas, joblib, sklearn) was imported during start-up.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Only imported by the endpoints that use them
+LAZY_MODULES = ('pandas', 'joblib', 'sklearn')
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = f'''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app()
+print(json.dumps({{
+    'create_app_s': time.perf_counter() - start,
+    'lazy_imported': [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+'''
+
+
+def sample():
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    process_s = time.perf_counter() - start
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    measured['process_s'] = process_s
+    return measured
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--max-ms', type=float, default=1500, help='fail above this median create_app time')
+    parser.add_argument('--baseline', help='earlier startup result file to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed ratio to the baseline median')
+    parser.add_argument('--output', default=None, help='JSON results file (default bench_results/startup-<timestamp>.json)')
+    args = parser.parse_args(argv)
+
+    sample()  # warm the OS file cache so the first run isn't an outlier
+    samples = [sample() for _ in range(args.runs)]
+    median_ms = statistics.median(s['create_app_s'] for s in samples) * 1000
+    lazy_imported = sorted({name for s in samples for name in s['lazy_imported']})
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'median_create_app_ms': median_ms,
+        'median_process_ms': statistics.median(s['process_s'] for s in samples) * 1000,
+        'lazy_imported': lazy_imported,
+        'samples': samples,
+    }
+    output = args.output or os.path.join('bench_results', datetime.now().strftime('startup-%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'create_app: {median_ms:.0f} ms median, whole process: {report["median_process_ms"]:.0f} ms '
+          f'({args.runs} runs); results written to {output}')
+
+    failures = []
+    if median_ms > args.max_ms:
+        failures.append(f'median {median_ms:.0f} ms is above --max-ms {args.max_ms:.0f}')
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline_ms = json.load(file)['median_create_app_ms']
+        if median_ms > baseline_ms * args.tolerance:
+            failures.append(f'median {median_ms:.0f} ms is more than {args.tolerance}x the baseline {baseline_ms:.0f} ms')
+    if lazy_imported:
+        failures.append(f'imported during start-up: {", ".join(lazy_imported)}')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import csv
+import random
+from datetime import date, timedelta
+from sqlalchemy import insert, text
+from app.models import Transaction, Label, TransactionLabel, LabelCategory
+from app.amounts import parse_amount_cents
+from app.partitions import existing_partitions, ensure_partitions
+from app.model_files import save_model
+
+# Deterministic synthetic data for the benchmarks. The same seed always
+# produces the same label tree, merchants and transactions.
+
+CSV_HEADER = ['Datum', 'Naam / Omschrijving', 'Rekening', 'Tegenrekening', 'Code',
+              'Af Bij', 'Bedrag (EUR)', 'Mutatiesoort', 'Mededelingen']
+
+MERCHANT_STEMS = ['Albert Heijn', 'AH', 'Jumbo', 'Lidl', 'Aldi', 'Shell', 'BP', 'NS Reizigers',
+                  'Bol.com', 'Coolblue', 'HEMA', 'Kruidvat', 'Etos', 'IKEA', 'Gamma', 'Praxis',
+                  'Vattenfall', 'Eneco', 'Ziggo', 'KPN', 'Zilveren Kruis', 'Hoogheemraadschap',
+                  'Gemeente Utrecht', 'Spotify', 'Netflix', 'Thuisbezorgd', 'Blokker', 'Action']
+CITIES = ['Utrecht', 'Amsterdam', 'Rotterdam', 'Den Haag', 'Eindhoven', 'Zwolle', 'Leiden']
+MUTATIESOORTEN = ['Betaalautomaat', 'iDEAL', 'Incasso', 'Overschrijving', 'Online bankieren']
+CODES = {'Betaalautomaat': 'BA', 'iDEAL': 'ID', 'Incasso': 'IC', 'Overschrijving': 'OV', 'Online bankieren': 'GT'}
+
+
+def build_label_tree(depth=3, breadth=3, labels_per_category=3):
+    """Return (categories, labels) as lists of (name, parent_name) tuples.
+
+    The tree always contains the categories the analytics endpoints look up by
+    name (INKOMSTEN, UITGAVEN, RESERVERINGSUITGAVEN); below UITGAVEN it grows
+    `breadth` children per level down to `depth` levels.
+    """
+    categories = [('INKOMSTEN', None), ('UITGAVEN', None), ('RESERVERINGSUITGAVEN', 'UITGAVEN')]
+    labels = [('Salaris', 'INKOMSTEN'), ('Reservering 1', 'RESERVERINGSUITGAVEN'),
+              ('Reservering 2', 'RESERVERINGSUITGAVEN')]
+
+    def grow(parent, level):
+        if level > depth:
+            return
+        for i in range(breadth):
+            name = f'{parent} {i + 1}' if parent != 'UITGAVEN' else f'Categorie {i + 1}'
+            categories.append((name, parent))
+            for j in range(labels_per_category):
+                labels.append((f'{name} label {j + 1}', name))
+            grow(name, level + 1)
+
+    grow('UITGAVEN', 1)
+    return categories, labels
+
+
+def build_merchants(labels, count=500, seed=42):
+    """Return a list of (company, label_name) pairs; each merchant maps to one label."""
+    rng = random.Random(seed)
+    label_names = [name for name, _ in labels]
+    merchants = []
+    for i in range(count):
+        stem = rng.choice(MERCHANT_STEMS)
+        company = f'{stem} {rng.randint(1000, 9999)} {rng.choice(CITIES)}'
+        merchants.append((company, label_names[i % len(label_names)]))
+    return merchants
+
+
+def generate_csv_rows(n, merchants, seed=42, start=date(2021, 1, 1), end=date(2024, 12, 31)):
+    """Yield `n` rows in the bank CSV layout read by `load_csv_data()`."""
+    rng = random.Random(seed)
+    span = (end - start).days
+    accounts = [f'NL{rng.randint(10, 99)}INGB000{rng.randint(1000000, 9999999)}' for _ in range(3)]
+    for i in range(n):
+        company, _ = merchants[rng.randrange(len(merchants))]
+        datum = start + timedelta(days=rng.randint(0, span))
+        mutatiesoort = rng.choice(MUTATIESOORTEN)
+        af_bij = 'Bij' if rng.random() < 0.15 else 'Af'
+        cents = rng.randint(100, 250000)
+        if mutatiesoort == 'Betaalautomaat':
+            mededelingen = (f'Pasvolgnr: 00{rng.randint(1, 9)} {datum.strftime("%d-%m-%Y")} '
+                            f'{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d} Transactie: {i:08X}')
+        else:
+            mededelingen = f'Omschrijving: {company} Kenmerk: {i:010d}'
+        yield {
+            'Datum': datum.strftime('%Y%m%d'),
+            'Naam / Omschrijving': company,
+            'Rekening': accounts[rng.randrange(len(accounts))],
+            'Tegenrekening': f'NL{rng.randint(10, 99)}RABO0{rng.randint(100000000, 999999999)}',
+            'Code': CODES[mutatiesoort],
+            'Af Bij': af_bij,
+            'Bedrag (EUR)': f'{cents // 100},{cents % 100:02d}',
+            'Mutatiesoort': mutatiesoort,
+            'Mededelingen': mededelingen,
+        }
+
+
+def csv_row_to_transaction(row):
+    """Convert a bank CSV row into `transactions` column values."""
+    return {
+        'datum': date(int(row['Datum'][:4]), int(row['Datum'][4:6]), int(row['Datum'][6:])),
+        'company': row['Naam / Omschrijving'],
+        'rekening': row['Rekening'],
+        'tegenrekening': row['Tegenrekening'],
+        'code': row['Code'],
+        'af_bij': row['Af Bij'],
+        'amount_cents': parse_amount_cents(row['Bedrag (EUR)'], row['Af Bij']),
+        'mutatiesoort': row['Mutatiesoort'],
+        'mededelingen': row['Mededelingen'],
+    }
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_HEADER)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def reset_database(session):
+    session.execute(text(
+        'TRUNCATE transaction_labels, transactions, labels, label_categories, labeling_queue, '
+        'balance_checkpoints, archived_years, archived_month_totals, archived_label_counts '
+        'RESTART IDENTITY CASCADE'
+    ))
+    session.commit()
+
+
+def load_label_tree(session, categories, labels):
+    """Insert the label tree and return a {label_name: label_id} map."""
+    category_ids = {}
+    for name, parent in categories:
+        category = LabelCategory(name=name, parent_id=category_ids.get(parent))
+        session.add(category)
+        session.flush()
+        category_ids[name] = category.id
+    label_ids = {}
+    for name, category in labels:
+        label = Label(name=name, category_id=category_ids[category])
+        session.add(label)
+        session.flush()
+        label_ids[name] = label.id
+    session.commit()
+    return label_ids
+
+
+def load_transactions(session, n, merchants, label_ids, labeled_fraction=0.6, seed=42, batch_size=10000):
+    """Bulk insert `n` synthetic transactions and label `labeled_fraction` of them."""
+    rng = random.Random(seed + 1)
+    merchant_labels = dict(merchants)
+    batch = []
+    next_id = 1
+    partitions = existing_partitions(session.connection())
+
+    def flush(batch):
+        ensure_partitions(session.connection(), {values['datum'] for values, _ in batch}, partitions)
+        session.execute(insert(Transaction), [values for values, _ in batch])
+        links = [{'transaction_id': values['id'], 'label_id': label_ids[merchant_labels[values['company']]]}
+                 for values, labeled in batch if labeled]
+        if links:
+            session.execute(insert(TransactionLabel), links)
+
+    for row in generate_csv_rows(n, merchants, seed=seed):
+        values = csv_row_to_transaction(row)
+        values['id'] = next_id
+        next_id += 1
+        batch.append((values, rng.random() < labeled_fraction))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    # Keep the id sequence in step with the explicit ids used above
+    session.execute(text("SELECT setval(pg_get_serial_sequence('transactions', 'id'), :n)"), {'n': max(n, 1)})
+    session.commit()
+    session.execute(text('ANALYZE'))
+    session.commit()
+
+
+def train_model(merchants, path):
+    """Train a small company -> label pipeline so `fetch_transactions()` can run."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    companies = [company for company, _ in merchants]
+    targets = [label for _, label in merchants]
+    model = make_pipeline(TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4)), LogisticRegression(max_iter=200))
+    model.fit(companies, targets)
+    return save_model(model, path)
@@ -0,0 +1,56 @@
+import os
+import multiprocessing
+
+# Gunicorn settings for the backend. Every setting can be overridden with an
+# environment variable so the same image works on small and large pods.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+wsgi_app = 'wsgi:app'
+
+# Concurrency: N worker processes with M threads each
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Load the app (and the model, see wsgi.py) once in the master before forking
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+# Recycle workers after N requests (with jitter so they don't all restart together)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+# Timeouts; on SIGTERM workers get graceful_timeout seconds to finish in-flight requests
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Connections opened in the master (create_tables, model preload) must not be
+    # shared with the children. Drop the inherited pool without closing the
+    # parent's sockets; the worker opens fresh connections on first use.
+    from wsgi import app
+    from logging_config import reinit_after_fork
+    for engine in {app.engine, app.replica_engine}:
+        engine.dispose(close=False)
+    # The log writer thread doesn't survive fork; start one in this worker
+    reinit_after_fork()
+    server.log.info(f"Worker {worker.pid}: database pools re-created")
+
+
+def child_exit(server, worker):
+    # Drop the metric files of dead workers when PROMETHEUS_MULTIPROC_DIR is used
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    # Close pooled connections cleanly when a worker is recycled or shut down
+    from wsgi import app
+    for engine in {app.engine, app.replica_engine}:
+        engine.dispose()
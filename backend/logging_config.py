@@ -1 +1,135 @@
+import sys
+import copy
+import json
+import queue
+import random
+import atexit
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
+# Logging for the backend: records are put on an in-process queue by the request
+# threads and formatted/written by a single listener thread, so slow log I/O never
+# blocks a request. Configured once from create_app() via setup_logging().
+
+_handler = None
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log collectors."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG/INFO records per logger name prefix.
+
+    `rates` maps a logger prefix to a keep rate, e.g. {'app.db.rows': 0.01}.
+    The longest matching prefix wins; warnings and errors are never dropped.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return rate >= 1 or random.random() < rate
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler that leaves most formatting to the listener thread.
+
+    The stock QueueHandler.prepare() runs the full formatter in the calling
+    thread. Here only `msg % args` happens there, so the record no longer refers
+    to arguments the caller may change after logging; the timestamp, level,
+    traceback and JSON layout are formatted on output.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def parse_sample_rates(value):
+    """Parse 'app.db.rows=0.01,app.routes=0.5' into a dict."""
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, rate = item.split('=', 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def _start_listener(log_queue, formatter):
+    global _listener
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(formatter)
+    _listener = QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def setup_logging(level='INFO', fmt='text', sample_rates=None):
+    """Route all logging through a queue and a background listener thread.
+
+    Safe to call more than once; later calls replace the previous configuration.
+    """
+    global _handler
+    if _listener is not None:
+        _listener.stop()
+
+    if fmt == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+
+    log_queue = queue.SimpleQueue()
+    _handler = LazyQueueHandler(log_queue)
+    _handler.addFilter(SamplingFilter(sample_rates or {}))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    _start_listener(log_queue, formatter)
+    return _handler
+
+
+def reinit_after_fork():
+    """Give a forked worker its own queue and listener thread.
+
+    Threads don't survive fork(), so without this a gunicorn worker would enqueue
+    records that nobody writes out.
+    """
+    if _handler is None:
+        return
+    formatter = _listener.handlers[0].formatter
+    # Don't stop() the inherited listener: its thread only exists in the parent
+    _handler.queue = queue.SimpleQueue()
+    _start_listener(_handler.queue, formatter)
+
+
+@atexit.register
+def _flush_on_exit():
+    if _listener is not None:
+        _listener.stop()
@@ -1,5 +1,9 @@
 from app import create_app
+from app.bootstrap import bootstrap_database
 
+# Development server only; production runs gunicorn with gunicorn.conf.py
 if __name__ == '__main__':
     app = create_app()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    with app.app_context():
+        bootstrap_database()
+    app.run(host='0.0.0.0', port=5000, debug=app.config['DEBUG'])
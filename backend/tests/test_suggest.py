@@ -0,0 +1,38 @@
+import numpy as np
+from app.suggest import LabelIndex, MIN_SIMILARITY, normalize
+
+COMPANIES = ['AH 1234 Utrecht', 'Albert Heijn 5678', 'Shell Station', 'Bol.com']
+
+
+def _index(companies):
+    index = LabelIndex()
+    for label_id, company in enumerate(companies, start=1):
+        index._add_locked(company, label_id)
+    return index
+
+
+def _best_similarity(index, company):
+    # Cosine similarity of the closest document, before the MIN_SIMILARITY gate
+    index.suggest([company])
+    key = normalize(company)
+    query = index._weighted([index._term_counts(key, grow=False)], (1, index._matrix.shape[1]),
+                            unseen=[index._unseen_counts(key)])
+    return float((query @ index._matrix.T).toarray().max(initial=0.0))
+
+
+def test_same_merchant_is_suggested():
+    index = _index(COMPANIES)
+    assert [label_id for label_id, _ in index.suggest(['AH 999 Utrecht', 'Albert Heijn'])] == [1, 2]
+
+
+def test_unseen_trigrams_count_towards_the_query():
+    index = _index(COMPANIES)
+    assert index.suggest(['Bolwerk Vastgoed Amsterdam Zuid']) == [(None, 0.0)]
+    assert _best_similarity(index, 'Bolwerk Vastgoed Amsterdam Zuid') < MIN_SIMILARITY / 2
+
+
+def test_shared_city_only_is_not_suggested():
+    index = _index(COMPANIES + ['Jumbo Utrecht Centrum', 'Kruidvat Utrecht', 'Gemeente Utrecht'])
+    assert index.suggest(['Hornbach Bouwmarkt Utrecht']) == [(None, 0.0)]
+    assert _best_similarity(index, 'Hornbach Bouwmarkt Utrecht') < MIN_SIMILARITY
+    assert np.isclose(_best_similarity(index, 'AH 999 Utrecht'), 1.0)
@@ -0,0 +1,30 @@
+import os
+import logging
+from app import create_app
+from app.db import get_model, get_transaction_store
+
+logger = logging.getLogger(__name__)
+
+# Production entry point, used by gunicorn (see gunicorn.conf.py).
+app = create_app()
+
+# Load the label model up front so that, with preload_app, it lives in the
+# master process and is shared copy-on-write by all forked workers. Its arrays
+# are memory-mapped (model_files.py), so workers without preload and replicas
+# on the node share them as well.
+if os.getenv('PRELOAD_MODEL', '1') == '1':
+    with app.app_context():
+        try:
+            get_model()
+        except Exception as e:
+            # The API still serves everything except predictions without a model
+            logger.warning("Could not preload label model: %s", e)
+
+# Same for the columnar transaction store used by the analytics endpoints
+if os.getenv('PRELOAD_STORE', '1') == '1':
+    with app.app_context():
+        try:
+            get_transaction_store()
+        except Exception as e:
+            # e.g. the database isn't reachable yet; workers load the store on first use
+            logger.warning("Could not preload columnar store: %s", e)
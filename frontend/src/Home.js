@@ -20,7 +20,6 @@ import {
 import KeyboardArrowDownIcon from '@mui/icons-material/KeyboardArrowDown';
 import KeyboardArrowUpIcon from '@mui/icons-material/KeyboardArrowUp';
 import './App.css';
-import axios from 'axios';
 
 const Home = () => {
   const [chartData, setChartData] = useState(null);
@@ -36,25 +35,19 @@ const Home = () => {
   const [vasteLastenData, setVasteLastenData] = useState([]);
   const [loading, setLoading] = useState(true);
   const [secondPieChartData, setSecondPieChartData] = useState([]);
+  const [overviewData, setOverviewData] = useState([]);
 
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const chartResponse = await fetch('api/data');
-        const chartData = await chartResponse.json();
-        setChartData(chartData);
-
-        const savingsResponse = await fetch('api/getsavings');
-        const savingsData = await savingsResponse.json();
-        setSavingsData(savingsData);
-
-        const labelsResponse = await fetch('api/getlabels');
-        const labelsData = await labelsResponse.json();
-        setLabelsData(labelsData.details);
-
-        const transactionSumsResponse = await fetch('api/transaction-sums');
-        const transactionSumsData = await transactionSumsResponse.json();
-        setTransactionSums(transactionSumsData);
+        // One request for all views on this page, computed from one snapshot
+        const dashboardResponse = await fetch('api/dashboard');
+        const dashboardData = await dashboardResponse.json();
+        setChartData(dashboardData.chart);
+        setSavingsData(dashboardData.savings);
+        setLabelsData(dashboardData.labels);
+        setTransactionSums(dashboardData.transaction_sums);
+        setOverviewData(dashboardData.overview);
 
         setLoading(false);
       } catch (error) {
@@ -129,32 +122,21 @@ const Home = () => {
   }, [labelsData, transactionSums, combinedDataLogged]);
 
   useEffect(() => {
-    const fetchSecondPieChartData = async () => {
-      try {
-        const response = await axios.get('/api/fetch-transactions-overview');
-        const data = response.data;
-
-        // Find the UITGAVEN category
-        const uitgavenCategory = data.find(category => category.name === 'UITGAVEN');
-
-        if (uitgavenCategory) {
-          // Extract the first subcategories and their transactions_total
-          const pieChartData = uitgavenCategory.subcategories.map((subcategory, index) => ({
-            id: index,
-            value: subcategory.transactions_total,
-            label: subcategory.name
-          }));
-
-          setSecondPieChartData(pieChartData);
-          console.log('Second Pie Chart Data:', pieChartData);
-        }
-      } catch (error) {
-        console.error('Error fetching transactions overview:', error);
-      }
-    };
-
-    fetchSecondPieChartData();
-  }, []);
+    // Find the UITGAVEN category
+    const uitgavenCategory = overviewData.find(category => category.name === 'UITGAVEN');
+
+    if (uitgavenCategory) {
+      // Extract the first subcategories and their transactions_total
+      const pieChartData = uitgavenCategory.subcategories.map((subcategory, index) => ({
+        id: index,
+        value: subcategory.transactions_total,
+        label: subcategory.name
+      }));
+
+      setSecondPieChartData(pieChartData);
+      console.log('Second Pie Chart Data:', pieChartData);
+    }
+  }, [overviewData]);
 
   const handleBarClick = (event, params) => {
     if (!params) return;